@@ -0,0 +1,133 @@
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Written by database/ingest/ingest_all.py after every ingest; a change invalidates cached answers
+KB_VERSION_FILE = os.getenv(
+    "KB_VERSION_FILE", str(Path(__file__).resolve().parent / "database" / "kb_version.txt")
+)
+
+
+class SemanticAnswerCache:
+    """
+    Answers keyed by query embedding. A lookup hits when a stored question has cosine
+    similarity >= threshold with the new one and was answered in the same language
+    against the same knowledge-base version. Vectors live in one preallocated matrix so
+    a lookup is a single matrix-vector product.
+    """
+
+    def __init__(self, threshold=0.95, max_items=2000, ttl=24 * 3600):
+        self.threshold = threshold
+        self.max_items = max_items
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._matrix = None  # (max_items, dim) float32, rows L2-normalised
+        self._entries = [None] * max_items  # slot -> dict(lang, kb_version, answer, created, last_used)
+        self._free = list(range(max_items - 1, -1, -1))
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "invalidations": 0}
+
+    @staticmethod
+    def _normalise(vec):
+        v = np.asarray(vec, dtype=np.float32).ravel()
+        norm = np.linalg.norm(v)
+        return v / norm if norm else v
+
+    def lookup(self, vec, lang, kb_version):
+        v = self._normalise(vec)
+        now = time.time()
+        with self._lock:
+            if self._matrix is None or len(self._free) == self.max_items:
+                self._stats["misses"] += 1
+                return None
+            sims = self._matrix @ v
+            for slot in np.argsort(-sims):
+                if sims[slot] < self.threshold:
+                    break
+                entry = self._entries[slot]
+                if entry is None or entry["lang"] != lang or entry["kb_version"] != kb_version:
+                    continue
+                if now - entry["created"] > self.ttl:
+                    self._release(slot)
+                    continue
+                entry["last_used"] = now
+                self._stats["hits"] += 1
+                return entry["answer"]
+            self._stats["misses"] += 1
+            return None
+
+    def store(self, vec, lang, kb_version, answer):
+        v = self._normalise(vec)
+        now = time.time()
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_items, v.shape[0]), dtype=np.float32)
+            if not self._free:
+                self._evict(now)
+            slot = self._free.pop()
+            self._matrix[slot] = v
+            self._entries[slot] = {
+                "lang": lang, "kb_version": kb_version, "answer": answer,
+                "created": now, "last_used": now,
+            }
+            self._stats["stores"] += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._entries = [None] * self.max_items
+            self._free = list(range(self.max_items - 1, -1, -1))
+            if self._matrix is not None:
+                self._matrix[:] = 0
+            self._stats["invalidations"] += 1
+
+    def _release(self, slot):
+        self._entries[slot] = None
+        self._matrix[slot] = 0  # zero row can never reach the similarity threshold
+        self._free.append(slot)
+
+    def _evict(self, now):
+        """Drop expired entries, or the least recently used one if nothing has expired."""
+        expired = [i for i, e in enumerate(self._entries) if e and now - e["created"] > self.ttl]
+        if not expired:
+            expired = [min(
+                (i for i, e in enumerate(self._entries) if e), key=lambda i: self._entries[i]["last_used"]
+            )]
+        for slot in expired:
+            self._release(slot)
+        self._stats["evictions"] += len(expired)
+
+    def __len__(self):
+        return self.max_items - len(self._free)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["size"] = len(self)
+        return stats
+
+
+_kb_version = {"value": None, "checked": 0.0}
+
+
+def current_kb_version(check_interval=30):
+    """KB version string written by the ingest script, re-read at most every `check_interval` seconds."""
+    now = time.time()
+    if now - _kb_version["checked"] >= check_interval:
+        try:
+            _kb_version["value"] = Path(KB_VERSION_FILE).read_text(encoding="utf-8").strip()
+        except OSError:
+            _kb_version["value"] = "unversioned"
+        _kb_version["checked"] = now
+    return _kb_version["value"]
+
+
+def bump_kb_version():
+    """Called by the ingest script once a run has finished upserting."""
+    version = str(int(time.time() * 1000))
+    Path(KB_VERSION_FILE).parent.mkdir(parents=True, exist_ok=True)
+    Path(KB_VERSION_FILE).write_text(version, encoding="utf-8")
+    return version
@@ -1,20 +1,32 @@
 import os
 import json
 import logging
-import tempfile
-from flask import Flask, request, jsonify
-import requests
+import time
+from flask import Flask, Blueprint, Response, request, jsonify
 from dotenv import load_dotenv
-from google.cloud import dialogflow_v2 as dialogflow
-from google.oauth2 import service_account
-import google.generativeai as genai
 from datetime import datetime
-from qdrant_client import QdrantClient
-from sentence_transformers import SentenceTransformer
 import ast
-from google.cloud import speech_v1p1beta1 as speech, texttospeech
-import uuid
-from translate_utils import detect_language, translate_text
+import threading
+import atexit
+from translate_utils import detect_language, translate_text, translate_template, prewarm_async, PREWARM_LANGS
+from worker_utils import WorkerPool
+from answer_cache import SemanticAnswerCache, current_kb_version
+from reminder_store import ReminderStore, ReminderDispatcher
+from dedup_store import MessageDedup
+from outbound_queue import OutboundDispatcher, OutboundQueue, PRIORITY_BROADCAST, PRIORITY_REMINDER
+import client_utils
+from tts_cache import TTSCache
+from audio_utils import opus_info, stt_sample_rate, truncate_ogg, iter_chunks
+from conversation_utils import ConversationContext, ContextStore, context_from_fulfillment
+from lazy_utils import Lazy
+from retrieval import HybridRetriever
+from context_builder import CONTEXT_CANDIDATES, build_context, instruction_prefix
+from stream_utils import SegmentSender, split_stream
+import lazy_utils
+import metrics
+
+# Heavy clients (sentence-transformers/torch, Qdrant, Dialogflow, Gemini, Speech/TTS) are
+# imported and built lazily, so importing this module and serving "/" stay cheap.
 
 # def detect_language(text):
 #     # Dummy implementation, replace with actual translation utility
@@ -26,45 +38,146 @@ from translate_utils import detect_language, translate_text
 
 # ================== CONFIG ==================
 load_dotenv()
-app = Flask(__name__)
-logging.basicConfig(level=logging.INFO)
-detected_lang = "en"  # default language
-channel = "WhatsApp"  # default channel
-chatFormat = "text"  # text or audio
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s [%(trace_id)s] %(name)s: %(message)s")
+metrics.install_log_filter()  # %(trace_id)s of the message being handled, "-" outside one
+logger = logging.getLogger("arogya_saathi")
+bp = Blueprint("bot", __name__)
 
 META_ACCESS_TOKEN = os.getenv("META_ACCESS_TOKEN")
 META_PHONE_NUMBER_ID = os.getenv("META_PHONE_NUMBER_ID")
 VERIFY_TOKEN = os.getenv("VERIFY_TOKEN")
 DIALOGFLOW_PROJECT_ID = os.getenv("DIALOGFLOW_PROJECT_ID")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-translate_credentials = service_account.Credentials.from_service_account_file(
-    os.getenv("GOOGLE_APPLICATION_CREDENTIALS_TRANSLATE")
-)
 
-QDRANT_URL = "http://localhost:6333"
+QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
 COLLECTION_NAME = "health_kb"
-client = QdrantClient(url=QDRANT_URL)
-embedder = SentenceTransformer("paraphrase-multilingual-MiniLM-L12-v2")
+META_GRAPH_URL = os.getenv("META_GRAPH_URL", "https://graph.facebook.com")  # load tests point this at a fake server
+META_API_URL = f"{META_GRAPH_URL}/v17.0/{META_PHONE_NUMBER_ID}/messages"
+BROADCAST_TOKEN = os.getenv("BROADCAST_TOKEN")  # bearer token for /broadcast and /subscribers; unset = disabled
+
+def _service_account(env_var):
+    from google.oauth2 import service_account
+    return service_account.Credentials.from_service_account_file(os.getenv(env_var))
+
+def _load_embedder():
+    from embedder_utils import load_embedder  # backend chosen by EMBEDDER_BACKEND
+    return load_embedder()
+
+def _load_qdrant():
+    from vector_store import open_vector_store  # Qdrant server, or the in-process store when VECTOR_BACKEND=local
+    return open_vector_store(url=QDRANT_URL)
+
+def _load_dialogflow():
+    from google.cloud import dialogflow_v2 as dialogflow
+    return dialogflow.SessionsClient(credentials=dialogflow_credentials.get())
+
+def _load_gemini():
+    import google.generativeai as genai
+    genai.configure(api_key=GEMINI_API_KEY)
+    return genai.GenerativeModel("gemini-2.5-flash")
+
+translate_credentials = Lazy("translate_credentials", lambda: _service_account("GOOGLE_APPLICATION_CREDENTIALS_TRANSLATE"))
+dialogflow_credentials = Lazy("dialogflow_credentials", lambda: _service_account("GOOGLE_APPLICATION_CREDENTIALS"))
+client = Lazy("qdrant", _load_qdrant)
+embedder = Lazy("embedder", _load_embedder)
+dialogflow_client = Lazy("dialogflow", _load_dialogflow)
+gemini_model = Lazy("gemini", _load_gemini)
+retriever = HybridRetriever(client, COLLECTION_NAME)  # dense + BM25, see retrieval.py
+# Components /ready waits for before the worker reports itself warm
+READY_COMPONENTS = ["embedder", "qdrant", "dialogflow", "gemini"]
+
+# Query / Reminders / ShowReminders are told apart in-process when the embedding is clearly
+# closest to one intent's Dialogflow training phrases; other messages still go to Dialogflow
+INTENT_ROUTER = os.getenv("INTENT_ROUTER", "0") == "1"
+INTENT_PHRASES = os.getenv("INTENT_PHRASES", "dialogflow_agent.zip")  # agent export or {intent: [phrases]} JSON
+LOCAL_INTENTS = ("Query", "Reminders", "ShowReminders")
+
+def _load_intent_router():
+    from intent_router import IntentRouter, load_training_phrases
+    return IntentRouter(
+        embedder.get(), load_training_phrases(INTENT_PHRASES),
+        threshold=float(os.getenv("INTENT_ROUTER_THRESHOLD", 0.5)),
+        margin=float(os.getenv("INTENT_ROUTER_MARGIN", 0.1)),
+        local_intents=LOCAL_INTENTS,
+    )
 
-dialogflow_credentials = service_account.Credentials.from_service_account_file(
-    os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+intent_router = Lazy("intent_router", _load_intent_router)
+if INTENT_ROUTER:
+    READY_COMPONENTS.append("intent_router")
+INTENT_ROUTES = metrics.Counter(
+    "intent_routes_total", "Messages by who decided the intent", ["route", "intent"]
+)  # local/<intent> | dialogflow/uncertain | dialogflow/error
+
+# Repeated questions are answered from cache instead of Qdrant + Gemini
+answer_cache = SemanticAnswerCache(
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95)),
+    max_items=int(os.getenv("ANSWER_CACHE_SIZE", 2000)),
+    ttl=float(os.getenv("ANSWER_CACHE_TTL", 24 * 3600)),
 )
-dialogflow_client = dialogflow.SessionsClient(credentials=dialogflow_credentials)
-
-META_API_URL = f"https://graph.facebook.com/v17.0/{META_PHONE_NUMBER_ID}/messages"
 
-# Configure Gemini
-genai.configure(api_key=GEMINI_API_KEY)
-gemini_model = genai.GenerativeModel("gemini-2.5-flash")
+# Reminders persist in SQLite so they survive restarts and are shared by all workers
+reminders = Lazy("reminders", lambda: ReminderStore(os.getenv("REMINDER_DB", "reminders.db")))
+
+# WhatsApp message ids already handled (or in flight), shared by all workers; Meta redelivers
+# events after slow or failed responses and each copy would otherwise be answered again
+seen_messages = Lazy("dedup", lambda: MessageDedup(
+    os.getenv("DEDUP_DB", "dedup.db"),
+    ttl=float(os.getenv("DEDUP_TTL", 24 * 3600)),
+    processing_ttl=float(os.getenv("DEDUP_PROCESSING_TTL", 600)),
+))
+# Bulk sends (broadcasts, due reminders) go through a persistent queue that is rate limited
+# per phone-number ID; conversational replies are sent directly but charged to the same bucket
+outbound = Lazy("outbound", lambda: OutboundQueue(
+    os.getenv("OUTBOUND_DB", "outbound.db"),
+    rate=float(os.getenv("OUTBOUND_RATE", 50)),  # messages per second per phone-number ID
+    burst=float(os.getenv("OUTBOUND_BURST", 0)) or None,
+    reserve=float(os.getenv("OUTBOUND_RESERVE")) if os.getenv("OUTBOUND_RESERVE") else None,
+))
+WEBHOOK_MESSAGES = metrics.Counter(
+    "webhook_messages_total", "Messages received on /webhook by outcome", ["result"]
+)  # accepted | duplicate_done | duplicate_processing | rejected
+
+# Fixed bot strings, translated once per language at startup and then served from cache
+BOT_STRINGS = [
+    "Thinking...",
+    "Setting Reminder for you...",
+    "Something went wrong, please try again later.",
+    "I had trouble answering that. Please try again.",
+]
+# The placeholders above always go out as text; only these can be sent to voice users as audio
+AUDIO_BOT_STRINGS = BOT_STRINGS[2:]
+REMINDER_TEMPLATE = "✅ Reminder set for {when}: '{task}'."
+REMINDER_DUE_TEMPLATE = "⏰ Reminder: {task}"
+
+# Synthesized replies are cached by content under static/tts (served by Flask's /static)
+tts_cache = TTSCache(
+    "static/tts",
+    max_bytes=int(os.getenv("TTS_CACHE_MAX_MB", 500)) << 20,
+    max_age=float(os.getenv("TTS_CACHE_MAX_AGE_DAYS", 30)) * 24 * 3600,
+)
+contexts = ContextStore()  # phone -> last ConversationContext, fallback for /continue
+
+# Answers to WhatsApp users are sent segment by segment while Gemini is still generating
+STREAM_ANSWERS = os.getenv("STREAM_ANSWERS", "1") == "1"
+STREAM_FIRST_CHARS = int(os.getenv("STREAM_FIRST_CHARS", 160))
+STREAM_SEGMENT_CHARS = int(os.getenv("STREAM_SEGMENT_CHARS", 700))
+STREAM_MAX_CHARS = int(os.getenv("STREAM_MAX_CHARS", 1500))
+STREAM_SEND_INTERVAL = float(os.getenv("STREAM_SEND_INTERVAL", 1.0))  # seconds between segments to one user
+ANSWER_FIRST_SEGMENT = metrics.Histogram(
+    "answer_first_segment_seconds", "Time from the start of answer generation to the first answer message sent"
+)
 
-reminders = {}  # phone -> list of reminders
+# Webhook messages are processed off the request thread so Meta gets its 200 fast
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", 4))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", 200))
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", 30))
 
 # ================== ROUTES ==================
-@app.route("/", methods=["GET"])
+@bp.route("/", methods=["GET"])
 def index():
     return "Arogya Saathi is running"
 
-@app.route("/webhook", methods=["GET"])
+@bp.route("/webhook", methods=["GET"])
 def verify():
     mode = request.args.get("hub.mode")
     token = request.args.get("hub.verify_token")
@@ -76,61 +189,122 @@ def verify():
             return "Verification token mismatch", 403
     return "OK", 200
 
-@app.route("/webhook", methods=["POST"])
+@bp.route("/webhook", methods=["POST"])
 def webhook():
-    body = request.get_json()
+    body = request.get_json(silent=True)
     if not body:
         return "No body", 400
 
     try:
+        jobs = []
         for entry in body.get("entry", []):
             for change in entry.get("changes", []):
                 value = change.get("value", {})
-                messages = value.get("messages", [])
-                contacts = value.get("contacts", [])
-                for msg in messages:
-                    phone = msg.get("from")
-                    msg_id = msg.get("id")
-                    msg_type = msg.get("type")
-
-                    global chatFormat
-
-                    text = None
-                    if msg_type == "text":
-                        chatFormat = "text"
-                        text = msg["text"].get("body")
-
-                    elif msg_type == "image":
-                        chatFormat = "text"
-                        text = msg.get("caption") or "Image received"
-
-                    elif msg_type == "audio":
-                        chatFormat = "audio"
-                        media_id = msg["audio"]["id"]
-                        audio_bytes = download_whatsapp_media(media_id)
-                        text = transcribe_audio(audio_bytes)
-
-                    else:
-                        text = f"Unsupported message type: {msg_type}"
-
-                    # Forward to Dialogflow or Gemini
-                    global channel
-                    channel = "WhatsApp"
-                    response = handle_incoming_message(phone, text)
-                    if(response == "Reminders"):
-                        send_whatsapp_text(phone, translate_text("Setting Reminder for you...", target=detected_lang), "text")
-                    elif(response == "Thinking"):
-                        send_whatsapp_text(phone, translate_text("Thinking...", target=detected_lang), "text")
-                    else:
-                        send_whatsapp_text(phone, response)
-
+                for msg in value.get("messages", []):
+                    if not msg.get("from") or not msg.get("type"):
+                        logger.warning("Skipping malformed message: %s", msg)
+                        continue
+                    jobs.append(dict(msg, trace_id=metrics.new_trace_id()))
     except Exception as e:
-        app.logger.exception("Webhook error: %s", e)
+        logger.exception("Webhook error: %s", e)
         return "Error", 500
 
+    claimed = [msg for msg in jobs if claim_message(msg)]
+    for i, msg in enumerate(claimed):
+        if not message_pool.submit(msg):
+            # Backpressure: a non-2xx makes Meta redeliver the event later, so forget
+            # the ids we are not going to process
+            for rejected in claimed[i:]:
+                release_message(rejected)
+            WEBHOOK_MESSAGES.inc("rejected", amount=len(claimed) - i)
+            return "Busy", 503
+        WEBHOOK_MESSAGES.inc("accepted")
+
     return "EVENT_RECEIVED", 200
 
 
+def claim_message(msg):
+    """False for a message id that was already handled or is being handled right now."""
+    msg_id = msg.get("id")
+    if not msg_id:
+        return True
+    try:
+        earlier = seen_messages.claim(msg_id)
+    except Exception as e:
+        logger.warning("Dedup store unavailable, processing %s anyway: %s", msg_id, e)
+        return True
+    if earlier is None:
+        return True
+    WEBHOOK_MESSAGES.inc(f"duplicate_{earlier}")
+    logger.info("Dropping redelivered message %s (%s)", msg_id, earlier)
+    return False
+
+
+def release_message(msg):
+    if msg.get("id"):
+        try:
+            seen_messages.release(msg["id"])
+        except Exception as e:
+            logger.warning("Could not release message id %s: %s", msg["id"], e)
+
+
+def finish_message(msg):
+    if msg.get("id"):
+        try:
+            seen_messages.finish(msg["id"])
+        except Exception as e:
+            logger.warning("Could not mark message %s done: %s", msg["id"], e)
+
+
+def process_message(msg):
+    """Runs on a worker thread: turn one WhatsApp message into a reply."""
+    with metrics.trace(msg.get("trace_id") or metrics.new_trace_id()) as trace_id, metrics.stage("message"):
+        logger.info("Handling %s message %s", msg.get("type"), msg.get("id"))
+        try:
+            _process_message(msg, trace_id)
+        finally:
+            finish_message(msg)
+
+
+def _process_message(msg, trace_id):
+    phone = msg.get("from")
+    msg_type = msg.get("type")
+    ctx = ConversationContext(phone=phone, channel="WhatsApp", trace_id=trace_id)
+
+    text = None
+    if msg_type == "text":
+        text = msg["text"].get("body")
+
+    elif msg_type == "image":
+        text = msg.get("caption") or "Image received"
+
+    elif msg_type == "audio":
+        ctx.chat_format = "audio"
+        media_id = msg["audio"]["id"]
+        started = time.perf_counter()
+        audio_bytes = download_whatsapp_media(media_id)
+        logger.info("Voice note download took %.3fs (%d bytes)", time.perf_counter() - started, len(audio_bytes))
+        previous = contexts.get(phone)
+        text = transcribe_audio(audio_bytes, lang_hint=previous.lang if previous else None)
+
+    else:
+        text = f"Unsupported message type: {msg_type}"
+
+    # Forward to Dialogflow or Gemini
+    response = handle_incoming_message(ctx, text)
+    if response is None:  # fulfilled locally, reply already sent
+        return
+    if(response == "Reminders"):
+        send_whatsapp_text(phone, translate_text("Setting Reminder for you...", target=ctx.lang), "text")
+    elif(response == "Thinking"):
+        send_whatsapp_text(phone, translate_text("Thinking...", target=ctx.lang), "text")
+    else:
+        send_whatsapp_text(phone, response, ctx.chat_format, ctx.lang)
+
+
+message_pool = WorkerPool(process_message, workers=WEBHOOK_WORKERS, max_queue=WEBHOOK_QUEUE_SIZE, name="webhook")
+
+
 # @app.route("/webhookSms", methods=["POST"])
 # def webhook_sms():
 #     try:
@@ -172,233 +346,511 @@ def webhook():
 #         return ("Error", 500)
 
 # ================== DIALOGFLOW ==================
-def detect_intent_text(project_id, session_id, text, language_code="en"):
+@metrics.timed("detect_intent")
+def detect_intent_text(project_id, session_id, text, language_code="en", payload=None):
+    from google.cloud import dialogflow_v2 as dialogflow
     session_client = dialogflow_client
     session = session_client.session_path(project_id, session_id)
     text_input = dialogflow.types.TextInput(text=text, language_code=language_code)
     query_input = dialogflow.types.QueryInput(text=text_input)
-    response = session_client.detect_intent(request={"session": session, "query_input": query_input})
+    req = {"session": session, "query_input": query_input}
+    if payload:
+        # Echoed back to /continue as originalDetectIntentRequest.payload
+        req["query_params"] = dialogflow.types.QueryParameters(payload=payload)
+    response = session_client.detect_intent(request=req)
     return response.query_result
 
-def handle_incoming_message(phone, text):
+def route_intent(text_en):
+    """(intent, embedding) when the local router can decide, else None; never raises."""
+    try:
+        with metrics.stage("embed"):
+            q_vec = embedder.encode(text_en)
+        with metrics.stage("route_intent"):
+            intent = intent_router.route(q_vec)
+    except Exception as e:
+        logger.warning("Intent router unavailable, using Dialogflow: %s", e)
+        INTENT_ROUTES.inc("dialogflow", "error")
+        return None
+    if intent is None:
+        INTENT_ROUTES.inc("dialogflow", "uncertain")
+        return None
+    INTENT_ROUTES.inc("local", intent)
+    return intent, q_vec
+
+def handle_incoming_message(ctx, text):
     try:
         # 1) detect language (returns language code like 'hi' or 'en')
-        global detected_lang
-        detected_lang = detect_language(text)
-        app.logger.info("Detected language: %s", detected_lang)
+        ctx.lang = detect_language(text)
+        logger.info("Detected language: %s", ctx.lang)
+        contexts.put(ctx)
 
         # 2) translate to English if needed
-        if detected_lang != "en":
+        if ctx.lang != "en":
             text_en = translate_text(text, target="en")
-            app.logger.info("Translated to English: %s", text_en)
+            logger.info("Translated to English: %s", text_en)
         else:
             text_en = text
 
-        # 3) Call Dialogflow
-        session_id = phone
-        result = detect_intent_text(DIALOGFLOW_PROJECT_ID, session_id, text_en, language_code="en")
+        # 3) Intents the local router is sure about are fulfilled right here
+        if INTENT_ROUTER:
+            routed = route_intent(text_en)
+            if routed is not None:
+                intent, q_vec = routed
+                reply_text, delivered = fulfill(intent, ctx.phone, text_en, ctx, q_vec=q_vec)
+                return None if delivered else reply_text
+
+        # 4) Call Dialogflow
+        session_id = ctx.phone
+        result = detect_intent_text(DIALOGFLOW_PROJECT_ID, session_id, text_en, language_code="en", payload=ctx.to_payload())
         intent = result.intent.display_name if result.intent else "Default Fallback Intent"
 
         # If intent has fulfillment, Dialogflow will call /continue
         if not result.intent.is_fallback and result.fulfillment_text:
             return result.fulfillment_text
         elif intent == "Reminders":
-            if chatFormat == "audio":
+            if ctx.chat_format == "audio":
                 return "Reminders"
-            return translate_text("Setting Reminder for you...", target=detected_lang)
+            return translate_text("Setting Reminder for you...", target=ctx.lang)
         else:
-            if chatFormat == "audio":
+            if ctx.chat_format == "audio":
                 return "Thinking"
-            return translate_text("Thinking...", target=detected_lang)
+            return translate_text("Thinking...", target=ctx.lang)
     except Exception as e:
-        app.logger.exception("handle_incoming_message error: %s", e)
-        return translate_text("Something went wrong, please try again later.", target=detected_lang)
+        logger.exception("handle_incoming_message error: %s", e)
+        return translate_text("Something went wrong, please try again later.", target=ctx.lang)
 
 # ================== CONTINUE (FULFILLMENT) ==================
-@app.route("/continue", methods=["POST"])
+@bp.route("/continue", methods=["POST"])
 def continue_webhook():
     req = request.get_json(force=True)
-    app.logger.info("Continue webhook payload: %s", json.dumps(req))
-
     intent = req.get("queryResult", {}).get("intent", {}).get("displayName", "Default Fallback Intent")
     session = req.get("session", "unknown")
     phone = session.split("/")[-1]  # we use phone as session id earlier
     user_text = req.get("queryResult", {}).get("queryText", "")
+    ctx = context_from_fulfillment(req, phone, contexts)
+    with metrics.trace(ctx.trace_id or metrics.new_trace_id()), metrics.stage("continue"):
+        logger.info("Continue webhook payload: %s", json.dumps(req))
+        reply_text, _ = fulfill(intent, phone, user_text, ctx)
+        return jsonify({"fulfillmentText": reply_text})
 
+def fulfill(intent, phone, user_text, ctx, q_vec=None):
+    """
+    Carry out an intent for `phone`; used by /continue (Dialogflow's fulfillment call) and
+    by locally routed messages. user_text is in English. Returns (reply_text, delivered):
+    delivered is False when the caller still has to send the reply (ShowReminders, whose
+    list Dialogflow relays as its fulfillmentText). q_vec is the embedding of user_text
+    when the caller already has it.
+    """
     reply_text = "Sorry, I could not process that."
 
-    if intent == "Query":
-        reply_text = answer_with_gemini(generate_prompt(user_text))
-        print("Gemini reply:", reply_text)
-    elif intent == "Reminders":
-        reply_text = handle_reminder(phone, user_text)
+    if intent == "Reminders":
+        reply_text = handle_reminder(phone, user_text, ctx.lang, ctx.chat_format)
     elif intent == "ShowReminders":
-        user_reminders = reminders.get(phone, [])
+        user_reminders = reminders.list_for_phone(phone)
         if user_reminders:
-            lines = [f"{i+1}. {r['task']} at {r['time']}" for i, r in enumerate(user_reminders)]
+            lines = [f"{i+1}. {r['task']} at {r['time_label']}" for i, r in enumerate(user_reminders)]
             reply_text = "Your reminders:\n" + "\n".join(lines)
         else:
             reply_text = "You have no reminders set."
-        return jsonify({"fulfillmentText": reply_text})
-    else:  # Default Fallback Intent
-        reply_text = answer_with_gemini(generate_prompt(user_text))
-        print("AI reply:", reply_text)
+        return reply_text, False
+    else:  # Query and Default Fallback Intent
+        if STREAM_ANSWERS and ctx.channel == "WhatsApp":
+            reply_text = stream_answer(phone, user_text, ctx, q_vec=q_vec)  # already delivered
+            logger.info("Gemini reply: %s", reply_text)
+            return reply_text, True
+        reply_text = answer_query(user_text, ctx.lang, q_vec=q_vec)
+        logger.info("Gemini reply: %s", reply_text)
+
+    send_whatsapp_text(phone, reply_text, ctx.chat_format, ctx.lang) if ctx.channel=="WhatsApp" else send_sms(phone, reply_text)
 
-    send_whatsapp_text(phone, reply_text) if channel=="WhatsApp" else send_sms(phone, reply_text)
+    return reply_text, True
 
-    return jsonify({"fulfillmentText": reply_text})
+# ================== BROADCASTS ==================
+def _authorized():
+    return bool(BROADCAST_TOKEN) and request.headers.get("Authorization") == f"Bearer {BROADCAST_TOKEN}"
+
+@bp.route("/broadcast", methods=["POST"])
+def broadcast():
+    """
+    Queue an alert: {"text", "topic"?, "recipients"?: [{"phone", "lang", "chat_format"}], "template"?}.
+    Without recipients it goes to the subscribers of `topic` (all subscribers when no topic).
+    """
+    if not _authorized():
+        return jsonify({"error": "forbidden"}), 403
+    body = request.get_json(force=True)
+    if not body.get("text"):
+        return jsonify({"error": "text is required"}), 400
+    broadcast_id = broadcast_alert(body["text"], body.get("topic"), body.get("recipients"), body.get("template"))
+    return jsonify(outbound.broadcast_status(broadcast_id)), 202
+
+@bp.route("/broadcast/<int:broadcast_id>", methods=["GET"])
+def broadcast_status(broadcast_id):
+    if not _authorized():
+        return jsonify({"error": "forbidden"}), 403
+    status = outbound.broadcast_status(broadcast_id)
+    return (jsonify(status), 200) if status else (jsonify({"error": "not found"}), 404)
+
+@bp.route("/subscribers", methods=["POST"])
+def subscribers():
+    """Add or update alert subscribers: {"subscribers": [{"phone", "lang", "chat_format", "topic"}]}."""
+    if not _authorized():
+        return jsonify({"error": "forbidden"}), 403
+    items = request.get_json(force=True).get("subscribers") or []
+    outbound.subscribe(items)
+    return jsonify({"subscribed": len(items)})
 
 # ================== HELPERS ==================
-def generate_prompt(question, top_k=4):
-    q_vec = embedder.encode(question).tolist()
-    hits = client.search(collection_name=COLLECTION_NAME, query_vector=q_vec, limit=top_k)
-    contexts = []
-    for h in hits:
-        txt = h.payload.get("text")
-        src = h.payload.get("source")
-        score = h.score
-        contexts.append({"text": txt, "source": src, "score": score})
-    # Build prompt for Gemini
-    prompt = "You are a professional health assistant. Use only the following documents to answer the user's question. If the answer is not in the documents, then search through official and reliable sources and reply for the answer by yourself.\n\n"
-    for i, c in enumerate(contexts):
-        prompt += f"Document {i+1} (source={c['source']}, score={c['score']}):\n{c['text']}\n\n"
-    prompt += f"Question: {question}\nAnswer concisely and clearly."
-    return prompt
-
-def answer_with_gemini(prompt: str) -> str:
-    instructions = (
-        "Instructions: Answer the question clearly and accurately. "
-        "Format the reply for WhatsApp chat: use *bold* for key terms, "
-        "simple line breaks for lists, and avoid markdown that WhatsApp does not support. "
-        "Do NOT include disclaimers, warnings, or 'important notes'. "
-        "Say that you cannot tell for medicine prescription or dosage and advise to consult a doctor if user asks about this for some illness. "
-        f"Keep the reply focused and conversational. Answer in the language whose code is '{detected_lang}'."
-    )
-    prompt = instructions + "\n\n" + prompt
-    print("Final prompt sent to Gemini:", prompt)
+def answer_query(question, lang="en", q_vec=None):
+    """Answer a knowledge-base question, reusing a cached answer for near-identical questions."""
+    if q_vec is None:
+        with metrics.stage("embed"):
+            q_vec = embedder.encode(question)
+    kb_version = current_kb_version()
+    cached = answer_cache.lookup(q_vec, lang, kb_version)
+    if cached is not None:
+        logger.info("Answer cache hit for: %s", question)
+        return cached
     try:
-        response = gemini_model.generate_content(prompt)
-        return response.text.strip()
+        reply = answer_with_gemini(generate_prompt(question, q_vec=q_vec), lang, raise_errors=True)
     except Exception as e:
-        app.logger.error("Gemini error: %s", e)
-        return translate_text("I had trouble answering that. Please try again.", target=detected_lang)
+        logger.error("Gemini error: %s", e)
+        return translate_text("I had trouble answering that. Please try again.", target=lang)
+    answer_cache.store(q_vec, lang, kb_version, reply)
+    return reply
 
-def handle_reminder(phone: str, text: str) -> str:
+def stream_answer(phone, question, ctx, q_vec=None):
+    """
+    answer_query for WhatsApp users, delivered while Gemini is still generating: the reply
+    is cut into segments that are sent in order as soon as each one is complete. Voice users
+    get the first segment as a voice note right away (synthesized while the rest generates)
+    and the remainder as a second one. Returns the full reply.
+    """
+    lang = ctx.lang
+    if q_vec is None:
+        with metrics.stage("embed"):
+            q_vec = embedder.encode(question)
+    kb_version = current_kb_version()
+    cached = answer_cache.lookup(q_vec, lang, kb_version)
+    if cached is not None:
+        logger.info("Answer cache hit for: %s", question)
+        send_whatsapp_text(phone, cached, ctx.chat_format, lang)
+        return cached
+
+    started = time.perf_counter()
+
+    def send(segment):
+        resp = send_whatsapp_text(phone, segment, ctx.chat_format, lang)
+        if resp is not None:
+            resp.raise_for_status()
+        if not sender.sent:
+            ANSWER_FIRST_SEGMENT.observe(time.perf_counter() - started)
+
+    sender = SegmentSender(send, STREAM_SEND_INTERVAL, name=f"answer-{phone}")
+    raw, segments = [], []
+
+    def collect(chunks):
+        for chunk in chunks:
+            raw.append(chunk)
+            yield chunk
+
+    try:
+        stream = collect(stream_with_gemini(generate_prompt(question, q_vec=q_vec), lang))
+        for segment in split_stream(stream, STREAM_FIRST_CHARS, STREAM_SEGMENT_CHARS, STREAM_MAX_CHARS):
+            if ctx.chat_format != "audio" or not segments:
+                sender.put(segment)
+            segments.append(segment)
+    except Exception as e:
+        logger.error("Gemini error: %s", e)
+        if not segments:
+            reply = translate_text("I had trouble answering that. Please try again.", target=lang)
+            sender.put(reply)
+            sender.close()
+            return reply
+        raw = None  # partial answer: delivered as far as it got, but not cached
+    if ctx.chat_format == "audio" and len(segments) > 1:
+        sender.put("\n".join(segments[1:]))
+    sender.close()
+    reply = "".join(raw).strip() if raw is not None else "\n".join(segments)
+    if raw is not None and reply:
+        answer_cache.store(q_vec, lang, kb_version, reply)
+    return reply
+
+def generate_prompt(question, top_k=4, q_vec=None, filters=None):
+    if q_vec is None:
+        with metrics.stage("embed"):
+            q_vec = embedder.encode(question)
+    # extra candidates with their vectors, so MMR has something to choose from
+    hits = retriever.search(question, q_vec, top_k=max(top_k, CONTEXT_CANDIDATES), filters=filters, with_vectors=True)
+    with metrics.stage("build_context"):
+        return build_context(question, hits, q_vec, top_k=top_k)
+
+def answer_with_gemini(prompt: str, lang: str = "en", raise_errors: bool = False) -> str:
+    prompt = instruction_prefix(lang) + prompt  # same prefix for every question in `lang`
+    logger.debug("Final prompt sent to Gemini: %s", prompt)
+    try:
+        with metrics.stage("gemini"):
+            response = gemini_model.generate_content(prompt)
+        return response.text.strip()
+    except Exception as e:
+        if raise_errors:
+            raise
+        logger.error("Gemini error: %s", e)
+        return translate_text("I had trouble answering that. Please try again.", target=lang)
+
+def stream_with_gemini(prompt: str, lang: str = "en"):
+    """answer_with_gemini, yielding the reply text as Gemini produces it. Errors propagate."""
+    prompt = instruction_prefix(lang) + prompt
+    logger.debug("Final prompt sent to Gemini (streamed): %s", prompt)
+    produced = False
+    with metrics.stage("gemini"):
+        for chunk in gemini_model.generate_content(prompt, stream=True):
+            try:
+                text = chunk.text
+            except ValueError:  # a chunk without text parts (e.g. only the finish reason)
+                continue
+            if text:
+                produced = True
+                yield text
+        if not produced:
+            raise ValueError("Gemini returned no text")
+
+def handle_reminder(phone: str, text: str, lang: str = "en", chat_format: str = "text") -> str:
     now = datetime.now().isoformat()
-    task, date, time = ast.literal_eval(gemini_model.generate_content(f"Today's date and time is: {now} (ISO 8601 format). Below is the task that user wants to set reminder for and provide me reponse as a tuple in the format as ('<task>', '<date>', '<time>'). The date and time should follow ISO 8601 standard: \n\n {text}").text.strip())
-    print("Parsed reminder:", task, date, time)
+    with metrics.stage("gemini_reminder"):
+        parsed = gemini_model.generate_content(f"Today's date and time is: {now} (ISO 8601 format). Below is the task that user wants to set reminder for and provide me reponse as a tuple in the format as ('<task>', '<date>', '<time>'). The date and time should follow ISO 8601 standard: \n\n {text}").text.strip()
+    task, date, time = ast.literal_eval(parsed)
+    logger.info("Parsed reminder: %s %s %s", task, date, time)
     try:
         reminder_dt = datetime.fromisoformat(f"{date}T{time+'+05:30'}")
     except Exception:
         reminder_dt = datetime.now()  # fallback
 
-    reminders.setdefault(phone, []).append({
-        "task": task,
-        "time": reminder_dt.strftime("%Y-%m-%d %H:%M")
-    })
+    reminder_id = reminders.add(
+        phone, task, reminder_dt.timestamp(), reminder_dt.strftime("%Y-%m-%d %H:%M"),
+        lang=lang, chat_format=chat_format,
+    )
+    reminder_dispatcher.notify()  # may be due sooner than what the dispatcher is sleeping on
 
-    print("Current reminders:", reminders)
+    logger.info("Stored reminder %s for %s", reminder_id, phone)
 
-    return translate_text(
-        f"✅ Reminder set for {reminder_dt.strftime('%d %b %Y, %I:%M %p')}: '{task}'.",
-        target=detected_lang
+    return translate_template(
+        REMINDER_TEMPLATE,
+        target=lang,
+        when=reminder_dt.strftime('%d %b %Y, %I:%M %p'),
+        task=translate_text(task, target=lang) if lang != "en" else task,
     )
 
+def send_reminder(reminder):
+    """Dispatcher callback: hands the reminder to the outbound queue; raising makes the dispatcher retry."""
+    lang = reminder["lang"]
+    task = translate_text(reminder["task"], target=lang) if lang != "en" else reminder["task"]
+    message = translate_template(REMINDER_DUE_TEMPLATE, target=lang, task=task)
+    payload = whatsapp_payload(reminder["phone"], message, reminder["chat_format"], lang)
+    outbound.enqueue(META_PHONE_NUMBER_ID, reminder["phone"], payload, PRIORITY_REMINDER)
+    outbound_dispatcher.notify()
+
+def broadcast_alert(text, topic=None, recipients=None, template=None):
+    """
+    Queue `text` for every recipient ({"phone", "lang", "chat_format"}), or for the subscribers
+    of `topic` when no list is given. Translation and TTS run once per language and format,
+    not once per user. `template` names an approved WhatsApp template with one body
+    parameter, needed for users outside the 24-hour window. Returns the broadcast id.
+    """
+    broadcast_id = outbound.create_broadcast(text, topic)
+    if recipients is None:
+        recipients = outbound.subscribers(topic)
+    else:
+        recipients = ((r["phone"], r.get("lang", "en"), r.get("chat_format", "text")) for r in recipients)
+    bodies = {}  # (lang, chat_format) -> payload without "to"
+    batch, total = [], 0
+    for phone, lang, chat_format in recipients:
+        key = (lang, "text" if template else chat_format)
+        if key not in bodies:
+            message = translate_text(text, target=lang) if lang != "en" else text
+            if template:
+                bodies[key] = {
+                    "messaging_product": "whatsapp", "type": "template",
+                    "template": {"name": template, "language": {"code": lang},
+                                 "components": [{"type": "body", "parameters": [{"type": "text", "text": message}]}]},
+                }
+            else:
+                bodies[key] = whatsapp_payload(None, message, chat_format, lang)
+        batch.append((META_PHONE_NUMBER_ID, phone, {**bodies[key], "to": phone}))
+        if len(batch) >= 5000:
+            total += outbound.enqueue_many(batch, PRIORITY_BROADCAST, broadcast_id)
+            batch = []
+    total += outbound.enqueue_many(batch, PRIORITY_BROADCAST, broadcast_id)
+    outbound.set_recipients(broadcast_id, total)
+    outbound_dispatcher.notify()
+    logger.info("Broadcast %s queued for %d recipients in %d language/format variants", broadcast_id, total, len(bodies))
+    return broadcast_id
+
+def post_whatsapp(phone_number_id, payload):
+    """Outbound dispatcher callback: one attempt, the queue does the retrying."""
+    return client_utils.post(
+        f"{META_GRAPH_URL}/v17.0/{phone_number_id}/messages", params={"access_token": META_ACCESS_TOKEN},
+        json=payload, endpoint="meta.messages", max_retries=0,
+    )
+
+outbound_dispatcher = OutboundDispatcher(
+    outbound,
+    post_whatsapp,
+    senders=int(os.getenv("OUTBOUND_SENDERS", 8)),
+    batch_size=int(os.getenv("OUTBOUND_BATCH_SIZE", 100)),
+)
+
+reminder_dispatcher = ReminderDispatcher(
+    reminders,
+    send_reminder,
+    batch_size=int(os.getenv("REMINDER_BATCH_SIZE", 100)),
+    poll_interval=float(os.getenv("REMINDER_POLL_INTERVAL", 30)),
+)
+
+@metrics.timed("media_download")
 def download_whatsapp_media(media_id: str) -> bytes:
     """Download media from WhatsApp using media_id."""
     # Step 1: Get media URL
-    url = f"https://graph.facebook.com/v20.0/{media_id}"
+    url = f"{META_GRAPH_URL}/v20.0/{media_id}"
     headers = {"Authorization": f"Bearer {META_ACCESS_TOKEN}"}
-    resp = requests.get(url, headers=headers)
+    resp = client_utils.get(url, headers=headers, endpoint="meta.media_url")
     resp.raise_for_status()
     media_url = resp.json().get("url")
 
     # Step 2: Download actual file
-    resp = requests.get(media_url, headers=headers)
+    resp = client_utils.get(media_url, headers=headers, endpoint="meta.media_download")
     resp.raise_for_status()
     return resp.content
 
-def transcribe_audio(audio_bytes: bytes) -> str:
-    """Convert audio bytes to text using Google Speech-to-Text."""
-    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp:
-        tmp.write(audio_bytes)   # audio_bytes = from WhatsApp
-        tmp_path = tmp.name
-    # Load audio file (must be wav/mp3/m4a/webm)
-    audio_file = genai.upload_file(tmp_path)
-
-    prompt = """
-    You are a transcription helper. I have provided you an audio file.
-    1. Detect speaker language from these codes ['en', 'hi', 'bn'].
-    2. Respond with only the code of the detected language.
-    """
-
-    code = gemini_model.generate_content([prompt, audio_file]).text.strip()
-    print("Detected language code from audio:", code)
+# Languages Speech-to-Text may pick from in one call (primary + at most 3 alternatives)
+STT_LANGUAGES = [l for l in os.getenv("STT_LANGUAGES", "hi-IN,en-IN,bn-IN,ta-IN").split(",") if l]
+STT_MAX_AUDIO_SECONDS = float(os.getenv("STT_MAX_AUDIO_SECONDS", 120))
+STT_SYNC_LIMIT_SECONDS = 55  # recognize() rejects audio over ~60s; longer notes are streamed
 
-    client = speech.SpeechClient(credentials=translate_credentials)
-
-    audio = speech.RecognitionAudio(content=audio_bytes)
-    config = speech.RecognitionConfig(
-        encoding=speech.RecognitionConfig.AudioEncoding.OGG_OPUS,  # WhatsApp voice notes are usually OGG/Opus
-        sample_rate_hertz=16000,
-        language_code=code+"-IN",  # 👈 change based on user’s language
-        alternative_language_codes=["hi-IN", "en-IN", "bn-IN", "ta-IN"]  # add languages you expect
+@metrics.timed("transcribe_audio")
+def transcribe_audio(audio_bytes: bytes, lang_hint: str = None) -> str:
+    """
+    Convert an Ogg/Opus voice note to text with a single Speech-to-Text call, entirely in
+    memory. The language is identified by STT itself from STT_LANGUAGES, with the caller's
+    last known language as the primary guess. Notes longer than STT_MAX_AUDIO_SECONDS are cut.
+    """
+    from google.cloud import speech_v1p1beta1 as speech
+    timings = {}
+    started = time.perf_counter()
+    duration, input_rate = opus_info(audio_bytes)
+    if duration is not None and duration > STT_MAX_AUDIO_SECONDS:
+        logger.info("Voice note is %.0fs, transcribing the first %.0fs", duration, STT_MAX_AUDIO_SECONDS)
+        audio_bytes = truncate_ogg(audio_bytes, STT_MAX_AUDIO_SECONDS)
+        duration = STT_MAX_AUDIO_SECONDS
+    timings["inspect"] = time.perf_counter() - started
+
+    client = client_utils.get_speech_client(translate_credentials.get())
+
+    def recognize(primary):
+        config = speech.RecognitionConfig(
+            encoding=speech.RecognitionConfig.AudioEncoding.OGG_OPUS,  # WhatsApp voice notes are usually OGG/Opus
+            sample_rate_hertz=stt_sample_rate(input_rate),
+            language_code=primary,
+            alternative_language_codes=[l for l in STT_LANGUAGES if l != primary][:3],
+        )
+        with client_utils.track("gcp.speech"):
+            if duration is not None and duration > STT_SYNC_LIMIT_SECONDS:
+                requests_iter = (speech.StreamingRecognizeRequest(audio_content=c) for c in iter_chunks(audio_bytes))
+                streaming_config = speech.StreamingRecognitionConfig(config=config, interim_results=False)
+                return [
+                    r for response in client.streaming_recognize(streaming_config, requests_iter)
+                    for r in response.results if r.is_final
+                ]
+            response = client.recognize(config=config, audio=speech.RecognitionAudio(content=audio_bytes))
+            return list(response.results)
+
+    # the hint comes from the conversation context (any translate code); only use it if STT is configured for it
+    primary = f"{lang_hint}-IN" if lang_hint and f"{lang_hint}-IN" in STT_LANGUAGES else STT_LANGUAGES[0]
+    started = time.perf_counter()
+    try:
+        results = recognize(primary)
+    except Exception as e:
+        if primary == STT_LANGUAGES[0]:
+            raise
+        logger.warning("Speech-to-Text with %s failed (%s), retrying with %s", primary, e, STT_LANGUAGES[0])
+        primary = STT_LANGUAGES[0]
+        results = recognize(primary)
+    timings["stt"] = time.perf_counter() - started
+
+    transcript = " ".join([r.alternatives[0].transcript for r in results if r.alternatives])
+    language = results[0].language_code if results else primary
+    logger.info(
+        "Transcribed %.1fs voice note (%s): %s | timings %s",
+        duration or 0, language, transcript, {k: round(v, 3) for k, v in timings.items()},
     )
-
-    response = client.recognize(config=config, audio=audio)
-    transcript = " ".join([r.alternatives[0].transcript for r in response.results])
-    print("Transcription result:", transcript)
     return transcript or "Could not transcribe audio."
 
-def synthesize_speech(text):
-    client = texttospeech.TextToSpeechClient(credentials=translate_credentials)
-    synthesis_input = texttospeech.SynthesisInput(text=text)
+def synthesize_speech(text, lang="en"):
+    language_code = lang+"-IN"  # change based on detected language
+    key = tts_cache.key(text, language_code=language_code, gender="NEUTRAL", encoding="MP3")
 
-    voice = texttospeech.VoiceSelectionParams(
-        language_code=detected_lang+"-IN",  # change based on detected language
-        ssml_gender=texttospeech.SsmlVoiceGender.NEUTRAL
-    )
+    def synthesize():
+        from google.cloud import texttospeech
+        client = client_utils.get_tts_client(translate_credentials.get())
+        synthesis_input = texttospeech.SynthesisInput(text=text)
 
-    audio_config = texttospeech.AudioConfig(
-        audio_encoding=texttospeech.AudioEncoding.MP3
-    )
+        voice = texttospeech.VoiceSelectionParams(
+            language_code=language_code,
+            ssml_gender=texttospeech.SsmlVoiceGender.NEUTRAL
+        )
 
-    response = client.synthesize_speech(
-        input=synthesis_input, voice=voice, audio_config=audio_config
-    )
-    filename = f"static/{uuid.uuid4().hex}.mp3"
-    with open(filename, "wb") as f:
-        f.write(response.audio_content)
+        audio_config = texttospeech.AudioConfig(
+            audio_encoding=texttospeech.AudioEncoding.MP3
+        )
+
+        with client_utils.track("gcp.tts"), metrics.stage("tts"):
+            response = client.synthesize_speech(
+                input=synthesis_input, voice=voice, audio_config=audio_config
+            )
+        return response.audio_content
+
+    filename = tts_cache.get_or_create(key, synthesize).replace(os.sep, "/")
 
     # return a public URL (assuming you serve /static via Flask)
     return f"{os.getenv('SERVER_DOMAIN')}/{filename}"
 
-
-def send_whatsapp_text(to_phone, message_text, format=None):
-    finalFormat = chatFormat if format is None else format
-    if finalFormat == "audio":
-        audio_url = synthesize_speech(message_text)
-        headers = {"Content-Type": "application/json"}
-        payload = {
+def presynthesize(strings, langs):
+    """Fill the TTS cache with the fixed phrases voice users can get as audio, so they never wait on them."""
+    for lang in langs:
+        for s in strings:
+            try:
+                synthesize_speech(translate_text(s, target=lang) if lang != "en" else s, lang)
+            except Exception as e:
+                logger.warning("Presynthesis failed for %s/%r: %s", lang, s, e)
+
+
+def whatsapp_payload(to_phone, message_text, format="text", lang="en"):
+    """Graph API message body; voice-note replies are synthesized (or taken from the TTS cache) here."""
+    if format == "audio":
+        audio_url = synthesize_speech(message_text, lang)
+        return {
             "messaging_product": "whatsapp",
             "to": to_phone,
             "type": "audio",
             "audio": {"link": audio_url}
         }
-        params = {"access_token": META_ACCESS_TOKEN}
-        requests.post(META_API_URL, params=params, headers=headers, json=payload)
-    else:
-        headers = {"Content-Type": "application/json"}
-        payload = {
-            "messaging_product": "whatsapp",
-            "to": to_phone,
-            "type": "text",
-            "text": {"body": message_text}
-        }
-        params = {"access_token": META_ACCESS_TOKEN}
-        resp = requests.post(META_API_URL, params=params, headers=headers, json=payload)
-        return resp
-        
+    return {
+        "messaging_product": "whatsapp",
+        "to": to_phone,
+        "type": "text",
+        "text": {"body": message_text}
+    }
+
+@metrics.timed("send_whatsapp")
+def send_whatsapp_text(to_phone, message_text, format="text", lang="en"):
+    payload = whatsapp_payload(to_phone, message_text, format, lang)
+    try:
+        outbound.take_interactive(META_PHONE_NUMBER_ID)  # bulk sends back off to leave room for this
+    except Exception as e:
+        logger.warning("Could not charge the outbound rate limit: %s", e)
+    headers = {"Content-Type": "application/json"}
+    params = {"access_token": META_ACCESS_TOKEN}
+    return client_utils.post(META_API_URL, params=params, headers=headers, json=payload, endpoint="meta.messages")
+
 
 def send_sms(to_phone, message_text):
     try:
@@ -411,10 +863,103 @@ def send_sms(to_phone, message_text):
         # app.logger.info("Sent SMS to %s sid=%s", to_phone, resp.sid)
         # return resp
     except Exception as e:
-        app.logger.exception("Error sending SMS: %s", e)
+        logger.exception("Error sending SMS: %s", e)
         return None
 
+# ================== APP FACTORY ==================
+_services_pid = None
+_services_lock = threading.Lock()
+
+def start_background_services():
+    """
+    Start this process's worker threads and warm-up. Runs once per process and must run
+    after gunicorn forks (threads do not survive fork), so it is called from the
+    gunicorn post_worker_init hook, on the first request, or from __main__.
+    """
+    global _services_pid
+    if _services_pid == os.getpid():
+        return
+    with _services_lock:
+        if _services_pid == os.getpid():
+            return
+        _services_pid = os.getpid()
+    message_pool.start()
+    atexit.register(message_pool.shutdown, WEBHOOK_DRAIN_TIMEOUT)
+    if os.getenv("REMINDER_DISPATCHER", "1") == "1":
+        reminder_dispatcher.start()
+        atexit.register(reminder_dispatcher.stop)
+    if os.getenv("OUTBOUND_DISPATCHER", "1") == "1":
+        outbound_dispatcher.start()
+        atexit.register(outbound_dispatcher.stop)
+    prewarm_async(BOT_STRINGS, templates=[REMINDER_TEMPLATE, REMINDER_DUE_TEMPLATE])
+    if os.getenv("TTS_PREWARM", "1") == "1":
+        threading.Thread(
+            target=presynthesize, args=(AUDIO_BOT_STRINGS, ["en"] + PREWARM_LANGS), name="tts-prewarm", daemon=True
+        ).start()
+    if os.getenv("WARM_ON_START", "1") == "1":
+        lazy_utils.warm_async(READY_COMPONENTS)
+
+# ================== METRICS ==================
+metrics.Callback("webhook_queue_depth", "Messages waiting for a webhook worker", "gauge", message_pool.qsize)
+metrics.Callback(
+    "reminders_pending", "Reminders not yet delivered", "gauge",
+    lambda: reminders.pending_count() if reminders.ready else None,
+)
+metrics.Callback(
+    "outbound_pending", "Queued WhatsApp messages not yet delivered, by priority", "gauge",
+    lambda: {(k,): v for k, v in outbound.pending_counts().items()} if outbound.ready else None, ["priority"],
+)
+metrics.Callback("answer_cache_items", "Answers held in the semantic answer cache", "gauge", lambda: len(answer_cache))
+metrics.Callback(
+    "answer_cache_lookups_total", "Semantic answer cache lookups by result", "counter",
+    lambda: {("hit",): answer_cache.stats()["hits"], ("miss",): answer_cache.stats()["misses"]}, ["result"],
+)
+metrics.Callback(
+    "tts_cache_lookups_total", "Synthesized speech cache lookups by result", "counter",
+    lambda: {("hit",): tts_cache.stats()["hits"], ("miss",): tts_cache.stats()["misses"]}, ["result"],
+)
+metrics.Callback(
+    "dedup_tracked_ids", "Message ids inside the dedup window (all workers)", "gauge",
+    lambda: seen_messages.stats()["tracked"] if seen_messages.ready else None,
+)
+metrics.Callback("contexts_items", "Phones with a remembered conversation context", "gauge", lambda: len(contexts))
+metrics.Callback(
+    "component_ready", "1 once a lazily loaded component is built in this worker", "gauge",
+    lambda: {(name,): int(s["ready"]) for name, s in lazy_utils.status(READY_COMPONENTS).items()}, ["component"],
+)
+
+@bp.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Prometheus scrape endpoint; see metrics.py."""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@bp.route("/ready", methods=["GET"])
+def ready():
+    """Readiness probe: 200 once the heavy components are loaded in this worker."""
+    components = lazy_utils.status(READY_COMPONENTS)
+    is_ready = all(c["ready"] for c in components.values())
+    return jsonify({"ready": is_ready, "pid": os.getpid(), "components": components}), (200 if is_ready else 503)
+
+def create_app():
+    """
+    Build the Flask app. Cheap unless PRELOAD_MODELS=1, which loads the embedding model
+    right here; under `gunicorn --preload` that happens once in the master, and forked
+    workers share the model's memory copy-on-write. Network clients (gRPC, Qdrant) are
+    never created here because they are not fork-safe.
+    """
+    flask_app = Flask(__name__)
+    flask_app.register_blueprint(bp)
+    flask_app.before_request(start_background_services)
+    if os.getenv("PRELOAD_MODELS") == "1":
+        embedder.get()
+    return flask_app
+
+app = create_app()
+
 # ================== MAIN ==================
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 5000))
+    # With the debug reloader only the child process (WERKZEUG_RUN_MAIN) serves requests
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_background_services()
     app.run(host="0.0.0.0", port=port, debug=True)
@@ -0,0 +1,71 @@
+"""
+Minimal in-memory Ogg/Opus inspection for WhatsApp voice notes: duration, input sample
+rate and truncation at a page boundary, without decoding or touching the disk.
+"""
+import struct
+
+OPUS_GRANULE_RATE = 48000  # Opus granule positions always count 48 kHz samples
+STT_OPUS_RATES = (8000, 12000, 16000, 24000, 48000)  # rates Speech-to-Text accepts for OGG_OPUS
+
+
+def ogg_pages(data):
+    """Yield (offset, end, granule_position, payload) for every Ogg page in `data`."""
+    pos = 0
+    n = len(data)
+    while pos + 27 <= n:
+        if data[pos:pos + 4] != b"OggS":
+            nxt = data.find(b"OggS", pos + 1)
+            if nxt < 0:
+                return
+            pos = nxt
+            continue
+        granule = struct.unpack_from("<q", data, pos + 6)[0]
+        segments = data[pos + 26]
+        table_end = pos + 27 + segments
+        if table_end > n:
+            return
+        end = table_end + sum(data[pos + 27:table_end])
+        if end > n:
+            return
+        yield pos, end, granule, data[table_end:end]
+        pos = end
+
+
+def opus_info(data):
+    """
+    Returns (duration_seconds, input_sample_rate) for an Ogg/Opus stream, or (None, None)
+    when the bytes are not Ogg/Opus.
+    """
+    pre_skip = 0
+    sample_rate = None
+    last_granule = None
+    for _, _, granule, payload in ogg_pages(data):
+        if payload.startswith(b"OpusHead") and len(payload) >= 16:
+            pre_skip = struct.unpack_from("<H", payload, 10)[0]
+            sample_rate = struct.unpack_from("<I", payload, 12)[0]
+        if granule >= 0:
+            last_granule = granule
+    if sample_rate is None or last_granule is None:
+        return None, None
+    return max(0, last_granule - pre_skip) / OPUS_GRANULE_RATE, sample_rate
+
+
+def stt_sample_rate(input_rate):
+    """Closest rate Speech-to-Text accepts for OGG_OPUS (it rejects e.g. 44100)."""
+    if input_rate in STT_OPUS_RATES:
+        return input_rate
+    return min(STT_OPUS_RATES, key=lambda r: abs(r - (input_rate or 16000)))
+
+
+def truncate_ogg(data, max_seconds):
+    """Cut the stream after the first page that reaches `max_seconds`; the result stays a valid Ogg stream."""
+    limit = max_seconds * OPUS_GRANULE_RATE
+    for _, end, granule, _ in ogg_pages(data):
+        if granule >= limit:
+            return data[:end]
+    return data
+
+
+def iter_chunks(data, size=32 * 1024):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
@@ -0,0 +1,100 @@
+"""
+Word-window chunking (400 words / 50 overlap, the old ingest) against sentence chunks
+sized with the embedder's tokenizer, on a folder of source documents. Reports chunk
+counts, how many tokens each scheme loses to the model's 128-token truncation, and
+recall@k / MRR of brute-force cosine search over each chunk set for the queries in
+retrieval_queries.json (a hit contains one of the query's `must_contain` terms).
+
+    python benchmarks/bench_chunking.py --docs database/data --k 4 --out chunking.json
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "database" / "ingest"))
+
+from embedder_utils import load_embedder
+from extractors import SUPPORTED_SUFFIXES, iter_text_from_file, token_counter
+from utils import CHUNK_MAX_TOKENS, SPECIAL_TOKENS, chunk_sentences, chunk_stream
+
+QUERIES = Path(__file__).with_name("retrieval_queries.json")
+
+
+def chunk_all(paths, scheme, count):
+    chunks = []
+    started = time.perf_counter()
+    for p in paths:
+        pieces = iter_text_from_file(p)
+        if scheme == "words":
+            chunks.extend(chunk_stream(pieces, chunk_size=400, overlap=50))
+        else:
+            chunks.extend(chunk_sentences(pieces, count))
+    return chunks, time.perf_counter() - started
+
+
+def truncation(chunks, count, limit=CHUNK_MAX_TOKENS):
+    lengths = [count(c) + SPECIAL_TOKENS for c in chunks]
+    total = sum(lengths)
+    lost = sum(max(0, n - limit) for n in lengths)
+    return {
+        "tokens_p50": statistics.median(lengths) if lengths else 0,
+        "tokens_max": max(lengths, default=0),
+        "chunks_truncated_pct": 100.0 * sum(n > limit for n in lengths) / max(1, len(lengths)),
+        "tokens_lost_pct": 100.0 * lost / max(1, total),
+    }
+
+
+def evaluate(chunks, vectors, embedder, queries, k):
+    recalls, reciprocal_ranks = [], []
+    for q in queries:
+        q_vec = embedder.encode(q["query"], normalize_embeddings=True)
+        top = np.argsort(-(vectors @ q_vec))[:k]
+        terms = q["must_contain"]
+        ranks = [i for i, idx in enumerate(top) if any(t in chunks[idx].lower() for t in terms)]
+        recalls.append(1.0 if ranks else 0.0)
+        reciprocal_ranks.append(1.0 / (ranks[0] + 1) if ranks else 0.0)
+    return {f"recall@{k}": statistics.mean(recalls), "mrr": statistics.mean(reciprocal_ranks)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", required=True, help="folder of .txt/.pdf/.docx/.csv files")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    paths = sorted(p for p in Path(args.docs).rglob("*") if p.suffix.lower() in SUPPORTED_SUFFIXES)
+    count = token_counter()
+    embedder = load_embedder()
+    queries = json.loads(QUERIES.read_text(encoding="utf-8"))
+
+    results = {}
+    for scheme in ("words", "sentences"):
+        chunks, seconds = chunk_all(paths, scheme, count)
+        started = time.perf_counter()
+        vectors = np.asarray(embedder.encode(chunks, batch_size=64, normalize_embeddings=True), dtype=np.float32)
+        results[scheme] = {
+            "chunks": len(chunks),
+            "chunk_seconds": seconds,
+            "embed_seconds": time.perf_counter() - started,
+            **truncation(chunks, count),
+            **evaluate(chunks, vectors, embedder, queries, args.k),
+        }
+        m = results[scheme]
+        print(f"{scheme:<10} {m['chunks']:>6} chunks  truncated {m['chunks_truncated_pct']:5.1f}%  "
+              f"tokens lost {m['tokens_lost_pct']:5.1f}%  recall@{args.k} {m[f'recall@{args.k}']:.2f}  "
+              f"MRR {m['mrr']:.2f}  embed {m['embed_seconds']:.1f} s")
+    if args.out:
+        Path(args.out).write_text(json.dumps(
+            {"docs": len(paths), "k": args.k, "queries": len(queries), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
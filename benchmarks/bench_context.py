@@ -0,0 +1,159 @@
+"""
+Gemini prompt size before and after context_builder: the old prompt pasted all top_k
+hits in full with their scores; the new one is MMR-selected, merged and token-budgeted.
+Reports characters, estimated tokens and build time per prompt, and with --gemini the
+generate_content latency of both prompts (needs GEMINI_API_KEY).
+
+    python benchmarks/bench_context.py --k 4 --out context.json             # live health_kb
+    python benchmarks/bench_context.py --synthetic 2000 --k 4                # offline corpus
+
+--synthetic builds a scratch local vector store of overlapping chunks and near-duplicate
+CoWIN centre entries, embedded with the load test's hashed bag-of-words embedder.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from context_builder import CONTEXT_CANDIDATES, build_context, estimate_tokens, instruction_prefix
+from retrieval import HybridRetriever
+
+QUERIES = Path(__file__).with_name("retrieval_queries.json")
+COLLECTION = "health_kb"
+
+LEGACY_INSTRUCTIONS = (
+    "Instructions: Answer the question clearly and accurately. "
+    "Format the reply for WhatsApp chat: use *bold* for key terms, "
+    "simple line breaks for lists, and avoid markdown that WhatsApp does not support. "
+    "Do NOT include disclaimers, warnings, or 'important notes'. "
+    "Say that you cannot tell for medicine prescription or dosage and advise to consult a doctor if user asks about this for some illness. "
+    "Keep the reply focused and conversational. Answer in the language whose code is '{lang}'."
+)
+
+
+def legacy_prompt(question, contexts, lang="en"):
+    """generate_prompt + answer_with_gemini before context_builder."""
+    prompt = "You are a professional health assistant. Use only the following documents to answer the user's question. If the answer is not in the documents, then search through official and reliable sources and reply for the answer by yourself.\n\n"
+    for i, c in enumerate(contexts):
+        prompt += f"Document {i+1} (source={c['source']}, score={c['score']}):\n{c['text']}\n\n"
+    prompt += f"Question: {question}\nAnswer concisely and clearly."
+    return LEGACY_INSTRUCTIONS.format(lang=lang) + "\n\n" + prompt
+
+
+def synthetic_store(n_chunks, path, embedder):
+    """Documents chunked with 24-word overlap, plus CoWIN entries repeated per date."""
+    from vector_store import LocalVectorStore
+    rng = random.Random(7)
+    topics = [q["query"].lower().rstrip("?") + " " + " ".join(q["must_contain"])
+              for q in json.loads(QUERIES.read_text(encoding="utf-8"))]
+    filler = "patients should rest drink fluids visit the health centre and follow the doctor's advice".split()
+    records = []
+    doc = 0
+    while len(records) < n_chunks:
+        topic = topics[doc % len(topics)].split()
+        if doc % 5 == 4:  # CoWIN: the same centre listed for several dates
+            for date in range(6):
+                text = (f"Centre PHC {doc} block {doc % 17}: {' '.join(topic)} available on {date + 10}-09-2025, "
+                        f"fee free, age 18 and above.")
+                records.append((text, {"source": "cowin", "doc_id": f"cowin_{doc}_{date}", "chunk_id": 0}))
+        else:
+            words = [rng.choice(topic + filler) for _ in range(400)]
+            start, ci = 0, 0
+            while start < len(words):
+                text = " ".join(words[start:start + 100]) + "."
+                records.append((text, {"source": "docs", "doc_id": f"doc{doc}.txt", "chunk_id": ci}))
+                start += 76
+                ci += 1
+        doc += 1
+    vectors = embedder.encode([t for t, _ in records], batch_size=64)
+    store = LocalVectorStore(path)
+    store.create_collection(COLLECTION, SimpleNamespace(size=len(vectors[0]), distance="Cosine"))
+    points = [{"id": f"00000000-0000-0000-0000-{i:012d}", "vector": v.tolist(), "payload": {"text": t, **p}}
+              for i, ((t, p), v) in enumerate(zip(records, vectors))]
+    for start in range(0, len(points), 512):
+        store.upsert(COLLECTION, points[start:start + 512])
+    return store
+
+
+def summarize(values):
+    values = sorted(values)
+    return {"mean": statistics.mean(values), "p50": statistics.median(values), "max": values[-1]}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--lang", default="en")
+    parser.add_argument("--qdrant-url", default="http://localhost:6333")
+    parser.add_argument("--synthetic", type=int, metavar="CHUNKS", help="use a scratch corpus of this many chunks")
+    parser.add_argument("--gemini", action="store_true", help="also time generate_content on both prompts")
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        from fake_services import EMBED_DIM, Fault, FakeEmbedder, Recorder
+        embedder = FakeEmbedder(Recorder(), Fault(), EMBED_DIM)
+        client = synthetic_store(args.synthetic, tempfile.mkdtemp(prefix="bench_context_"), embedder)
+        retriever = HybridRetriever(client, COLLECTION, rerank_model=None, hybrid=False)
+    else:
+        from embedder_utils import load_embedder
+        from vector_store import open_vector_store
+        embedder = load_embedder()
+        client = open_vector_store(url=args.qdrant_url)
+        retriever = HybridRetriever(client, COLLECTION, rerank_model=None)
+    model = None
+    if args.gemini:
+        import google.generativeai as genai
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        model = genai.GenerativeModel("gemini-2.5-flash")
+
+    queries = json.loads(QUERIES.read_text(encoding="utf-8"))
+    rows = {"before": {"chars": [], "tokens": [], "build_ms": [], "gemini_ms": []},
+            "after": {"chars": [], "tokens": [], "build_ms": [], "gemini_ms": []}}
+    for q in queries:
+        question = q["query"]
+        q_vec = embedder.encode(question)
+
+        started = time.perf_counter()
+        hits = retriever.search(question, q_vec, top_k=args.k)
+        before = legacy_prompt(question, hits, args.lang)
+        before_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        hits = retriever.search(question, q_vec, top_k=max(args.k, CONTEXT_CANDIDATES), with_vectors=True)
+        after = instruction_prefix(args.lang) + build_context(question, hits, q_vec, top_k=args.k)
+        after_ms = (time.perf_counter() - started) * 1000
+
+        for name, prompt, ms in (("before", before, before_ms), ("after", after, after_ms)):
+            rows[name]["chars"].append(len(prompt))
+            rows[name]["tokens"].append(estimate_tokens(prompt))
+            rows[name]["build_ms"].append(ms)
+            if model is not None:
+                started = time.perf_counter()
+                model.generate_content(prompt)
+                rows[name]["gemini_ms"].append((time.perf_counter() - started) * 1000)
+
+    results = {name: {key: summarize(vals) for key, vals in r.items() if vals} for name, r in rows.items()}
+    for name, r in results.items():
+        line = (f"{name:<7} chars {r['chars']['mean']:7.0f}  ~tokens {r['tokens']['mean']:6.0f} "
+                f"(max {r['tokens']['max']:.0f})  build p50 {r['build_ms']['p50']:.1f} ms")
+        if "gemini_ms" in r:
+            line += f"  gemini p50 {r['gemini_ms']['p50']:.0f} ms"
+        print(line)
+    saved = 1 - results["after"]["tokens"]["mean"] / results["before"]["tokens"]["mean"]
+    print(f"prompt tokens saved: {saved:.0%}")
+    if args.out:
+        Path(args.out).write_text(json.dumps({"k": args.k, "queries": len(queries), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
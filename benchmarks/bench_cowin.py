@@ -0,0 +1,89 @@
+"""
+CoWIN refresh (database/ingest/cowin.py) against the fake calendarByDistrict server:
+a cold pass with an empty response cache, a warm pass that should be all 304s, then a
+pass after `--update` of the centres changed their capacity. Each pass is run once
+sequentially (--concurrency 1, the old loop) and once on the thread pool.
+
+    python benchmarks/bench_cowin.py --districts 40 --days 14 --latency-ms 150
+
+Per pass it reports requests, 304s, 429s, wall time, and how many centre items would be
+re-embedded (text changed since the previous pass) or expired.
+"""
+import argparse
+import hashlib
+import json
+import sys
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "database" / "ingest"))
+
+from fake_services import FakeCowinServer, Fault, Recorder
+
+
+def run_passes(server, districts, days, concurrency, rate, share, today):
+    import cowin
+    rows = []
+    previous = {}
+    with tempfile.TemporaryDirectory() as cache_dir:
+        fetcher = cowin.CowinFetcher(api_url=server.url, cache_dir=cache_dir, concurrency=concurrency, rate=rate)
+        for name in ("cold", "warm", "updated"):
+            if name == "updated":
+                server.update(share, districts)
+            fetcher.stats = {k: 0 for k in fetcher.stats}
+            before = dict(server.stats)
+            started = time.perf_counter()
+            items = cowin.build_items(fetcher.fetch_districts(districts, days, start=today), today)
+            elapsed = time.perf_counter() - started
+            shas = {i["id"]: hashlib.sha256(i["text"].encode("utf-8")).hexdigest() for i in items}
+            rows.append({
+                "pass": name, "concurrency": concurrency, "seconds": elapsed, "items": len(items),
+                "requests": fetcher.stats["requests"], "not_modified": fetcher.stats["not_modified"],
+                "errors": fetcher.stats["errors"], "rate_limited": server.stats["429"] - before["429"],
+                "changed": sum(previous.get(k) != v for k, v in shas.items()),
+                "expired": len(set(previous) - set(shas)),
+            })
+            previous = shas
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--districts", type=int, default=40)
+    parser.add_argument("--days", type=int, default=14)
+    parser.add_argument("--centers", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=40.0, help="client-side requests per second")
+    parser.add_argument("--server-rps", type=float, default=50.0, help="fake server's 429 threshold")
+    parser.add_argument("--latency-ms", type=float, default=150.0)
+    parser.add_argument("--update", type=float, default=0.1, help="share of centres changed before the last pass")
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    server = FakeCowinServer(Recorder(), Fault(latency_ms=args.latency_ms, jitter_ms=args.latency_ms / 5),
+                             centers=args.centers, max_rps=args.server_rps).start()
+    districts = list(range(100, 100 + args.districts))
+    today = date.today()
+    results = []
+    try:
+        for concurrency in (1, args.concurrency):
+            server.version.clear()
+            results += run_passes(server, districts, args.days, concurrency, args.rate, args.update, today)
+    finally:
+        server.stop()
+
+    print(f"{args.districts} districts x {args.days} days, {args.centers} centres each, {args.latency_ms:.0f} ms per call")
+    print(f"{'pass':>8}{'workers':>8}{'seconds':>9}{'requests':>10}{'304':>6}{'429':>6}{'items':>7}{'changed':>9}{'expired':>9}")
+    for r in results:
+        print(f"{r['pass']:>8}{r['concurrency']:>8}{r['seconds']:>9.2f}{r['requests']:>10}{r['not_modified']:>6}"
+              f"{r['rate_limited']:>6}{r['items']:>7}{r['changed']:>9}{r['expired']:>9}")
+    if args.out:
+        Path(args.out).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Throughput, single-query latency and agreement with the torch reference for every
+embedder backend.
+
+    python benchmarks/bench_embedder.py                      # all backends
+    python benchmarks/bench_embedder.py --backends torch onnx-int8 --threads 4
+    python benchmarks/bench_embedder.py --check              # exit 1 if a backend drifts past tolerance
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from embedder_utils import BACKENDS, COSINE_TOLERANCE, cosine_agreement, load_embedder
+
+SAMPLES = Path(__file__).with_name("langid_samples.tsv")
+
+
+def load_texts(n):
+    texts = [
+        line.split("\t", 1)[1]
+        for line in SAMPLES.read_text(encoding="utf-8").splitlines()
+        if line.strip() and not line.startswith("#")
+    ]
+    # Ingest-sized passages as well as short chat queries
+    passages = [" ".join(texts[i:i + 12]) for i in range(0, len(texts), 3)]
+    pool = texts + passages
+    return [pool[i % len(pool)] for i in range(n)]
+
+
+def bench(model, texts, batch_size, query_runs=50):
+    model.encode(texts[:batch_size], batch_size=batch_size)  # warm-up
+    started = time.perf_counter()
+    model.encode(texts, batch_size=batch_size)
+    throughput = len(texts) / (time.perf_counter() - started)
+    latencies = []
+    for t in texts[:query_runs]:
+        s = time.perf_counter()
+        model.encode(t)
+        latencies.append(time.perf_counter() - s)
+    latencies.sort()
+    return {
+        "texts_per_second": throughput,
+        "query_p50_ms": statistics.median(latencies) * 1000,
+        "query_p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--texts", type=int, default=512)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--tolerance", type=float, default=COSINE_TOLERANCE)
+    parser.add_argument("--check", action="store_true", help="fail if any backend is below the cosine tolerance")
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    texts = load_texts(args.texts)
+    reference = load_embedder(backend="torch", threads=args.threads)
+    results = {}
+    failed = []
+    for backend in args.backends:
+        model = reference if backend == "torch" else load_embedder(backend=backend, threads=args.threads)
+        r = bench(model, texts, args.batch_size)
+        sims = cosine_agreement(reference, model, texts[:128])
+        r["cosine_min"] = float(sims.min())
+        r["cosine_mean"] = float(sims.mean())
+        results[backend] = r
+        if r["cosine_min"] < args.tolerance:
+            failed.append(backend)
+        print(
+            f"{backend:<10} {r['texts_per_second']:8.1f} texts/s  query p50 {r['query_p50_ms']:6.2f} ms"
+            f"  p95 {r['query_p95_ms']:6.2f} ms  cosine min {r['cosine_min']:.4f}"
+        )
+    if args.out:
+        Path(args.out).write_text(json.dumps({"threads": args.threads, "results": results}, indent=2))
+    if args.check and failed:
+        print(f"Below cosine tolerance {args.tolerance}: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
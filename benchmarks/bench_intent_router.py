@@ -0,0 +1,133 @@
+"""
+Accuracy and latency of the local intent router (intent_router.py) against Dialogflow.
+Training phrases are split per intent into a training part and a held-out part; the
+router is built from the training part and every held-out phrase is routed at each
+threshold. --test gives a separate labelled set {intent: [messages]} instead (better:
+Dialogflow was trained on every phrase of the export, so its held-out score flatters it).
+
+    python benchmarks/bench_intent_router.py --phrases dialogflow_agent.zip --dialogflow
+    python benchmarks/bench_intent_router.py --phrases benchmarks/intent_phrases.json --fake-embedder
+
+Per threshold it reports coverage (share answered locally), accuracy of the local
+decisions, and end-to-end accuracy when uncertain messages fall back to Dialogflow
+(gold labels stand in for Dialogflow unless --dialogflow calls the real agent).
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from intent_router import IntentRouter, load_training_phrases
+
+LOCAL_INTENTS = ("Query", "Reminders", "ShowReminders")
+
+
+def split(phrases, holdout, rng):
+    train, test = {}, []
+    for intent, items in phrases.items():
+        items = list(items)
+        rng.shuffle(items)
+        n = max(1, int(len(items) * holdout)) if len(items) > 1 else 0
+        test += [(text, intent) for text in items[:n]]
+        train[intent] = items[n:]
+    return train, test
+
+
+def dialogflow_intents(texts):
+    """(intent display name, seconds) per text from the live agent, one session per text."""
+    from dotenv import load_dotenv
+    from google.cloud import dialogflow_v2 as dialogflow
+    from google.oauth2 import service_account
+    load_dotenv()
+    credentials = service_account.Credentials.from_service_account_file(os.getenv("GOOGLE_APPLICATION_CREDENTIALS"))
+    client = dialogflow.SessionsClient(credentials=credentials)
+    project = os.getenv("DIALOGFLOW_PROJECT_ID")
+    out = []
+    for i, text in enumerate(texts):
+        query_input = dialogflow.types.QueryInput(text=dialogflow.types.TextInput(text=text, language_code="en"))
+        started = time.perf_counter()
+        result = client.detect_intent(request={
+            "session": client.session_path(project, f"intent-bench-{i}"), "query_input": query_input,
+        }).query_result
+        out.append((result.intent.display_name, time.perf_counter() - started))
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--phrases", default=os.getenv("INTENT_PHRASES", str(Path(__file__).with_name("intent_phrases.json"))))
+    parser.add_argument("--test", help="labelled messages {intent: [messages]}; default: hold out training phrases")
+    parser.add_argument("--holdout", type=float, default=0.25)
+    parser.add_argument("--thresholds", default="0.3,0.4,0.5,0.6,0.7")
+    parser.add_argument("--margin", type=float, default=float(os.getenv("INTENT_ROUTER_MARGIN", 0.1)))
+    parser.add_argument("--dialogflow", action="store_true", help="compare with the live agent (credentials from .env)")
+    parser.add_argument("--fake-embedder", action="store_true", help="hashed bag of words instead of the real model")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    phrases = load_training_phrases(args.phrases)
+    if args.test:
+        train = phrases
+        test = [(t, i) for i, items in json.loads(Path(args.test).read_text(encoding="utf-8")).items() for t in items]
+    else:
+        train, test = split(phrases, args.holdout, rng)
+    if args.fake_embedder:
+        from fake_services import Fault, FakeEmbedder, Recorder
+        embedder = FakeEmbedder(Recorder(), Fault())
+    else:
+        from embedder_utils import load_embedder
+        embedder = load_embedder()
+
+    router = IntentRouter(embedder, train, margin=args.margin, local_intents=LOCAL_INTENTS)
+    texts = [t for t, _ in test]
+    gold = [i for _, i in test]
+    predictions, latencies = [], []
+    for text in texts:
+        started = time.perf_counter()
+        predictions.append(router.predict(embedder.encode(text)))  # embedding included, as in the app
+        latencies.append(time.perf_counter() - started)
+    if args.dialogflow:
+        df = dialogflow_intents(texts)
+        df_labels, df_latencies = [i for i, _ in df], [s for _, s in df]
+    else:
+        df_labels, df_latencies = gold, []
+
+    results = {"test_messages": len(test), "router_p50_ms": statistics.median(latencies) * 1000,
+               "router_nearest_accuracy": statistics.mean(p[0] == g for p, g in zip(predictions, gold)),
+               "thresholds": {}}
+    if df_latencies:
+        results["dialogflow_p50_ms"] = statistics.median(df_latencies) * 1000
+        results["dialogflow_accuracy"] = statistics.mean(d == g for d, g in zip(df_labels, gold))
+    print(f"{len(test)} held-out messages; router p50 {results['router_p50_ms']:.1f} ms, "
+          f"nearest-centroid accuracy {results['router_nearest_accuracy']:.2f}")
+    if df_latencies:
+        print(f"dialogflow p50 {results['dialogflow_p50_ms']:.0f} ms, accuracy {results['dialogflow_accuracy']:.2f}")
+    print(f"{'threshold':>9}{'coverage':>10}{'local acc':>11}{'e2e acc':>9}")
+    for threshold in (float(t) for t in args.thresholds.split(",")):
+        local, correct_local, correct = 0, 0, 0
+        for (intent, score, margin), g, d in zip(predictions, gold, df_labels):
+            routed = intent in LOCAL_INTENTS and score >= threshold and margin >= args.margin
+            final = intent if routed else d
+            local += routed
+            correct_local += routed and intent == g
+            correct += final == g
+        row = {"coverage": local / len(test), "local_accuracy": correct_local / local if local else None,
+               "e2e_accuracy": correct / len(test)}
+        results["thresholds"][str(threshold)] = row
+        local_acc = f"{row['local_accuracy']:.2f}" if local else "-"
+        print(f"{threshold:>9.2f}{row['coverage']:>10.2f}{local_acc:>11}{row['e2e_accuracy']:>9.2f}")
+    if args.out:
+        Path(args.out).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
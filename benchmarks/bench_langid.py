@@ -0,0 +1,66 @@
+"""
+Accuracy and latency of the local language detector vs the Google Translate detect call.
+
+    python benchmarks/bench_langid.py            # local detector only
+    python benchmarks/bench_langid.py --remote   # also call Google (needs credentials)
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from langid_utils import detect_local
+
+SAMPLES = Path(__file__).with_name("langid_samples.tsv")
+
+
+def load_samples():
+    samples = []
+    for line in SAMPLES.read_text(encoding="utf-8").splitlines():
+        if not line.strip() or line.startswith("#"):
+            continue
+        lang, text = line.split("\t", 1)
+        samples.append((lang, text))
+    return samples
+
+
+def run(name, detect, samples):
+    correct = 0
+    timings = []
+    for lang, text in samples:
+        start = time.perf_counter()
+        guess = detect(text)
+        timings.append(time.perf_counter() - start)
+        correct += guess.split("-")[0] == lang
+    timings.sort()
+    print(
+        f"{name:<14} accuracy {correct}/{len(samples)} ({correct / len(samples):.1%})  "
+        f"p50 {timings[len(timings) // 2] * 1000:.3f} ms  max {timings[-1] * 1000:.3f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--remote", action="store_true", help="also benchmark the Google detect call")
+    parser.add_argument("--threshold", type=float, default=0.75)
+    args = parser.parse_args()
+
+    samples = load_samples()
+    run("local", lambda t: detect_local(t)[0], samples)
+
+    confident = [(lang, t) for lang, t in samples if detect_local(t)[1] >= args.threshold]
+    print(f"local answers {len(confident)}/{len(samples)} samples at confidence >= {args.threshold}")
+    run("local (conf.)", lambda t: detect_local(t)[0], confident)
+
+    if args.remote:
+        import translate_utils
+        run("google", lambda t: translate_utils.client.detect_language(t)["language"], samples)
+        translate_utils.LOCAL_LANGID_THRESHOLD = args.threshold
+        run("hybrid", lambda t: translate_utils.detect_language_with_confidence(t)[0], samples)
+
+
+if __name__ == "__main__":
+    main()
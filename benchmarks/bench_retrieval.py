@@ -0,0 +1,78 @@
+"""
+Relevance and latency of dense, BM25 and hybrid retrieval against the live health_kb
+collection. A query counts as answered at k when any of the top-k chunks contains one
+of its `must_contain` terms (case-insensitive), so the labels work on any corpus.
+
+    python benchmarks/bench_retrieval.py --k 4 --out retrieval.json
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from embedder_utils import load_embedder
+from retrieval import HybridRetriever
+from vector_store import open_vector_store
+
+QUERIES = Path(__file__).with_name("retrieval_queries.json")
+
+
+def relevant(hit, terms):
+    text = (hit.get("text") or "").lower()
+    return any(t in text for t in terms)
+
+
+def evaluate(retriever, embedder, queries, k, mode):
+    recalls, reciprocal_ranks, latencies = [], [], []
+    for q in queries:
+        started = time.perf_counter()
+        q_vec = embedder.encode(q["query"])
+        hits = retriever.search(q["query"], q_vec, top_k=k, mode=mode, filters=q.get("filters"))
+        latencies.append(time.perf_counter() - started)
+        ranks = [i for i, h in enumerate(hits) if relevant(h, q["must_contain"])]
+        recalls.append(1.0 if ranks else 0.0)
+        reciprocal_ranks.append(1.0 / (ranks[0] + 1) if ranks else 0.0)
+    latencies.sort()
+    return {
+        f"recall@{k}": statistics.mean(recalls),
+        "mrr": statistics.mean(reciprocal_ranks),
+        "latency_p50_ms": statistics.median(latencies) * 1000,
+        "latency_max_ms": latencies[-1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--qdrant-url", default="http://localhost:6333")
+    parser.add_argument("--collection", default="health_kb")
+    parser.add_argument("--rerank-model", help="also evaluate hybrid + this cross-encoder")
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    client = open_vector_store(url=args.qdrant_url)  # VECTOR_BACKEND=local benchmarks the in-process store
+    embedder = load_embedder()
+    queries = json.loads(QUERIES.read_text(encoding="utf-8"))
+
+    retriever = HybridRetriever(client, args.collection, rerank_model=None)
+    runs = {mode: (retriever, mode) for mode in ("dense", "bm25", "hybrid")}
+    if args.rerank_model:
+        runs["hybrid+rerank"] = (HybridRetriever(client, args.collection, rerank_model=args.rerank_model), "hybrid")
+
+    results = {}
+    for name, (r, mode) in runs.items():
+        results[name] = evaluate(r, embedder, queries, args.k, mode)
+        m = results[name]
+        print(f"{name:<14} recall@{args.k} {m[f'recall@{args.k}']:.2f}  MRR {m['mrr']:.2f}  "
+              f"p50 {m['latency_p50_ms']:.1f} ms  max {m['latency_max_ms']:.1f} ms")
+    if args.out:
+        Path(args.out).write_text(json.dumps({"k": args.k, "queries": len(queries), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
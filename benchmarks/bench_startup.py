@@ -0,0 +1,62 @@
+"""
+Startup cost of app.py: import time and peak RSS in a fresh interpreter, and optionally
+how long each lazy component takes to warm. Writes JSON so runs can be compared.
+
+    python benchmarks/bench_startup.py --runs 5 --out startup.json
+    python benchmarks/bench_startup.py --warm     # also loads model/clients (needs credentials)
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+PROBE = r"""
+import json, os, resource, sys, time
+os.environ.setdefault("REMINDER_DISPATCHER", "0")
+os.environ.setdefault("WARM_ON_START", "0")
+started = time.perf_counter()
+import app
+result = {"import_seconds": time.perf_counter() - started}
+if "--warm" in sys.argv:
+    import lazy_utils
+    lazy_utils.warm(app.READY_COMPONENTS)
+    result["components"] = lazy_utils.status(app.READY_COMPONENTS)
+result["max_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+print(json.dumps(result))
+"""
+
+
+def run_once(warm):
+    args = [sys.executable, "-c", PROBE] + (["--warm"] if warm else [])
+    out = subprocess.run(args, cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--warm", action="store_true", help="also time loading each heavy component")
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    runs = [run_once(args.warm) for _ in range(args.runs)]
+    imports = [r["import_seconds"] for r in runs]
+    summary = {
+        "runs": args.runs,
+        "import_seconds_median": statistics.median(imports),
+        "import_seconds_max": max(imports),
+        "max_rss_mb_median": statistics.median(r["max_rss_mb"] for r in runs),
+    }
+    if args.warm:
+        summary["components"] = runs[-1]["components"]
+    print(json.dumps(summary, indent=2))
+    if args.out:
+        Path(args.out).write_text(json.dumps({"summary": summary, "runs": runs}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,475 @@
+"""
+Local stand-ins for every external service app.py calls, used by loadtest.py.
+
+Each stand-in sleeps for a configurable latency (mean ± jitter, in ms) and fails with a
+configurable probability, and records how long every call took:
+  FakeGraphServer   Meta Graph API over real HTTP (messages, media URL, media download)
+  FakeDialogflow    SessionsClient; intents with fulfillment POST to the app's /continue
+                    exactly like Dialogflow's webhook call
+  FakeGemini        GenerativeModel.generate_content, including stream=True
+  FakeTranslate     translate_v2 Client (translate / detect_language)
+  FakeSpeech        SpeechClient (recognize / streaming_recognize)
+  FakeTTS           TextToSpeechClient
+  FakeEmbedder      SentenceTransformer.encode (hashed bag of words, 384 dims)
+  FakeCowinServer   CoWIN calendarByDistrict over real HTTP, with ETags and a request rate limit
+Qdrant is replaced by the in-process vector_store.LocalVectorStore.
+"""
+import hashlib
+import json
+import random
+import re
+import struct
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import requests
+
+EMBED_DIM = 384
+
+
+class FakeServiceError(RuntimeError):
+    pass
+
+
+class Fault:
+    """Latency and error injection for one dependency."""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+
+    def delay(self):
+        ms = max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) if self.jitter_ms else self.latency_ms
+        if ms:
+            time.sleep(ms / 1000)
+
+    def failed(self):
+        return self.error_rate and random.random() < self.error_rate
+
+
+class Recorder:
+    """Thread-safe latency samples and error counts per stage name."""
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds, error=False):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+            if error:
+                self.errors[stage] = self.errors.get(stage, 0) + 1
+
+    def call(self, stage, fault, fn=None):
+        """Apply `fault`, run `fn`, and record the whole thing under `stage`."""
+        started = time.perf_counter()
+        error = False
+        try:
+            fault.delay()
+            if fault.failed():
+                error = True
+                raise FakeServiceError(f"injected {stage} failure")
+            return fn() if fn else None
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.add(stage, time.perf_counter() - started, error)
+
+    def timed(self, stage, fn):
+        """Wrap an app function so each call is recorded under `stage`."""
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            error = False
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                error = True
+                raise
+            finally:
+                self.add(stage, time.perf_counter() - started, error)
+        wrapper.__wrapped__ = fn
+        return wrapper
+
+
+# ================== AUDIO ==================
+def _ogg_page(payload, granule, serial, seq, header_type=0):
+    segments = [255] * (len(payload) // 255) + [len(payload) % 255]
+    header = b"OggS" + struct.pack("<BBqIIIB", 0, header_type, granule, serial, seq, 0, len(segments))
+    return header + bytes(segments) + payload  # CRC left 0: only the app's parser reads these pages
+
+
+def fake_voice_note(seconds=4.0, input_rate=48000, frame_bytes=60):
+    """A structurally valid Ogg/Opus stream of `seconds` (20 ms frames of filler bytes)."""
+    head = b"OpusHead" + struct.pack("<BBHIhB", 1, 1, 312, input_rate, 0, 0)
+    pages = [_ogg_page(head, 0, 1, 0, header_type=2), _ogg_page(b"OpusTags" + b"\0" * 8, 0, 1, 1)]
+    frames = int(seconds * 50)
+    per_page = 50  # one second per page
+    for i in range(0, frames, per_page):
+        n = min(per_page, frames - i)
+        granule = 312 + (i + n) * 960
+        pages.append(_ogg_page(b"\x7f" * (frame_bytes * n), granule, 1, 2 + i // per_page))
+    return b"".join(pages)
+
+
+# ================== META GRAPH ==================
+class FakeGraphServer:
+    """
+    Serves POST /<ver>/<phone_id>/messages, GET /<ver>/<media_id> and GET /media/<id>.
+    Failures alternate between 429 (with Retry-After) and 500 so the app's retry path runs.
+    on_message(to_phone, payload, received_at) is called for every accepted message.
+    """
+
+    def __init__(self, recorder, fault, media_fault=None, voice_note=None, on_message=None):
+        self.recorder = recorder
+        self.fault = fault
+        self.media_fault = media_fault or Fault()
+        self.voice_note = voice_note or fake_voice_note()
+        self.on_message = on_message
+        self._flip = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-graph", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+    def _handler(self):
+        outer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, body, content_type="application/json", headers=None):
+                data = body if isinstance(body, bytes) else json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _fail(self):
+                outer._flip ^= 1
+                if outer._flip:
+                    self._reply(429, {"error": {"code": 130429, "message": "Rate limit hit"}}, headers={"Retry-After": "0"})
+                else:
+                    self._reply(500, {"error": {"code": 1, "message": "Injected failure"}})
+
+            def _timed(self, stage, fault, ok):
+                started = time.perf_counter()
+                fault.delay()
+                failed = fault.failed()
+                if failed:
+                    self._fail()
+                else:
+                    ok()
+                outer.recorder.add(stage, time.perf_counter() - started, failed)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+
+                def ok():
+                    if outer.on_message:
+                        outer.on_message(body.get("to"), body, time.perf_counter())
+                    self._reply(200, {"messages": [{"id": f"wamid.fake{random.getrandbits(48)}"}]})
+                self._timed("dep.meta_send", outer.fault, ok)
+
+            def do_GET(self):
+                if self.path.startswith("/media/"):
+                    self._timed("dep.meta_media", outer.media_fault,
+                                lambda: self._reply(200, outer.voice_note, content_type="audio/ogg"))
+                else:
+                    media_id = self.path.rsplit("/", 1)[-1].split("?")[0]
+                    self._timed("dep.meta_media", outer.media_fault,
+                                lambda: self._reply(200, {"url": f"{outer.url}/media/{media_id}", "mime_type": "audio/ogg"}))
+
+        return Handler
+
+
+# ================== GOOGLE / GEMINI ==================
+class FakeDialogflow:
+    """
+    Routes on keywords the way the agent's intents do. Intents with fulfillment call the
+    app's /continue over HTTP with the original payload, and their fulfillmentText is
+    returned in the query result, as Dialogflow does.
+    """
+
+    FULFILLED = ("Query", "Reminders", "ShowReminders")
+
+    def __init__(self, recorder, fault, continue_url):
+        self.recorder = recorder
+        self.fault = fault
+        self.continue_url = continue_url
+        self._session = requests.Session()
+
+    @staticmethod
+    def session_path(project, session):
+        return f"projects/{project}/agent/sessions/{session}"
+
+    @staticmethod
+    def intent_for(text):
+        t = (text or "").lower()
+        if "my reminders" in t or "show reminders" in t:
+            return "ShowReminders"
+        if "remind" in t:
+            return "Reminders"
+        if t.strip() in ("hi", "hello", "namaste"):
+            return "Default Welcome Intent"
+        return "Query"
+
+    def detect_intent(self, request):
+        text = request["query_input"].text.text
+        payload = {}
+        if "query_params" in request:
+            params = request["query_params"]
+            payload = type(params).to_dict(params).get("payload") or {}
+        intent = self.intent_for(text)
+        self.recorder.call("dep.dialogflow", self.fault)
+        fulfillment_text = "Hello! How can I help you today?"
+        if intent in self.FULFILLED:
+            fulfillment = {
+                "session": request["session"],
+                "queryResult": {"queryText": text, "intent": {"displayName": intent}},
+                "originalDetectIntentRequest": {"payload": payload},
+            }
+            started = time.perf_counter()
+            resp = self._session.post(self.continue_url, json=fulfillment, timeout=120)
+            self.recorder.add("http.continue_from_dialogflow", time.perf_counter() - started, resp.status_code >= 400)
+            fulfillment_text = resp.json().get("fulfillmentText", "") if resp.ok else ""
+        return SimpleNamespace(query_result=SimpleNamespace(
+            intent=SimpleNamespace(display_name=intent, is_fallback=False),
+            fulfillment_text=fulfillment_text,
+        ))
+
+
+class FakeGemini:
+    """
+    With stream=True the answer arrives in `stream_chunks` pieces spread evenly over the
+    injected latency; the first piece is recorded as dep.gemini_first_chunk.
+    """
+
+    def __init__(self, recorder, fault, answer_words=120, stream_chunks=8):
+        self.recorder = recorder
+        self.fault = fault
+        self.stream_chunks = stream_chunks
+        self.answer = " ".join(["*Dengue* spreads through mosquito bites; rest, fluids and a doctor's visit help."] * (answer_words // 12))
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        if "set reminder" in prompt:
+            text = "('Take iron tablet', '2030-01-01', '09:00:00')"
+        else:
+            text = self.answer
+        if stream:
+            return self._stream(text)
+        return self.recorder.call("dep.gemini", self.fault, lambda: SimpleNamespace(text=text))
+
+    def _stream(self, text):
+        started = time.perf_counter()
+        step = Fault(self.fault.latency_ms / self.stream_chunks, self.fault.jitter_ms / self.stream_chunks)
+        size = -(-len(text) // self.stream_chunks)
+        fail_at = random.randrange(0, len(text), size) if self.fault.failed() else None  # one failure per call
+        error = False
+        try:
+            for i in range(0, len(text), size):
+                step.delay()
+                if i == fail_at:
+                    error = True
+                    raise FakeServiceError("injected gemini failure")
+                if i == 0:
+                    self.recorder.add("dep.gemini_first_chunk", time.perf_counter() - started)
+                yield SimpleNamespace(text=text[i:i + size])
+        finally:
+            self.recorder.add("dep.gemini", time.perf_counter() - started, error)
+
+
+class FakeTranslate:
+    DEVANAGARI = re.compile(r"[ऀ-ॿ]")
+
+    def __init__(self, recorder, fault):
+        self.recorder = recorder
+        self.fault = fault
+
+    def detect_language(self, text):
+        lang = "hi" if self.DEVANAGARI.search(text or "") else "en"
+        return self.recorder.call("dep.translate", self.fault, lambda: {"language": lang, "confidence": 0.9})
+
+    def translate(self, text, target_language="en", format_=None, **kwargs):
+        return self.recorder.call("dep.translate", self.fault, lambda: {"translatedText": text})
+
+
+class FakeSpeech:
+    def __init__(self, recorder, fault, transcript="मुझे डेंगू के लक्षण बताइए"):
+        self.recorder = recorder
+        self.fault = fault
+        self.transcript = transcript
+
+    def _response(self):
+        alt = SimpleNamespace(transcript=self.transcript, confidence=0.9)
+        return SimpleNamespace(results=[SimpleNamespace(alternatives=[alt], language_code="hi-in", is_final=True)])
+
+    def recognize(self, config=None, audio=None, **kwargs):
+        return self.recorder.call("dep.stt", self.fault, self._response)
+
+    def streaming_recognize(self, config, requests_iter, **kwargs):
+        for _ in requests_iter:
+            pass
+        return [self.recorder.call("dep.stt", self.fault, self._response)]
+
+
+class FakeTTS:
+    def __init__(self, recorder, fault):
+        self.recorder = recorder
+        self.fault = fault
+
+    def synthesize_speech(self, input=None, voice=None, audio_config=None, **kwargs):
+        audio = b"ID3" + hashlib.sha256(input.text.encode("utf-8")).digest() * 64
+        return self.recorder.call("dep.tts", self.fault, lambda: SimpleNamespace(audio_content=audio))
+
+
+class FakeEmbedder:
+    """Hashed bag of words: related texts get related vectors, identical texts identical ones."""
+
+    TOKEN = re.compile(r"\w+", re.UNICODE)
+
+    def __init__(self, recorder, fault, dim=EMBED_DIM):
+        self.recorder = recorder
+        self.fault = fault
+        self.dim = dim
+
+    def _vector(self, text):
+        v = np.zeros(self.dim, dtype=np.float32)
+        for tok in self.TOKEN.findall(text.lower()):
+            h = int.from_bytes(hashlib.blake2b(tok.encode("utf-8"), digest_size=8).digest(), "little")
+            v[h % self.dim] += 1.0 if (h >> 32) & 1 else -1.0
+        n = np.linalg.norm(v)
+        return v / n if n else v
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        def run():
+            if isinstance(sentences, str):
+                return self._vector(sentences)
+            return np.stack([self._vector(s) for s in sentences])
+        return self.recorder.call("dep.embed", self.fault, run)
+
+
+# ================== COWIN ==================
+class FakeCowinServer:
+    """
+    GET /api/v2/appointment/sessions/public/calendarByDistrict?district_id=&date=DD-MM-YYYY
+    returns `centers` centres per district with one session a day for the 7 days from `date`.
+    Bodies carry an ETag and If-None-Match gets a 304. update(share) changes the capacity
+    of that share of centres; more than `max_rps` requests per second get a 429.
+    """
+
+    VACCINES = ("COVISHIELD", "COVAXIN", "CORBEVAX")
+
+    def __init__(self, recorder, fault, centers=20, max_rps=50.0):
+        self.recorder = recorder
+        self.fault = fault
+        self.centers = centers
+        self.max_rps = max_rps
+        self.version = {}  # (district, center) -> bumped by update()
+        self.stats = {"200": 0, "304": 0, "429": 0}
+        self._window = []
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}/api"
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-cowin", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+    def update(self, share, districts):
+        rng = random.Random()
+        with self._lock:
+            for d in districts:
+                for c in range(self.centers):
+                    if rng.random() < share:
+                        self.version[(d, c)] = self.version.get((d, c), 0) + 1
+
+    def body(self, district, start):
+        centers = []
+        for c in range(self.centers):
+            center_id = district * 1000 + c
+            v = self.version.get((district, c), 0)
+            sessions = [{
+                "session_id": f"{center_id}-{i}",
+                "date": (start + timedelta(days=i)).strftime("%d-%m-%Y"),
+                "vaccine": self.VACCINES[(c + i) % len(self.VACCINES)],
+                "min_age_limit": 18 if c % 3 else 45,
+                "available_capacity": (center_id * 7 + i * 13 + v * 5) % 200,
+            } for i in range(7)]
+            centers.append({"center_id": center_id, "name": f"PHC {district}-{c}", "address": f"Block {c % 9}, district {district}",
+                            "pincode": 400000 + district, "fee_type": "Free", "sessions": sessions})
+        return {"centers": centers}
+
+    def _allow(self):
+        now = time.monotonic()
+        with self._lock:
+            self._window = [t for t in self._window if now - t < 1.0]
+            if len(self._window) >= self.max_rps:
+                return False
+            self._window.append(now)
+            return True
+
+    def _handler(self):
+        outer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, data=b"", headers=None):
+                self.send_response(status)
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                started = time.perf_counter()
+                query = parse_qs(urlparse(self.path).query)
+                outer.fault.delay()
+                if not outer._allow():
+                    outer.stats["429"] += 1
+                    self._reply(429, b"{}", {"Retry-After": "1", "Content-Type": "application/json"})
+                    outer.recorder.add("dep.cowin", time.perf_counter() - started, True)
+                    return
+                district = int(query["district_id"][0])
+                start = datetime.strptime(query["date"][0], "%d-%m-%Y").date()
+                data = json.dumps(outer.body(district, start)).encode()
+                etag = '"' + hashlib.sha1(data).hexdigest() + '"'
+                if self.headers.get("If-None-Match") == etag:
+                    outer.stats["304"] += 1
+                    self._reply(304, headers={"ETag": etag})
+                else:
+                    outer.stats["200"] += 1
+                    self._reply(200, data, {"ETag": etag, "Content-Type": "application/json"})
+                outer.recorder.add("dep.cowin", time.perf_counter() - started)
+
+        return Handler
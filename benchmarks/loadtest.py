@@ -0,0 +1,452 @@
+"""
+End-to-end load test of app.py with every external service replaced by a local stand-in
+(see fake_services.py). Replays WhatsApp webhook payloads (text, voice notes, images,
+Meta redeliveries of the same message) against /webhook, plus Dialogflow fulfillment
+calls straight to /continue, at a Poisson arrival rate. Reports throughput and
+p50/p95/p99 per HTTP endpoint, per app stage and per dependency, as JSON.
+
+    python benchmarks/loadtest.py --rate 10 --duration 60 --out loadtest.json
+    python benchmarks/loadtest.py --latency gemini=2500:600 --errors meta=0.05 --errors gemini=0.02
+    python benchmarks/loadtest.py --real-embedder          # the configured EMBEDDER_BACKEND model
+
+Dependency names for --latency NAME=MEAN_MS[:JITTER_MS] and --errors NAME=RATE:
+meta, media, dialogflow, gemini, translate, stt, tts, embed.
+The app itself needs its normal requirements installed; no credentials are used.
+"""
+import argparse
+import copy
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+
+import requests
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from fake_services import (
+    EMBED_DIM, Fault, FakeDialogflow, FakeEmbedder, FakeGemini, FakeGraphServer, FakeSpeech,
+    FakeTranslate, FakeTTS, Recorder,
+)
+
+PAYLOADS = Path(__file__).with_name("webhook_payloads.json")
+PHONE_NUMBER_ID = "100000000000001"
+
+# Rough production latencies (mean ms, jitter ms) of each dependency
+DEFAULT_LATENCY = {
+    "meta": (150, 40), "media": (80, 20), "dialogflow": (120, 30), "gemini": (900, 250),
+    "translate": (60, 15), "stt": (400, 100), "tts": (250, 60), "embed": (15, 3),
+}
+# app.py functions timed individually; each is looked up through the module, so wrapping works
+APP_STAGES = [
+    "handle_incoming_message", "detect_intent_text", "answer_query", "generate_prompt",
+    "answer_with_gemini", "stream_answer", "handle_reminder", "download_whatsapp_media", "transcribe_audio",
+    "synthesize_speech", "send_whatsapp_text",
+]
+BROADCAST_PREFIX = "B"  # recipients of the --broadcast alert
+# Bot texts sent before the answer; e2e.webhook_to_answer skips them
+PLACEHOLDERS = {"Thinking...", "Setting Reminder for you...", "Something went wrong, please try again later."}
+KB_TOPICS = [
+    "dengue fever platelets mosquito aedes hydration", "malaria plasmodium anopheles bed nets chloroquine",
+    "typhoid salmonella contaminated water vaccine", "measles rubella MR vaccine rash infants",
+    "polio OPV drops pulse polio children", "Covishield Covaxin vaccination centre district slots",
+    "paracetamol fever dose children doctor", "ORS oral rehydration diarrhoea zinc",
+    "iron folic acid anaemia pregnancy", "tuberculosis cough DOTS sputum test",
+]
+
+
+def percentiles(samples):
+    if not samples:
+        return {"count": 0}
+    s = sorted(samples)
+
+    def at(q):  # nearest rank
+        return s[max(0, math.ceil(q * len(s)) - 1)] * 1000
+    return {
+        "count": len(s), "mean_ms": sum(s) / len(s) * 1000,
+        "p50_ms": at(0.50), "p95_ms": at(0.95), "p99_ms": at(0.99), "max_ms": s[-1] * 1000,
+    }
+
+
+def parse_overrides(values, kind):
+    out = {}
+    for item in values or []:
+        name, _, value = item.partition("=")
+        if name not in DEFAULT_LATENCY:
+            raise SystemExit(f"Unknown dependency {name!r} in --{kind}; expected one of {sorted(DEFAULT_LATENCY)}")
+        out[name] = value
+    return out
+
+
+def build_faults(args):
+    latency = dict(DEFAULT_LATENCY)
+    for name, value in parse_overrides(args.latency, "latency").items():
+        mean, _, jitter = value.partition(":")
+        latency[name] = (float(mean), float(jitter or 0))
+    errors = {name: float(v) for name, v in parse_overrides(args.errors, "errors").items()}
+    scale = args.latency_scale
+    return {
+        name: Fault(mean * scale, jitter * scale, errors.get(name, 0.0))
+        for name, (mean, jitter) in latency.items()
+    }
+
+
+def fill(template, **values):
+    """Substitute {placeholders} in every string of a JSON-like template; "{message}" takes an object."""
+    if isinstance(template, dict):
+        return {k: fill(v, **values) for k, v in template.items()}
+    if isinstance(template, list):
+        return [fill(v, **values) for v in template]
+    if isinstance(template, str):
+        if template == "{message}":
+            return values["message"]
+        for k, v in values.items():
+            if isinstance(v, str):
+                template = template.replace("{" + k + "}", v)
+    return template
+
+
+def build_schedule(args, spec, rng):
+    """[(at_seconds, event)] with Poisson arrivals; redeliveries reuse the message id and phone."""
+    kinds = spec["messages"]
+    weights = [k["weight"] for k in kinds]
+    schedule = []
+    t = 0.0
+    i = 0
+    while True:
+        t += rng.expovariate(args.rate)
+        if t >= args.duration:
+            break
+        kind = rng.choices(kinds, weights)[0]
+        body = rng.choice(kind.get("bodies", [""]))
+        phone = f"91{9000000000 + i}"
+        msg_id = f"wamid.LOADTEST{i:08d}"
+        message = fill(kind["message"], body=body, media_id=f"media{i}")
+        message.update({"from": phone, "id": msg_id, "timestamp": str(int(time.time()))})
+        event = {"seq": i, "kind": kind["name"], "phone": phone, "text": body, "message": message}
+        if message["type"] == "text" and rng.random() < args.continue_share:
+            event["endpoint"] = "continue"
+            schedule.append((t, event))
+        else:
+            event["endpoint"] = "webhook"
+            event["redelivered"] = rng.random() < args.redelivery_rate
+            schedule.append((t, event))
+            if event["redelivered"]:
+                for n in range(args.redelivery_copies):
+                    schedule.append((t + rng.uniform(0.05, 2.0), dict(event, copy=n + 1)))
+        i += 1
+    schedule.sort(key=lambda item: item[0])
+    return schedule
+
+
+def fulfillment_request(event):
+    return {
+        "session": f"projects/loadtest/agent/sessions/{event['phone']}",
+        "queryResult": {"queryText": event["text"], "intent": {"displayName": FakeDialogflow.intent_for(event["text"])}},
+        "originalDetectIntentRequest": {"payload": {"phone": event["phone"], "lang": "en", "chat_format": "text", "channel": "WhatsApp"}},
+    }
+
+
+def setup_environment(workdir, graph_url, args):
+    """Env for app.py, set before it is imported; nothing writes outside `workdir`."""
+    os.environ.update({
+        "META_GRAPH_URL": graph_url,
+        "META_ACCESS_TOKEN": "loadtest",
+        "META_PHONE_NUMBER_ID": PHONE_NUMBER_ID,
+        "DIALOGFLOW_PROJECT_ID": "loadtest",
+        "GEMINI_API_KEY": "loadtest",
+        "SERVER_DOMAIN": "http://127.0.0.1",
+        "VECTOR_BACKEND": "local",
+        "LOCAL_VECTOR_DIR": str(workdir / "vector_store"),
+        "BM25_INDEX_PATH": str(workdir / "bm25_index.json.gz"),
+        "KB_VERSION_FILE": str(workdir / "kb_version.txt"),
+        "REMINDER_DB": str(workdir / "reminders.db"),
+        "DEDUP_DB": str(workdir / "dedup.db"),
+        "OUTBOUND_DB": str(workdir / "outbound.db"),
+        "BROADCAST_TOKEN": "loadtest",
+        "REMINDER_DISPATCHER": "0",
+        "WARM_ON_START": "0",
+        "TTS_PREWARM": "0",
+        "HTTP_BACKOFF": "0.05",
+        "WEBHOOK_WORKERS": str(args.workers),
+        "WEBHOOK_QUEUE_SIZE": str(args.queue_size),
+        "INTENT_ROUTER": "1" if args.intent_router else "0",
+        "INTENT_PHRASES": str(Path(__file__).with_name("intent_phrases.json")),
+        "INTENT_ROUTER_THRESHOLD": os.getenv("INTENT_ROUTER_THRESHOLD", "0.3"),  # tuned for the fake embedder
+    })
+    os.chdir(workdir)  # static/tts and other relative paths land in the scratch dir
+
+
+def build_knowledge_base(bot, embedder, chunks, rng):
+    from bm25_index import BM25Index
+    texts = []
+    for i in range(chunks):
+        words = KB_TOPICS[i % len(KB_TOPICS)].split()
+        rng.shuffle(words)
+        texts.append(f"Health note {i}: " + " ".join(words * 3) + ". Consult the nearest PHC for advice.")
+    vectors = embedder.encode(texts, batch_size=64)
+    store = bot.client.get()
+    store.create_collection(bot.COLLECTION_NAME, SimpleNamespace(size=len(vectors[0]), distance="Cosine"))
+    index = BM25Index()
+    points = []
+    for i, (text, vec) in enumerate(zip(texts, vectors)):
+        payload = {"text": text, "source": "loadtest", "doc_id": f"note{i}"}
+        points.append({"id": f"00000000-0000-0000-0000-{i:012d}", "vector": vec.tolist(), "payload": payload})
+        index.add(points[-1]["id"], text, payload)
+    for start in range(0, len(points), 512):
+        store.upsert(bot.COLLECTION_NAME, points[start:start + 512])
+    index.save(os.environ["BM25_INDEX_PATH"])
+
+
+def install_fakes(bot, recorder, faults, continue_url, embedder):
+    import client_utils
+    import translate_utils
+    bot.translate_credentials.set(object())
+    bot.dialogflow_credentials.set(object())
+    bot.embedder.set(embedder)
+    bot.dialogflow_client.set(FakeDialogflow(recorder, faults["dialogflow"], continue_url))
+    bot.gemini_model.set(FakeGemini(recorder, faults["gemini"]))
+    translate_utils.client.set(FakeTranslate(recorder, faults["translate"]))
+    client_utils._google_clients.update(
+        speech=FakeSpeech(recorder, faults["stt"]), tts=FakeTTS(recorder, faults["tts"])
+    )
+    for name in APP_STAGES:
+        setattr(bot, name, recorder.timed(f"app.{name}", getattr(bot, name)))
+    bot.message_pool.handler = recorder.timed("app.process_message", bot.message_pool.handler)
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rate", type=float, default=5.0, help="new user messages per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of arrivals")
+    parser.add_argument("--concurrency", type=int, default=64, help="max in-flight HTTP requests from the generator")
+    parser.add_argument("--continue-share", type=float, default=0.1, help="share of text events sent straight to /continue")
+    parser.add_argument("--redelivery-rate", type=float, default=0.05, help="share of webhook events Meta redelivers")
+    parser.add_argument("--redelivery-copies", type=int, default=2)
+    parser.add_argument("--latency", action="append", metavar="NAME=MS[:JITTER]")
+    parser.add_argument("--errors", action="append", metavar="NAME=RATE")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiply every dependency latency")
+    parser.add_argument("--kb-chunks", type=int, default=5000)
+    parser.add_argument("--real-embedder", action="store_true")
+    parser.add_argument("--intent-router", action="store_true", help="route intents locally (intent_phrases.json)")
+    parser.add_argument("--broadcast", type=int, default=0, metavar="N", help="broadcast an alert to N recipients at the start")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEBHOOK_WORKERS", 4)))
+    parser.add_argument("--queue-size", type=int, default=int(os.getenv("WEBHOOK_QUEUE_SIZE", 200)))
+    parser.add_argument("--drain-timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="write results as JSON to this file")
+    args = parser.parse_args()
+    if args.out:
+        args.out = str(Path(args.out).resolve())
+
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+    spec = json.loads(PAYLOADS.read_text(encoding="utf-8"))
+    faults = build_faults(args)
+    recorder = Recorder()
+
+    replies = {}  # phone -> [perf_counter of every message the fake Graph API accepted]
+    replies_lock = threading.Lock()
+
+    answers = {}  # phone -> [perf_counter of every text message that is not a placeholder]
+
+    broadcast_times = []  # perf_counter of every broadcast message delivered
+
+    def on_message(phone, payload, received_at):
+        if phone.startswith(BROADCAST_PREFIX):
+            with replies_lock:
+                broadcast_times.append(received_at)
+            return
+        with replies_lock:
+            replies.setdefault(phone, []).append(received_at)
+            body = (payload.get("text") or {}).get("body")
+            if body and body not in PLACEHOLDERS:
+                answers.setdefault(phone, []).append(received_at)
+
+    graph = FakeGraphServer(recorder, faults["meta"], faults["media"], on_message=on_message).start()
+    workdir = Path(tempfile.mkdtemp(prefix="arogya-loadtest-"))
+    setup_environment(workdir, graph.url, args)
+
+    import app as bot
+    from werkzeug.serving import make_server
+
+    server = make_server("127.0.0.1", 0, bot.app, threaded=True)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    threading.Thread(target=server.serve_forever, name="app-server", daemon=True).start()
+
+    if args.real_embedder:
+        model = kb_embedder = bot.embedder.get()
+        embedder = SimpleNamespace(encode=lambda s, **kw: recorder.call("dep.embed", Fault(), lambda: model.encode(s, **kw)))
+    else:
+        kb_embedder = FakeEmbedder(Recorder(), Fault(), EMBED_DIM)  # same vectors, not timed
+        embedder = FakeEmbedder(recorder, faults["embed"], EMBED_DIM)
+    print(f"Building a {args.kb_chunks}-chunk knowledge base in {workdir} ...")
+    build_knowledge_base(bot, kb_embedder, args.kb_chunks, rng)
+    install_fakes(bot, recorder, faults, f"{base_url}/continue", embedder)
+    requests.get(f"{base_url}/", timeout=10)  # starts the worker pool (before_request hook)
+
+    broadcast_started = None
+    if args.broadcast:
+        recipients = [{"phone": f"{BROADCAST_PREFIX}{i:09d}", "lang": ("en", "hi", "ta")[i % 3],
+                       "chat_format": "audio" if i % 10 == 0 else "text"} for i in range(args.broadcast)]
+        broadcast_started = time.perf_counter()
+        resp = requests.post(f"{base_url}/broadcast", json={"text": "Dengue cases are rising; remove standing water.",
+                                                             "recipients": recipients},
+                             headers={"Authorization": "Bearer loadtest"}, timeout=120)
+        print(f"Broadcast to {args.broadcast} recipients queued in {time.perf_counter() - broadcast_started:.2f}s "
+              f"({resp.status_code})")
+
+    schedule = build_schedule(args, spec, rng)
+    sent_at = {}  # seq -> perf_counter of the first delivery
+    results = []  # (endpoint, seconds, status)
+    results_lock = threading.Lock()
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=args.concurrency))
+
+    def fire(event):
+        started = time.perf_counter()
+        sent_at.setdefault(event["seq"], started)
+        try:
+            if event["endpoint"] == "continue":
+                resp = session.post(f"{base_url}/continue", json=fulfillment_request(event), timeout=120)
+            else:
+                body = fill(spec["envelope"], waba_id="loadtest", phone_number_id=PHONE_NUMBER_ID,
+                            phone=event["phone"], message=copy.deepcopy(event["message"]))
+                resp = session.post(f"{base_url}/webhook", json=body, timeout=30)
+            status = resp.status_code
+        except requests.RequestException:
+            status = None
+        with results_lock:
+            results.append((event, time.perf_counter() - started, status))
+
+    print(f"Replaying {len(schedule)} requests over {args.duration:.0f}s at ~{args.rate}/s ...")
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for at, event in schedule:
+            delay = t0 + at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(fire, event)
+    arrivals_done = time.perf_counter()
+
+    def accepted_webhook_events():
+        ok = {e["seq"] for e, _, status in results if e["endpoint"] == "webhook" and status == 200}
+        return {e["seq"]: e for e, _, _ in results if e["seq"] in ok and "copy" not in e}
+
+    deadline = time.perf_counter() + args.drain_timeout
+    while time.perf_counter() < deadline:
+        events = accepted_webhook_events()
+        with replies_lock:
+            pending = [e for e in events.values() if e["phone"] not in replies]
+        if not pending and bot.message_pool.qsize() == 0 and len(broadcast_times) >= args.broadcast:
+            break
+        time.sleep(0.2)
+    time.sleep(0.5)  # let trailing sends of the last messages land
+    finished = time.perf_counter()
+    server.shutdown()
+    graph.stop()
+
+    # ---------- report ----------
+    events = accepted_webhook_events()
+    with replies_lock:
+        replies = {k: list(v) for k, v in replies.items()}
+        answers = {k: list(v) for k, v in answers.items()}
+    e2e, to_answer, by_kind, sends = [], [], {}, {"single": [], "redelivered": []}
+    for seq, event in events.items():
+        got = replies.get(event["phone"])
+        if not got:
+            continue
+        latency = min(got) - sent_at[seq]
+        e2e.append(latency)
+        if answers.get(event["phone"]):
+            to_answer.append(min(answers[event["phone"]]) - sent_at[seq])
+        by_kind.setdefault(event["kind"], []).append(latency)
+        sends["redelivered" if event.get("redelivered") else "single"].append(len(got))
+    http = {}
+    statuses = {}
+    for event, seconds, status in results:
+        http.setdefault(f"http.{event['endpoint']}", []).append(seconds)
+        key = f"{event['endpoint']}:{status}"
+        statuses[key] = statuses.get(key, 0) + 1
+    continue_ok = sum(1 for e, _, s in results if e["endpoint"] == "continue" and s == 200)
+    completed = len(e2e) + continue_ok
+    wall = finished - t0
+
+    import client_utils
+    import translate_utils
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "args": vars(args),
+            "dependencies": {n: vars(f) for n, f in faults.items()},
+        },
+        "summary": {
+            "requests": len(results),
+            "user_messages": len({e["seq"] for e, _, _ in results}),
+            "completed": completed,
+            "unanswered": len(events) - len(e2e),
+            "wall_seconds": wall,
+            "drain_seconds": finished - arrivals_done,
+            "throughput_per_second": completed / wall if wall else 0.0,
+            "http_status": statuses,
+            "replies_per_message": {k: (sum(v) / len(v) if v else None) for k, v in sends.items()},
+            "broadcast": {
+                "recipients": args.broadcast,
+                "delivered": len(broadcast_times),
+                "seconds_to_deliver": max(broadcast_times) - broadcast_started if broadcast_times else None,
+            },
+        },
+        "latency": {
+            "e2e.webhook_to_first_reply": percentiles(e2e),
+            "e2e.webhook_to_answer": percentiles(to_answer),
+            **{k: percentiles(v) for k, v in sorted(http.items())},
+            **{k: percentiles(v) for k, v in sorted(recorder.samples.items())},
+        },
+        "e2e_by_message_type": {k: percentiles(v) for k, v in sorted(by_kind.items())},
+        "errors": dict(sorted(recorder.errors.items())),
+        "app": {
+            "answer_cache": bot.answer_cache.stats(),
+            "translate_cache": translate_utils.cache_stats(),
+            "tts_cache": bot.tts_cache.stats(),
+            "endpoints": client_utils.endpoint_stats(),
+        },
+    }
+
+    s = report["summary"]
+    print(f"\n{s['completed']} completed of {s['user_messages']} messages in {wall:.1f}s "
+          f"({s['throughput_per_second']:.2f}/s), {s['unanswered']} unanswered, statuses {statuses}")
+    if args.broadcast:
+        b = s["broadcast"]
+        print(f"broadcast: {b['delivered']}/{b['recipients']} delivered"
+              + (f" in {b['seconds_to_deliver']:.1f}s" if b["seconds_to_deliver"] else ""))
+    print(f"{'stage':<36}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}{'errors':>8}")
+    for name, p in report["latency"].items():
+        if p["count"]:
+            print(f"{name:<36}{p['count']:>7}{p['p50_ms']:>10.1f}{p['p95_ms']:>10.1f}{p['p99_ms']:>10.1f}"
+                  f"{recorder.errors.get(name, 0):>8}")
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2, default=str))
+        print("Wrote", args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Local BM25 inverted index over the same chunks that are stored in Qdrant.
+
+Dense MiniLM vectors are weak on exact tokens (drug, vaccine and CoWIN centre names);
+this index catches those. It only keeps term counts and a small payload subset per
+chunk; the chunk text itself is fetched from the vector store by point id.
+"""
+import gzip
+import heapq
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from pathlib import Path
+
+# Written by database/ingest/ingest_all.py, read by the app's retriever
+INDEX_PATH = os.getenv("BM25_INDEX_PATH", str(Path(__file__).resolve().parent / "database" / "bm25_index.json.gz"))
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+META_FIELDS = ("source", "doc_id", "district_id")  # payload keys kept for filtering
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or "").lower())
+
+
+class BM25Index:
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.docs = {}  # point_id -> {"len": int, "meta": dict, "tf": {term: count}}
+        self.postings = {}  # term -> {point_id: count}
+        self.total_len = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.docs)
+
+    def add(self, point_id, text, payload=None):
+        tf = Counter(tokenize(text))
+        meta = {k: payload[k] for k in META_FIELDS if payload and k in payload}
+        with self._lock:
+            self._remove(point_id)
+            self.docs[point_id] = {"len": sum(tf.values()), "meta": meta, "tf": dict(tf)}
+            self.total_len += self.docs[point_id]["len"]
+            for term, n in tf.items():
+                self.postings.setdefault(term, {})[point_id] = n
+
+    def remove(self, point_id):
+        with self._lock:
+            self._remove(point_id)
+
+    def _remove(self, point_id):
+        doc = self.docs.pop(point_id, None)
+        if doc is None:
+            return
+        self.total_len -= doc["len"]
+        for term in doc["tf"]:
+            plist = self.postings.get(term)
+            if plist is not None:
+                plist.pop(point_id, None)
+                if not plist:
+                    del self.postings[term]
+
+    @staticmethod
+    def _matches(meta, filters):
+        return all(meta.get(k) == v for k, v in filters.items())
+
+    def search(self, query, k=10, filters=None):
+        """Top-k (point_id, score) for `query`, optionally restricted to payload equality filters."""
+        terms = set(tokenize(query))
+        n = len(self.docs)
+        if not terms or not n:
+            return []
+        avgdl = self.total_len / n
+        scores = {}
+        for term in terms:
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            idf = math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            for pid, tf in plist.items():
+                dl = self.docs[pid]["len"]
+                s = idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * dl / avgdl))
+                scores[pid] = scores.get(pid, 0.0) + s
+        if filters:
+            scores = {pid: s for pid, s in scores.items() if self._matches(self.docs[pid]["meta"], filters)}
+        return heapq.nlargest(k, scores.items(), key=lambda kv: kv[1])
+
+    def save(self, path):
+        tmp = f"{path}.tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "docs": self.docs}, f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls(data.get("k1", 1.5), data.get("b", 0.75))
+        index.docs = data["docs"]
+        for pid, doc in index.docs.items():
+            index.total_len += doc["len"]
+            for term, n in doc["tf"].items():
+                index.postings.setdefault(term, {})[pid] = n
+        return index
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Fuse several ranked lists of ids into one [(id, score)] list (Cormack et al. RRF)."""
+    fused = {}
+    for ranking in rankings:
+        for rank, pid in enumerate(ranking):
+            fused[pid] = fused.get(pid, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda kv: kv[1], reverse=True)
@@ -0,0 +1,213 @@
+"""
+Long-lived clients for everything app.py talks to over the network.
+
+- one pooled requests.Session with default timeouts and retry/backoff that honours
+  Retry-After and Meta's usage headers (POSTs only when they cannot have been processed)
+- Speech-to-Text / Text-to-Speech gRPC clients created once per process
+- per-endpoint call, error, retry and latency counters (endpoint_stats())
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 32))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 30))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", 3))
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", 0.5))  # first retry delay, doubled each time
+HTTP_MAX_RETRY_DELAY = float(os.getenv("HTTP_MAX_RETRY_DELAY", 30))  # never sleep longer than this
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# A POST that timed out or got a 5xx may still have been processed (a WhatsApp message
+# delivered); only statuses that mean "rejected, not processed" are retried for it.
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+NON_IDEMPOTENT_RETRY_STATUSES = {429}
+# Graph API error codes that mean "throttled" even when the HTTP status is 400
+META_RATE_LIMIT_CODES = {4, 17, 32, 613, 80007, 130429, 131056}
+
+# ================== STATS ==================
+_stats = {}
+_stats_lock = threading.Lock()
+DEPENDENCY_SECONDS = metrics.Histogram(
+    "dependency_seconds", "Latency of calls to external services, retries included", ["endpoint"]
+)
+DEPENDENCY_ERRORS = metrics.Counter("dependency_errors_total", "Failed calls to external services", ["endpoint"])
+DEPENDENCY_RETRIES = metrics.Counter("dependency_retries_total", "Retried attempts per external endpoint", ["endpoint"])
+
+
+def _record(endpoint, seconds, error=False, retries=0):
+    with _stats_lock:
+        s = _stats.setdefault(endpoint, {"calls": 0, "errors": 0, "retries": 0, "seconds": 0.0, "max_seconds": 0.0})
+        s["calls"] += 1
+        s["errors"] += int(error)
+        s["retries"] += retries
+        s["seconds"] += seconds
+        s["max_seconds"] = max(s["max_seconds"], seconds)
+    DEPENDENCY_SECONDS.observe(seconds, endpoint)
+    if error:
+        DEPENDENCY_ERRORS.inc(endpoint)
+    if retries:
+        DEPENDENCY_RETRIES.inc(endpoint, amount=retries)
+
+
+def endpoint_stats():
+    """{endpoint: {calls, errors, retries, seconds, max_seconds, avg_seconds}}"""
+    with _stats_lock:
+        stats = {k: dict(v) for k, v in _stats.items()}
+    for s in stats.values():
+        s["avg_seconds"] = s["seconds"] / s["calls"] if s["calls"] else 0.0
+    return stats
+
+
+@contextmanager
+def track(endpoint):
+    """Time a non-HTTP call (e.g. gRPC) under the same counters."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        _record(endpoint, time.perf_counter() - start, error=True)
+        raise
+    _record(endpoint, time.perf_counter() - start)
+
+# ================== HTTP ==================
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                s = requests.Session()
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+                s.mount("https://", adapter)
+                s.mount("http://", adapter)
+                _session = s
+    return _session
+
+
+def meta_rate_limited(resp):
+    try:
+        code = resp.json().get("error", {}).get("code")
+    except (ValueError, AttributeError):
+        return False
+    return code in META_RATE_LIMIT_CODES
+
+
+def retry_delay(resp, attempt):
+    """Seconds to wait before the next attempt, preferring what the server told us."""
+    if resp is not None:
+        retry_after = resp.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        # Meta reports throttling in X-Business-Use-Case-Usage / X-App-Usage, with minutes to wait
+        for header in ("X-Business-Use-Case-Usage", "X-App-Usage"):
+            raw = resp.headers.get(header)
+            if not raw:
+                continue
+            try:
+                usage = json.loads(raw)
+            except ValueError:
+                continue
+            entries = [e for v in usage.values() if isinstance(v, list) for e in v] if header.startswith("X-Business") else [usage]
+            minutes = max((e.get("estimated_time_to_regain_access", 0) or 0 for e in entries), default=0)
+            if minutes:
+                return minutes * 60
+    return HTTP_BACKOFF * (2 ** attempt) * (0.5 + random.random())
+
+
+def never_sent(e):
+    """True when the request cannot have reached the server (connect timeout, refused, DNS)."""
+    if isinstance(e, requests.ConnectTimeout):
+        return True
+    reason = getattr(e.args[0], "reason", None) if e.args else None
+    return isinstance(e, requests.ConnectionError) and isinstance(reason, NewConnectionError)
+
+
+def request(method, url, endpoint=None, max_retries=None, **kwargs):
+    """
+    Session request with a default timeout, retried on connection errors, 429/5xx
+    and Meta throttling codes. Non-idempotent methods (POST, PATCH) are only retried
+    when the request was never sent, on 429 and on Meta throttling, so a message is not
+    delivered twice. Returns the last response (callers still decide whether to
+    raise_for_status); connection errors are re-raised after the final attempt.
+    """
+    endpoint = endpoint or url
+    max_retries = HTTP_MAX_RETRIES if max_retries is None else max_retries
+    idempotent = method.upper() in IDEMPOTENT_METHODS
+    retry_statuses = RETRY_STATUSES if idempotent else NON_IDEMPOTENT_RETRY_STATUSES
+    kwargs.setdefault("timeout", (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+    session = get_session()
+    start = time.perf_counter()
+    attempt = 0
+    while True:
+        resp = None
+        try:
+            resp = session.request(method, url, **kwargs)
+            retryable = resp.status_code in retry_statuses or (resp.status_code == 400 and meta_rate_limited(resp))
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt >= max_retries or not (idempotent or never_sent(e)):
+                _record(endpoint, time.perf_counter() - start, error=True, retries=attempt)
+                raise
+            retryable = True
+            logger.warning("%s %s failed (%s), retrying", method, endpoint, e)
+        if not retryable or attempt >= max_retries:
+            break
+        delay = retry_delay(resp, attempt)
+        if resp is not None and delay > HTTP_MAX_RETRY_DELAY:
+            logger.warning("%s asks to wait %.0fs, giving up instead", endpoint, delay)
+            break
+        delay = min(delay, HTTP_MAX_RETRY_DELAY)
+        time.sleep(delay)
+        attempt += 1
+    _record(endpoint, time.perf_counter() - start, error=resp.status_code >= 400, retries=attempt)
+    return resp
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+# ================== GOOGLE CLOUD ==================
+_google_clients = {}
+_google_lock = threading.Lock()
+
+
+def _google_client(name, factory):
+    client = _google_clients.get(name)
+    if client is None:
+        with _google_lock:
+            client = _google_clients.get(name)
+            if client is None:
+                client = _google_clients[name] = factory()
+    return client
+
+
+def get_speech_client(credentials):
+    from google.cloud import speech_v1p1beta1 as speech
+    return _google_client("speech", lambda: speech.SpeechClient(credentials=credentials))
+
+
+def get_tts_client(credentials):
+    from google.cloud import texttospeech
+    return _google_client("tts", lambda: texttospeech.TextToSpeechClient(credentials=credentials))
@@ -0,0 +1,157 @@
+"""
+Context assembly for the Gemini prompt. Retrieved chunks go through four steps:
+  1. MMR over the chunk vectors picks top_k chunks that are relevant but not redundant,
+     so near-identical CoWIN centre entries or overlapping chunks do not crowd the rest
+     out; near-duplicates (cosine >= CONTEXT_DEDUP_SIMILARITY) are dropped outright.
+  2. Selected chunks that are neighbours in the same document (chunk_id n and n+1) are
+     merged into one block with the shared overlap text removed.
+  3. Blocks are added in score order until CONTEXT_MAX_TOKENS is reached; the block that
+     crosses the budget is cut at a sentence end, the rest are dropped.
+  4. The instruction block is built once per reply language and reused verbatim, so
+     every request starts with the same prefix.
+Token counts are estimates (CONTEXT_CHARS_PER_TOKEN characters per token); Gemini's
+count_tokens is a network call and too slow to run per request.
+"""
+import os
+import re
+from functools import lru_cache
+
+import numpy as np
+
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", 0.7))  # 1.0 = relevance only, 0.0 = diversity only
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", 12))  # retrieved before MMR picks top_k
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", 1200))
+CONTEXT_DEDUP_SIMILARITY = float(os.getenv("CONTEXT_DEDUP_SIMILARITY", 0.97))
+CONTEXT_CHARS_PER_TOKEN = float(os.getenv("CONTEXT_CHARS_PER_TOKEN", 4))
+MIN_PARTIAL_TOKENS = 40  # a cut block shorter than this is dropped instead
+MAX_OVERLAP_WORDS = 200
+
+SENTENCE_END = re.compile(r"[.!?।॥](?=\s|$)")
+
+INSTRUCTIONS = (
+    "You are a professional health assistant. Use only the following documents to answer the user's question. "
+    "If the answer is not in the documents, then search through official and reliable sources and reply for the answer by yourself.\n"
+    "Instructions: Answer the question clearly and accurately. "
+    "Format the reply for WhatsApp chat: use *bold* for key terms, "
+    "simple line breaks for lists, and avoid markdown that WhatsApp does not support. "
+    "Do NOT include disclaimers, warnings, or 'important notes'. "
+    "Say that you cannot tell for medicine prescription or dosage and advise to consult a doctor if user asks about this for some illness. "
+    "Keep the reply focused and conversational."
+)
+
+
+@lru_cache(maxsize=64)
+def instruction_prefix(lang="en"):
+    """The constant head of every answer prompt for `lang`."""
+    return f"{INSTRUCTIONS} Answer in the language whose code is '{lang}'.\n\n"
+
+
+def estimate_tokens(text):
+    return int(len(text) / CONTEXT_CHARS_PER_TOKEN) + 1
+
+
+def _unit(v):
+    v = np.asarray(v, dtype=np.float32)
+    n = np.linalg.norm(v)
+    return v / n if n else v
+
+
+def mmr(hits, q_vec, top_k, lam=MMR_LAMBDA, dedup_similarity=CONTEXT_DEDUP_SIMILARITY):
+    """
+    Maximal marginal relevance over hits carrying a "vector". Hits without one keep their
+    retrieval order and are only deduplicated by exact text.
+    """
+    if not hits or any(h.get("vector") is None for h in hits):
+        seen, out = set(), []
+        for h in hits:
+            if h["text"] not in seen:
+                seen.add(h["text"])
+                out.append(h)
+        return out[:top_k]
+    vectors = np.stack([_unit(h["vector"]) for h in hits])
+    relevance = vectors @ _unit(q_vec)
+    similarity = vectors @ vectors.T
+    selected = []
+    candidates = list(range(len(hits)))
+    while candidates and len(selected) < top_k:
+        if selected:
+            redundancy = similarity[np.ix_(candidates, selected)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(candidates), dtype=np.float32)
+        scores = lam * relevance[candidates] - (1 - lam) * redundancy
+        best = candidates.pop(int(np.argmax(scores)))
+        if selected and similarity[best, selected].max() >= dedup_similarity:
+            continue
+        selected.append(best)
+    return [hits[i] for i in selected]
+
+
+def _join(a, b):
+    """a + b without the words b repeats from the end of a (chunk overlap)."""
+    aw, bw = a.split(), b.split()
+    for k in range(min(len(aw), len(bw), MAX_OVERLAP_WORDS), 0, -1):
+        if aw[-k:] == bw[:k]:
+            return " ".join(aw + bw[k:])
+    return a + " " + b
+
+
+def merge_adjacent(hits):
+    """
+    Blocks {"text", "source", "score", "rank"} from hits; consecutive chunk_ids of one
+    doc_id become one block ranked by its best chunk.
+    """
+    groups, blocks = {}, []
+    for rank, h in enumerate(hits):
+        payload = h.get("payload") or {}
+        key = (h.get("source"), payload.get("doc_id"))
+        if key[1] is None or payload.get("chunk_id") is None:
+            blocks.append({"text": h["text"] or "", "source": h.get("source"), "score": h["score"], "rank": rank})
+        else:
+            groups.setdefault(key, []).append((payload["chunk_id"], rank, h))
+    for (source, _), members in groups.items():
+        members.sort(key=lambda m: m[0])
+        current = None
+        for chunk_id, rank, h in members:
+            if current is not None and chunk_id == current["last"] + 1:
+                current["text"] = _join(current["text"], h["text"] or "")
+                current["last"] = chunk_id
+                current["rank"] = min(current["rank"], rank)
+                current["score"] = max(current["score"], h["score"])
+                continue
+            current = {"text": h["text"] or "", "source": source, "score": h["score"], "rank": rank, "last": chunk_id}
+            blocks.append(current)
+    blocks.sort(key=lambda b: b["rank"])
+    return blocks
+
+
+def _cut(text, max_tokens):
+    """Leading part of text within max_tokens, ending at a sentence end when there is one."""
+    head = text[:int(max_tokens * CONTEXT_CHARS_PER_TOKEN)]
+    ends = [m.end() for m in SENTENCE_END.finditer(head)]
+    if ends and ends[-1] > len(head) // 2:
+        return head[:ends[-1]]
+    return head.rsplit(" ", 1)[0] + " …"
+
+
+def fit_budget(blocks, max_tokens=CONTEXT_MAX_TOKENS):
+    """Blocks in rank order until the token budget is used; the crossing block is cut."""
+    out, used = [], 0
+    for b in blocks:
+        n = estimate_tokens(b["text"])
+        if used + n <= max_tokens:
+            out.append(b)
+            used += n
+            continue
+        left = max_tokens - used
+        if left >= MIN_PARTIAL_TOKENS:
+            out.append({**b, "text": _cut(b["text"], left)})
+        break
+    return out
+
+
+def build_context(question, hits, q_vec, top_k=4, max_tokens=CONTEXT_MAX_TOKENS):
+    """The retrieval part of the prompt: documents, then the question."""
+    blocks = fit_budget(merge_adjacent(mmr(hits, q_vec, top_k)), max_tokens)
+    parts = [f"Document {i + 1} (source={b['source']}):\n{b['text']}" for i, b in enumerate(blocks)]
+    parts.append(f"Question: {question}\nAnswer concisely and clearly.")
+    return "\n\n".join(parts)
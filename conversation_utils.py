@@ -0,0 +1,80 @@
+import threading
+import time
+from dataclasses import dataclass, asdict
+
+
+@dataclass
+class ConversationContext:
+    """Per-message state that used to live in module globals (language, reply format, channel)."""
+    phone: str
+    lang: str = "en"
+    chat_format: str = "text"  # text or audio
+    channel: str = "WhatsApp"
+    trace_id: str = None  # follows the message from /webhook through Dialogflow to /continue
+
+    def to_payload(self) -> dict:
+        """Serialisable form, sent to Dialogflow as query params payload."""
+        return asdict(self)
+
+    @classmethod
+    def from_payload(cls, phone, payload):
+        payload = payload or {}
+        return cls(
+            phone=phone,
+            lang=payload.get("lang") or "en",
+            chat_format=payload.get("chat_format") or "text",
+            channel=payload.get("channel") or "WhatsApp",
+            trace_id=payload.get("trace_id"),
+        )
+
+
+class ContextStore:
+    """
+    Last known context per phone. Used by /continue when Dialogflow did not echo the
+    payload back (e.g. a follow-up fired from the Dialogflow console).
+    """
+
+    def __init__(self, ttl=3600, max_items=10000):
+        self.ttl = ttl
+        self.max_items = max_items
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def put(self, ctx: ConversationContext):
+        with self._lock:
+            if len(self._items) >= self.max_items:
+                self._evict()
+            self._items[ctx.phone] = (time.monotonic(), ctx)
+
+    def get(self, phone):
+        with self._lock:
+            item = self._items.get(phone)
+        if not item or time.monotonic() - item[0] > self.ttl:
+            return None
+        return item[1]
+
+    def __len__(self):
+        return len(self._items)
+
+    def _evict(self):
+        now = time.monotonic()
+        for phone, (ts, _) in list(self._items.items()):
+            if now - ts > self.ttl:
+                del self._items[phone]
+        # Still full: drop the oldest entries
+        overflow = len(self._items) - self.max_items + 1
+        if overflow > 0:
+            for phone, _ in sorted(self._items.items(), key=lambda kv: kv[1][0])[:overflow]:
+                del self._items[phone]
+
+
+def context_from_fulfillment(req, phone, store=None):
+    """Recover the conversation context from a Dialogflow fulfillment request."""
+    payload = req.get("originalDetectIntentRequest", {}).get("payload", {})
+    if payload.get("phone"):
+        return ConversationContext.from_payload(phone, payload)
+    if store is not None:
+        ctx = store.get(phone)
+        if ctx is not None:
+            return ctx
+    return ConversationContext(phone=phone)
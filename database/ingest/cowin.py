@@ -0,0 +1,285 @@
+# ingest/cowin.py
+# CoWIN vaccination sessions for many districts and weeks, fetched concurrently.
+#
+# calendarByDistrict returns 7 days from `date`, so covering DAYS days takes
+# ceil(DAYS / 7) calls per district. Calls run on a thread pool of COWIN_CONCURRENCY,
+# paced to COWIN_RATE requests per second across all threads; retries of 429/5xx and
+# connection errors go through the same pacing. Responses are cached on disk with their
+# ETag / Last-Modified; repeat runs send conditional requests and a 304 reuses the cached
+# body. Cached weeks that start before today are pruned at the start of every fetch.
+#
+# One item per centre and district carries only sessions from today on, so a centre's
+# text changes (and it is re-embedded) when its sessions do, and a centre without future
+# sessions drops out and is expired from the collection. Districts whose fetch failed are
+# left untouched.
+#
+#   python cowin.py --districts 395,392,393 --days 14 --every 900
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import requests
+
+# shared modules live at the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+import client_utils
+
+COWIN_API_URL = os.getenv("COWIN_API_URL", "https://cdn-api.co-vin.in/api")
+COWIN_DISTRICTS = [int(d) for d in os.getenv("COWIN_DISTRICTS", "395").split(",") if d]
+COWIN_DAYS = int(os.getenv("COWIN_DAYS", 7))
+COWIN_CONCURRENCY = int(os.getenv("COWIN_CONCURRENCY", 8))
+COWIN_RATE = float(os.getenv("COWIN_RATE", 0.3))  # requests per second; the public API allows ~100 per 5 minutes per IP
+COWIN_CACHE_DIR = os.getenv("COWIN_CACHE_DIR", str(Path(__file__).resolve().parent.parent / "cowin_cache"))
+SOURCE_NAME = "cowin"
+DATE_FORMAT = "%d-%m-%Y"
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across threads."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class ResponseCache:
+    """One JSON file per URL: {"etag", "last_modified", "body", "day", "fetched_at"}."""
+
+    def __init__(self, folder):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, url):
+        return self.folder / (hashlib.sha1(url.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, url):
+        try:
+            return json.loads(self._path(url).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def put(self, url, etag, last_modified, body, day):
+        path = self._path(url)
+        tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps({"etag": etag, "last_modified": last_modified, "body": body,
+                                   "day": day.isoformat(), "fetched_at": time.time()}), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def prune(self, today):
+        """Drop responses for weeks starting before `today`; their URLs will not be asked for again."""
+        removed = 0
+        for path in self.folder.glob("*.json"):
+            try:
+                day = json.loads(path.read_text(encoding="utf-8")).get("day") or ""
+            except (OSError, ValueError):
+                day = ""
+            if day < today.isoformat():
+                path.unlink(missing_ok=True)
+                removed += 1
+        return removed
+
+
+class CowinFetcher:
+    def __init__(self, api_url=COWIN_API_URL, cache_dir=COWIN_CACHE_DIR, concurrency=COWIN_CONCURRENCY, rate=COWIN_RATE):
+        self.api_url = api_url.rstrip("/")
+        self.cache = ResponseCache(cache_dir)
+        self.concurrency = concurrency
+        self.limiter = RateLimiter(rate)
+        self.max_retries = client_utils.HTTP_MAX_RETRIES
+        self.stats = {"requests": 0, "not_modified": 0, "retries": 0, "errors": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def fetch(self, district_id, day):
+        """Centres for one district and the week starting at `day` (cached body on 304)."""
+        url = (f"{self.api_url}/v2/appointment/sessions/public/calendarByDistrict"
+               f"?district_id={district_id}&date={day.strftime(DATE_FORMAT)}")
+        cached = self.cache.get(url)
+        if not (cached and isinstance(cached.get("body"), dict)):
+            cached = None  # nothing to fall back on, so never ask for a 304
+        resp = self._get(url, cached)
+        if resp.status_code == 304 and cached:
+            self._count("not_modified")
+            return cached["body"].get("centers", [])
+        if resp.status_code == 304:
+            resp = self._get(url, None)
+        resp.raise_for_status()
+        body = resp.json()
+        self.cache.put(url, resp.headers.get("ETag"), resp.headers.get("Last-Modified"), body, day)
+        return body.get("centers", [])
+
+    def _get(self, url, cached):
+        """
+        One paced request, retried on 429/5xx and connection errors here rather than in
+        client_utils so that every attempt waits for the rate limiter.
+        """
+        headers = {"Accept": "application/json"}
+        if cached and cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached and cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+        attempt = 0
+        while True:
+            self.limiter.wait()
+            self._count("requests")
+            resp = None
+            try:
+                resp = client_utils.get(url, headers=headers, endpoint="cowin.calendar", timeout=(5, 20), max_retries=0)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.max_retries:
+                    raise
+            if resp is not None and (resp.status_code not in client_utils.RETRY_STATUSES or attempt >= self.max_retries):
+                return resp
+            delay = client_utils.retry_delay(resp, attempt)
+            if delay > client_utils.HTTP_MAX_RETRY_DELAY and resp is not None:
+                return resp
+            time.sleep(min(delay, client_utils.HTTP_MAX_RETRY_DELAY))
+            attempt += 1
+            self._count("retries")
+
+    def fetch_districts(self, districts, days=COWIN_DAYS, start=None):
+        """{district_id: [centre dicts, one per centre and week] or None when any of its weeks failed}"""
+        start = start or date.today()
+        self.cache.prune(start)
+        weeks = [start + timedelta(days=7 * w) for w in range(max(1, -(-days // 7)))]
+        jobs = [(d, w) for d in districts for w in weeks]
+
+        def run(job):
+            try:
+                return job, self.fetch(*job)
+            except Exception as e:
+                self._count("errors")
+                print(f"CoWIN district {job[0]} week {job[1]} failed: {e}")
+                return job, None
+
+        results = {d: [] for d in districts}
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for (district_id, _), centers in pool.map(run, jobs):
+                if centers is None or results[district_id] is None:
+                    results[district_id] = None
+                else:
+                    results[district_id].extend(centers)
+        return results
+
+
+def _session_day(s):
+    try:
+        return datetime.strptime(s.get("date", ""), DATE_FORMAT).date()
+    except ValueError:
+        return None
+
+
+def build_items(centers_by_district, today=None):
+    """ingest_api_json_items items, one per centre with sessions from `today` on."""
+    today = today or date.today()
+    items = []
+    for district_id, centers in centers_by_district.items():
+        if centers is None:
+            continue
+        merged = {}
+        for center in centers:  # the same centre appears once per fetched week
+            entry = merged.setdefault(center.get("center_id"), {**center, "sessions": {}})
+            for s in center.get("sessions", []):
+                day = _session_day(s)
+                if day is not None and day >= today:
+                    entry["sessions"][s.get("session_id") or (s.get("date"), s.get("vaccine"))] = (day, s)
+        for center_id, center in merged.items():
+            sessions = sorted(center["sessions"].values(), key=lambda x: (x[0], str(x[1].get("vaccine"))))
+            if not sessions:
+                continue
+            text = f"Center: {center.get('name')}, address: {center.get('address')}. Sessions:"
+            for _, s in sessions:
+                text += f" Date {s.get('date')}, vaccine {s.get('vaccine')}, min_age {s.get('min_age_limit')}, available {s.get('available_capacity')}. "
+            items.append({
+                "id": f"{district_id}_{center_id}",
+                "text": text,
+                "meta": {"center_id": center_id, "district_id": district_id, "pincode": center.get("pincode"),
+                         "last_session": sessions[-1][0].isoformat()},
+            })
+    return items
+
+
+def expired_doc_ids(manifest_entries, items, centers_by_district):
+    """Centres of successfully fetched districts that no longer have upcoming sessions."""
+    current = {f"{SOURCE_NAME}_{item['id']}" for item in items}
+    fetched = {str(d) for d, centers in centers_by_district.items() if centers is not None}
+    expired = []
+    for doc_id in manifest_entries:
+        if doc_id in current:
+            continue
+        district, sep, _ = doc_id[len(SOURCE_NAME) + 1:].partition("_")
+        if not sep or district in fetched:  # no district in the id: written before per-district ids
+            expired.append(doc_id)
+    return expired
+
+
+def refresh(districts=COWIN_DISTRICTS, days=COWIN_DAYS, manifest=None, fetcher=None, dry_run=False, ingest=None):
+    """
+    Fetch, upsert changed centres and expire stale ones; returns {"items", "changed", "expired"}.
+    `ingest` is the ingest_all module (imported here when not given: that loads the embedder
+    and opens the vector store).
+    """
+    if ingest is None:
+        import ingest_all as ingest
+    ingest_all = ingest
+    fetcher = fetcher or CowinFetcher()
+    manifest = manifest or ingest_all.Manifest(ingest_all.MANIFEST_PATH)
+    started = time.perf_counter()
+    centers = fetcher.fetch_districts(districts, days)
+    items = build_items(centers)
+    print(f"CoWIN: {len(items)} centres from {len(districts)} districts in {time.perf_counter() - started:.1f}s "
+          f"({fetcher.stats})")
+    if not dry_run:
+        ingest_all.ensure_collection(len(ingest_all.embedder.encode("sample text")))
+    changed = ingest_all.ingest_api_json_items(items, source_name=SOURCE_NAME, manifest=manifest, dry_run=dry_run)
+    expired = expired_doc_ids(manifest.entries(SOURCE_NAME), items, centers)
+    print(f"CoWIN: {len(expired)} centres without upcoming sessions")
+    if expired and not dry_run:
+        stale = []
+        for doc_id in expired:
+            stale += ingest_all.stale_point_ids(SOURCE_NAME, doc_id, manifest.chunk_count(SOURCE_NAME, doc_id))
+            manifest.forget(SOURCE_NAME, doc_id)
+        ingest_all.delete_points(stale)
+        manifest.save()
+    return {"items": len(items), "changed": changed, "expired": len(expired)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh CoWIN sessions in the health_kb collection")
+    parser.add_argument("--districts", default=",".join(map(str, COWIN_DISTRICTS)))
+    parser.add_argument("--days", type=int, default=COWIN_DAYS)
+    parser.add_argument("--every", type=float, default=0, help="repeat every N seconds (0 = run once)")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    import ingest_all
+    from answer_cache import bump_kb_version
+    districts = [int(d) for d in args.districts.split(",") if d]
+    fetcher = CowinFetcher()
+    while True:
+        result = refresh(districts, args.days, fetcher=fetcher, dry_run=args.dry_run)
+        if not args.dry_run and (result["changed"] or result["expired"]):
+            ingest_all.bm25.save(ingest_all.BM25_INDEX_PATH)
+            print("KB version:", bump_kb_version())
+        if not args.every:
+            break
+        time.sleep(args.every)
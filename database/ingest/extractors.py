@@ -0,0 +1,97 @@
+# ingest/extractors.py
+# Kept free of the embedder/Qdrant imports so extraction worker processes stay light.
+# Every extractor is a generator of text pieces, so a file is never held in memory whole.
+import os
+from pathlib import Path
+import pandas as pd
+
+from utils import CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS, TOKENIZER_NAME, chunk_sentences, load_token_counter
+
+SUPPORTED_SUFFIXES = [".docx", ".pdf", ".txt", ".csv"]
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", 20000))
+CSV_COLUMNS = [c for c in os.getenv("CSV_COLUMNS", "").split(",") if c] or None  # None = all columns
+TXT_BLOCK_CHARS = 1 << 20
+DOCX_PARAGRAPHS_PER_PIECE = 200
+# Changing the tokenizer or chunk sizes changes every chunk; the manifest re-ingests on a new signature
+CHUNKER = f"sentences:{TOKENIZER_NAME}:{CHUNK_MAX_TOKENS}:{CHUNK_OVERLAP_TOKENS}"
+
+_token_counter = None
+
+def token_counter():
+    """The tokenizer is loaded once per (extraction worker) process."""
+    global _token_counter
+    if _token_counter is None:
+        _token_counter = load_token_counter(TOKENIZER_NAME)
+    return _token_counter
+
+def iter_text_from_file(path: Path):
+    if path.suffix.lower() == ".docx":
+        return iter_text_docx(path)
+    elif path.suffix.lower() == ".pdf":
+        return iter_text_pdf(path)
+    elif path.suffix.lower() == ".txt":
+        return iter_text_txt(path)
+    elif path.suffix.lower() == ".csv":
+        return iter_text_csv(path)
+    else:
+        return iter(())
+
+def iter_text_txt(path: Path):
+    with open(path, encoding='utf-8') as f:
+        # fixed-size blocks; chunk_sentences rejoins a sentence cut at a block edge
+        for block in iter(lambda: f.read(TXT_BLOCK_CHARS), ""):
+            yield block
+
+def iter_text_docx(path: Path):
+    from docx import Document
+    doc = Document(str(path))
+    paras = []
+    for para in doc.paragraphs:
+        paras.append(para.text)
+        if len(paras) >= DOCX_PARAGRAPHS_PER_PIECE:
+            yield "\n".join(paras) + "\n"
+            paras = []
+    if paras:
+        yield "\n".join(paras) + "\n"
+
+def iter_text_pdf(path: Path):
+    import fitz  # PyMuPDF
+    with fitz.open(str(path)) as doc:
+        for page in doc:
+            yield page.get_text("text") + "\n"
+
+def format_rows(df):
+    """'col: val, col: val' for every row, built column-wise instead of with iterrows()."""
+    cols = list(df.columns)
+    if not cols:
+        return []
+    text = f"{cols[0]}: " + df[cols[0]].astype(str)
+    for col in cols[1:]:
+        text = text + f", {col}: " + df[col].astype(str)
+    return text.tolist()
+
+def iter_text_csv(path: Path, columns=None, chunk_rows=None):
+    """
+    Streams the CSV CHUNK_ROWS rows at a time and yields each block of rows as text.
+    `columns` (or the CSV_COLUMNS env var) restricts which columns are read at all.
+    """
+    columns = columns or CSV_COLUMNS
+    for df in pd.read_csv(path, usecols=columns, chunksize=chunk_rows or CSV_CHUNK_ROWS):
+        yield "\n".join(format_rows(df)) + "\n"
+
+def iter_file_chunk_stream(path_str, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """Lazily chunk one file; memory stays flat regardless of file size. Extraction errors propagate."""
+    yield from chunk_sentences(
+        iter_text_from_file(Path(path_str)), token_counter(), max_tokens=max_tokens, overlap_tokens=overlap_tokens
+    )
+
+def extract_file_chunks(path_str):
+    """
+    Pipeline stage 1 (runs in a worker process): file -> cleaned chunks, or
+    (path, None) when extraction failed so the caller keeps the file due for a retry.
+    """
+    try:
+        return path_str, list(iter_file_chunk_stream(path_str))
+    except Exception as e:
+        print(f"Extraction failed for {path_str}: {e}")
+        return path_str, None
@@ -1,26 +1,47 @@
 # ingest/ingest_all.py
-import os, json, time
-from qdrant_client import QdrantClient
+import os, sys, json, time, threading, argparse, hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
 from qdrant_client.http.models import VectorParams, Distance
-from qdrant_client.models import PointStruct
-from sentence_transformers import SentenceTransformer
+from qdrant_client.models import PointStruct, PointIdsList
 from pathlib import Path
 from tqdm import tqdm
-import pandas as pd  # NEW
 
-from utils import clean_text, chunk_text
+from utils import clean_text, chunk_sentences
+from extractors import CHUNKER, SUPPORTED_SUFFIXES, extract_file_chunks, iter_file_chunk_stream, token_counter
+from manifest import Manifest, point_id
+import cowin
+
+# shared modules live at the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from answer_cache import bump_kb_version
+from embedder_utils import load_embedder
+from bm25_index import INDEX_PATH as BM25_INDEX_PATH, BM25Index
+from vector_store import open_vector_store
 
 # CONFIG
 QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
 COLLECTION_NAME = "health_kb"
-EMB_MODEL_NAME = "paraphrase-multilingual-MiniLM-L12-v2"  # multilingual small model
-BATCH_SIZE = 256
+EMB_MODEL_NAME = "paraphrase-multilingual-MiniLM-L12-v2"  # multilingual small model; EMBEDDER_BACKEND picks torch/onnx/onnx-int8
+BATCH_SIZE = 256  # points per Qdrant upsert
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 64))  # chunks per embedder.encode call
+# Spawn-based platforms (Windows/macOS) would re-import this script, model included, in every
+# worker process, so extraction only fans out by default where fork is available.
+EXTRACT_WORKERS = int(os.getenv("INGEST_EXTRACT_WORKERS", (os.cpu_count() or 1) if hasattr(os, "fork") else 1))
+UPSERT_WORKERS = int(os.getenv("INGEST_UPSERT_WORKERS", 2))
+QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", 8))  # files / upsert batches buffered between stages
+STREAM_FILE_BYTES = int(os.getenv("INGEST_STREAM_FILE_BYTES", 64 << 20))  # bigger files are chunked lazily in-process
+MANIFEST_PATH = os.getenv("INGEST_MANIFEST", str(Path(__file__).resolve().parent.parent / "ingest_manifest.json"))
 
-# connect qdrant
-client = QdrantClient(url=QDRANT_URL)
+# connect qdrant (or the local store under LOCAL_VECTOR_DIR when VECTOR_BACKEND=local)
+client = open_vector_store(url=QDRANT_URL)
 
 # init embedder
-embedder = SentenceTransformer(EMB_MODEL_NAME)
+embedder = load_embedder(EMB_MODEL_NAME)
+
+# keyword index over the same chunks, kept in step with every upsert/delete
+bm25 = BM25Index.load(BM25_INDEX_PATH) if os.path.exists(BM25_INDEX_PATH) else BM25Index()
 
 def ensure_collection(dim):
     if COLLECTION_NAME not in [c.name for c in client.get_collections().collections]:
@@ -29,126 +50,245 @@ def ensure_collection(dim):
             vectors_config=VectorParams(size=dim, distance=Distance.COSINE),
         )
 
-def ingest_docs_from_folder(folder_path, source_name="local_docs"):
+# ================== PIPELINE ==================
+# extraction (process pool) -> batched encoding (this thread) -> upserts (thread pool).
+# Each hand-off is bounded by QUEUE_SIZE so memory stays capped however big the corpus is.
+
+def iter_file_chunks(paths):
     """
-    Process .docx, .pdf, .txt, and .csv files in a folder and upsert into Qdrant
+    Stage 1: yield (path, chunks) in input order with at most QUEUE_SIZE files in flight.
+    Small files are extracted whole in the process pool; files over STREAM_FILE_BYTES are
+    yielded as a lazy chunk generator so they never sit in memory (or a pickle) in full.
     """
-    points_buffer = []
-    for p in Path(folder_path).rglob("*"):
-        if p.suffix.lower() in [".docx", ".pdf", ".txt", ".csv"]:
-            text = extract_text_from_file(p)
-            text = clean_text(text)
-            chunks = chunk_text(text, chunk_size=400, overlap=50)
-            for c_idx, chunk in enumerate(chunks):
-                metadata = {
-                    "source": source_name,
-                    "path": str(p),
-                    "doc_id": str(p.name),
-                    "chunk_id": c_idx,
-                }
-                vect = embedder.encode(chunk).tolist()
-                points_buffer.append(
-                    PointStruct(
-                        id=f"{p.name}__{c_idx}",
-                        vector=vect,
-                        payload={"text": chunk, **metadata}
-                    )
-                )
-                if len(points_buffer) >= BATCH_SIZE:
-                    client.upsert(collection_name=COLLECTION_NAME, points=points_buffer)
-                    points_buffer = []
-    if points_buffer:
-        client.upsert(collection_name=COLLECTION_NAME, points=points_buffer)
-    print("Ingested docs from folder:", folder_path)
-
-def extract_text_from_file(path: Path):
-    if path.suffix.lower() == ".docx":
-        return extract_text_docx(path)
-    elif path.suffix.lower() == ".pdf":
-        return extract_text_pdf(path)
-    elif path.suffix.lower() == ".txt":
-        return path.read_text(encoding='utf-8')
-    elif path.suffix.lower() == ".csv":
-        return extract_text_csv(path)
-    else:
-        return ""
-
-def extract_text_docx(path: Path):
-    from docx import Document
-    doc = Document(str(path))
-    return "\n".join([para.text for para in doc.paragraphs])
-
-def extract_text_pdf(path: Path):
-    import fitz  # PyMuPDF
-    doc = fitz.open(str(path))
-    return "\n".join([page.get_text("text") for page in doc])
-
-def extract_text_csv(path: Path):
+    if EXTRACT_WORKERS <= 1:
+        for p in paths:
+            yield str(p), iter_file_chunk_stream(str(p))
+        return
+    with ProcessPoolExecutor(max_workers=EXTRACT_WORKERS) as pool:
+        pending = deque()
+        for p in paths:
+            if p.stat().st_size > STREAM_FILE_BYTES:
+                while pending:
+                    yield pending.popleft().result()
+                yield str(p), iter_file_chunk_stream(str(p))
+                continue
+            pending.append(pool.submit(extract_file_chunks, str(p)))
+            if len(pending) >= QUEUE_SIZE:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def _batched(iterable, n):
+    it = iter(iterable)
+    while True:
+        batch = list(islice(it, n))
+        if not batch:
+            return
+        yield batch
+
+def encode_and_upsert(records):
     """
-    Reads CSV into DataFrame and returns rows as text.
-    You can customize to select only certain columns if needed.
+    Stages 2 and 3. `records` yields (point id, text, payload); texts are encoded
+    EMBED_BATCH_SIZE at a time and upserted in BATCH_SIZE groups on background threads
+    while the next batch is being encoded. Returns the number of points written.
     """
-    try:
-        df = pd.read_csv(path)
-        texts = []
-        for i, row in df.iterrows():
-            row_text = ", ".join([f"{col}: {val}" for col, val in row.items()])
-            texts.append(row_text)
-        return "\n".join(texts)
-    except Exception as e:
-        print(f"CSV extraction failed for {path}: {e}")
-        return ""
-
-def ingest_api_json_items(items, source_name="api_source", id_prefix="api"):
+    slots = threading.BoundedSemaphore(QUEUE_SIZE)
+    futures = []
     points = []
-    for i, item in enumerate(items):
-        text = item.get("text") or json.dumps(item)
-        text = clean_text(text)
-        chunks = chunk_text(text, chunk_size=400, overlap=50)
-        for ci, chunk in enumerate(chunks):
-            payload = {"source": source_name, "doc_id": f"{source_name}_{i}", "chunk_id": ci, **item.get("meta", {})}
-            vect = embedder.encode(chunk).tolist()
-            points.append(
-                PointStruct(
-                    id=f"{source_name}_{i}__{ci}",
-                    vector=vect,
-                    payload={"text": chunk, **payload}
-                )
-            )
+    total = 0
+
+    def flush(pts):
+        slots.acquire()  # backpressure: wait while QUEUE_SIZE upserts are already pending
+        fut = upserts.submit(client.upsert, collection_name=COLLECTION_NAME, points=pts)
+        fut.add_done_callback(lambda _: slots.release())
+        futures.append(fut)
+
+    with ThreadPoolExecutor(max_workers=UPSERT_WORKERS) as upserts:
+        for batch in _batched(records, EMBED_BATCH_SIZE):
+            vectors = embedder.encode([text for _, text, _ in batch], batch_size=EMBED_BATCH_SIZE)
+            for (pid, text, payload), vect in zip(batch, vectors):
+                points.append(PointStruct(id=pid, vector=vect.tolist(), payload={"text": text, **payload}))
+                bm25.add(pid, text, payload)
+            total += len(batch)
             if len(points) >= BATCH_SIZE:
-                client.upsert(collection_name=COLLECTION_NAME, points=points)
+                flush(points)
                 points = []
-    if points:
-        client.upsert(collection_name=COLLECTION_NAME, points=points)
-
-import requests
-def fetch_cowin_district_sessions(district_id, date):
-    url = f"https://cdn-api.co-vin.in/api/v2/appointment/sessions/public/calendarByDistrict?district_id={district_id}&date={date}"
-    resp = requests.get(url, timeout=10)
-    data = resp.json()
-    items = []
-    for center in data.get("centers", []):
-        text = f"Center: {center.get('name')}, address: {center.get('address')}. Sessions:"
-        for s in center.get("sessions", []):
-            text += f" Date {s.get('date')}, vaccine {s.get('vaccine')}, min_age {s.get('min_age_limit')}, available {s.get('available_capacity')}. "
-        items.append({"text": text, "meta": {"center_id": center.get("center_id"), "district_id": district_id}})
-    return items
+        if points:
+            flush(points)
+    for fut in futures:
+        fut.result()  # re-raise any upsert error
+    return total
+
+def delete_points(ids):
+    ids = list(ids)
+    for pid in ids:
+        bm25.remove(pid)
+    for batch in _batched(ids, BATCH_SIZE):
+        client.delete(collection_name=COLLECTION_NAME, points_selector=PointIdsList(points=batch))
+    return len(ids)
+
+def rebuild_bm25_from_qdrant(page_size=1000):
+    """Rebuild the BM25 index from every chunk already stored in the collection."""
+    global bm25
+    bm25 = BM25Index()
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=COLLECTION_NAME, limit=page_size, offset=offset, with_payload=True, with_vectors=False
+        )
+        for p in points:
+            bm25.add(str(p.id), p.payload.get("text", ""), p.payload)
+        if offset is None:
+            break
+    print(f"Rebuilt BM25 index with {len(bm25)} chunks")
+
+def stale_point_ids(source_name, doc_id, old_chunks, new_chunks=0):
+    """Ids of chunks a document had before but no longer has (deleted or shrunk)."""
+    return [point_id(source_name, doc_id, i) for i in range(new_chunks, old_chunks)]
+
+def ingest_docs_from_folder(folder_path, source_name="local_docs", manifest=None, dry_run=False):
+    """
+    Process .docx, .pdf, .txt, and .csv files in a folder and upsert into Qdrant.
+    With a manifest only new or changed files are re-embedded, and chunks of deleted
+    or shrunk files are removed. dry_run only reports what would change.
+    """
+    folder = Path(folder_path)
+    paths = sorted(p for p in folder.rglob("*") if p.suffix.lower() in SUPPORTED_SUFFIXES)
+    manifest = manifest or Manifest(MANIFEST_PATH)
+    plan = manifest.plan(folder, paths, source_name, chunker=CHUNKER)
+    print(
+        f"{source_name}: {len(plan['new'])} new, {len(plan['changed'])} changed, "
+        f"{len(plan['unchanged'])} unchanged, {len(plan['deleted'])} deleted"
+    )
+    if dry_run:
+        for kind in ("new", "changed", "deleted"):
+            for doc_id in plan[kind]:
+                print(f"  {kind:<8} {doc_id}")
+        return plan
+
+    todo = [folder / doc_id for doc_id in plan["new"] + plan["changed"]]
+    chunk_counts = {}
+    failed = {}  # doc_id -> chunks written before extraction failed
+
+    def records():
+        for path_str, chunks in tqdm(iter_file_chunks(todo), total=len(todo), desc="files"):
+            p = Path(path_str)
+            doc_id = p.relative_to(folder).as_posix()
+            n = 0
+            if chunks is None:  # failed in an extraction worker
+                failed[doc_id] = 0
+                continue
+            try:
+                for c_idx, chunk in enumerate(chunks):
+                    metadata = {
+                        "source": source_name,
+                        "path": str(p),
+                        "doc_id": doc_id,
+                        "chunk_id": c_idx,
+                    }
+                    n = c_idx + 1
+                    yield point_id(source_name, doc_id, c_idx), chunk, metadata
+            except Exception as e:
+                # a lazily chunked file can fail part-way; keep its old points and retry next run
+                print(f"Extraction failed for {path_str}: {e}")
+                failed[doc_id] = n
+                continue
+            chunk_counts[doc_id] = n
+
+    total = encode_and_upsert(records())
+
+    stale = []
+    for doc_id, n in chunk_counts.items():
+        stale += stale_point_ids(source_name, doc_id, manifest.chunk_count(source_name, doc_id), n)
+        manifest.record(source_name, doc_id, *plan["stats"][doc_id], chunks=n, chunker=CHUNKER)
+    for doc_id, n in failed.items():
+        manifest.mark_failed(source_name, doc_id, n)
+    for doc_id in plan["deleted"]:
+        stale += stale_point_ids(source_name, doc_id, manifest.chunk_count(source_name, doc_id))
+        manifest.forget(source_name, doc_id)
+    removed = delete_points(stale)
+    manifest.save()
+    print(f"Ingested {total} chunks, removed {removed} stale chunks from folder:", folder_path)
+    if failed:
+        print(f"{len(failed)} files failed and will be retried on the next run: {', '.join(sorted(failed))}")
+    return plan
+
+def ingest_api_json_items(items, source_name="api_source", id_prefix="api", manifest=None, dry_run=False):
+    """
+    Items are {"text", "meta", optional "id"}; the id (falling back to the list index)
+    keeps point ids stable between runs. Items whose text has not changed are skipped.
+    """
+    manifest = manifest or Manifest(MANIFEST_PATH)
+    todo = []
+    for i, item in enumerate(items):
+        doc_id = f"{source_name}_{item.get('id', i)}"
+        text = clean_text(item.get("text") or json.dumps(item))
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        entry = manifest.entries(source_name).get(doc_id, {})
+        if entry.get("sha256") != digest or entry.get("chunker") != CHUNKER:
+            todo.append((doc_id, text, digest, item.get("meta", {})))
+    print(f"{source_name}: {len(todo)} of {len(items)} items new or changed")
+    if dry_run:
+        return len(todo)
+
+    chunk_counts = {}
+
+    def records():
+        for doc_id, text, _, meta in todo:
+            chunks = list(chunk_sentences([text], token_counter()))
+            chunk_counts[doc_id] = len(chunks)
+            for ci, chunk in enumerate(chunks):
+                payload = {"source": source_name, "doc_id": doc_id, "chunk_id": ci, **meta}
+                yield point_id(source_name, doc_id, ci), chunk, payload
+
+    total = encode_and_upsert(records())
+    stale = []
+    for doc_id, _, digest, _ in todo:
+        n = chunk_counts.get(doc_id, 0)
+        stale += stale_point_ids(source_name, doc_id, manifest.chunk_count(source_name, doc_id), n)
+        manifest.record(source_name, doc_id, None, None, digest, chunks=n, chunker=CHUNKER)
+    delete_points(stale)
+    manifest.save()
+    return total
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest documents and API data into the health_kb collection")
+    parser.add_argument("--docs", default="../data/docs", help="folder with .pdf/.docx/.txt/.csv files")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be added, changed or removed")
+    parser.add_argument("--full", action="store_true", help="ignore the manifest and re-embed everything")
+    parser.add_argument("--rebuild-bm25", action="store_true", help="rebuild the keyword index from Qdrant first")
+    parser.add_argument("--no-cowin", action="store_true", help="skip the CoWIN refresh")
+    args = parser.parse_args()
+
+    manifest = Manifest(MANIFEST_PATH)
+    if args.full:
+        # re-embed everything, but keep the old chunk counts so removed documents are still deleted
+        manifest.invalidate()
+
     # 0) ensure Qdrant collection set up with correct dim
-    sample = embedder.encode("sample text")
-    dim = len(sample)
-    ensure_collection(dim)
+    if not args.dry_run:
+        sample = embedder.encode("sample text")
+        dim = len(sample)
+        ensure_collection(dim)
+        if args.rebuild_bm25:
+            rebuild_bm25_from_qdrant()
 
     # 1) ingest local docs folder
-    docs_folder = "../data/docs"   # put your .pdf/.docx/.txt/.csv files here
-    ingest_docs_from_folder(docs_folder, source_name="local_docs")
+    docs_folder = args.docs   # put your .pdf/.docx/.txt/.csv files here
+    ingest_docs_from_folder(docs_folder, source_name="local_docs", manifest=manifest, dry_run=args.dry_run)
+
+    # 2) CoWIN sessions for COWIN_DISTRICTS over the next COWIN_DAYS days (see cowin.py)
+    if not args.no_cowin:
+        try:
+            cowin.refresh(manifest=manifest, dry_run=args.dry_run, ingest=sys.modules[__name__])
+        except Exception as e:
+            print("CoWIN fetch failed:", e)
+
+    if args.dry_run:
+        sys.exit(0)
 
-    # 2) ingest CoWIN example
-    try:
-        cowin_items = fetch_cowin_district_sessions(district_id=395, date="10-09-2025")
-        ingest_api_json_items(cowin_items, source_name="cowin")
-    except Exception as e:
-        print("CoWIN fetch failed:", e)
+    bm25.save(BM25_INDEX_PATH)
 
+    # 3) tell the app its cached answers are stale
+    print("KB version:", bump_kb_version())
     print("Ingestion complete")
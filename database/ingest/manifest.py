@@ -0,0 +1,109 @@
+# ingest/manifest.py
+# Remembers what was ingested so re-runs only touch new, changed or deleted files.
+import hashlib
+import json
+import os
+import uuid
+from pathlib import Path
+
+# Fixed namespace so the same (source, document, chunk) always maps to the same Qdrant point
+POINT_NAMESPACE = uuid.UUID("6f1c8d4e-2b7a-5c3e-9a41-0d5e8b7f2c19")
+
+
+def point_id(source_name, doc_id, chunk_idx):
+    """Deterministic UUIDv5 point id; Qdrant only accepts unsigned ints or UUIDs."""
+    return str(uuid.uuid5(POINT_NAMESPACE, f"{source_name}/{doc_id}#{chunk_idx}"))
+
+
+def file_sha256(path, block_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class Manifest:
+    """
+    JSON file of {source: {doc_id: {"size", "mtime", "sha256", "chunks", "chunker"}}}.
+    doc_id is the file path relative to the ingested folder; "chunker" is the chunking
+    configuration the document was split with.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        try:
+            self.data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            self.data = {}
+
+    def entries(self, source_name):
+        return self.data.setdefault(source_name, {})
+
+    def plan(self, folder, paths, source_name, chunker=None):
+        """
+        Compare files on disk with the manifest. Returns a dict with lists under
+        "new", "changed", "unchanged" (doc_ids) and "deleted" (doc_ids), plus
+        "stats" {doc_id: (size, mtime, sha256)} for every file that must be ingested.
+        Size+mtime matches are trusted; otherwise the content hash decides. Documents
+        chunked under a different `chunker` signature count as changed.
+        """
+        known = self.entries(source_name)
+        plan = {"new": [], "changed": [], "unchanged": [], "deleted": [], "stats": {}}
+        seen = set()
+        for p in paths:
+            doc_id = p.relative_to(folder).as_posix()
+            seen.add(doc_id)
+            st = p.stat()
+            entry = known.get(doc_id)
+            if entry and chunker and entry.get("chunker") != chunker:
+                plan["changed"].append(doc_id)
+                plan["stats"][doc_id] = (st.st_size, st.st_mtime, file_sha256(p))
+                continue
+            if entry and entry["size"] == st.st_size and entry["mtime"] == st.st_mtime:
+                plan["unchanged"].append(doc_id)
+                continue
+            digest = file_sha256(p)
+            if entry and entry["sha256"] == digest:
+                # Touched but identical: just remember the new mtime
+                entry["mtime"] = st.st_mtime
+                plan["unchanged"].append(doc_id)
+                continue
+            plan["changed" if entry else "new"].append(doc_id)
+            plan["stats"][doc_id] = (st.st_size, st.st_mtime, digest)
+        plan["deleted"] = [doc_id for doc_id in known if doc_id not in seen]
+        return plan
+
+    def record(self, source_name, doc_id, size, mtime, sha256, chunks, chunker=None):
+        self.entries(source_name)[doc_id] = {
+            "size": size, "mtime": mtime, "sha256": sha256, "chunks": chunks, "chunker": chunker,
+        }
+
+    def mark_failed(self, source_name, doc_id, chunks):
+        """
+        A document whose ingest failed stays due for the next run (its size, mtime and hash
+        are left alone) but remembers the chunk points it may already have written, so they
+        are still removed if it shrinks or disappears.
+        """
+        entry = self.entries(source_name).setdefault(
+            doc_id, {"size": None, "mtime": None, "sha256": None, "chunks": 0, "chunker": None})
+        entry["chunks"] = max(entry.get("chunks", 0), chunks)
+
+    def invalidate(self):
+        """Make every document due for re-ingest while keeping its chunk count (used by --full)."""
+        for entries in self.data.values():
+            for entry in entries.values():
+                entry["chunker"] = None
+
+    def forget(self, source_name, doc_id):
+        self.entries(source_name).pop(doc_id, None)
+
+    def chunk_count(self, source_name, doc_id):
+        return self.entries(source_name).get(doc_id, {}).get("chunks", 0)
+
+    def save(self):
+        """Atomic replace so an interrupted run never leaves a half-written manifest."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(json.dumps(self.data, indent=1, sort_keys=True), encoding="utf-8")
+        os.replace(tmp, self.path)
@@ -1,11 +1,15 @@
 # ingest/query_demo.py
-from qdrant_client import QdrantClient
-from sentence_transformers import SentenceTransformer
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from embedder_utils import load_embedder
+from vector_store import open_vector_store
 
 QDRANT_URL = "http://localhost:6333"
 COLLECTION_NAME = "health_kb"
-client = QdrantClient(url=QDRANT_URL)
-embedder = SentenceTransformer("paraphrase-multilingual-MiniLM-L12-v2")
+client = open_vector_store(url=QDRANT_URL)
+embedder = load_embedder("paraphrase-multilingual-MiniLM-L12-v2")
 
 def answer_query_gemini_ready(question, top_k=4):
     q_vec = embedder.encode(question).tolist()
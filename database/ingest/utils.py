@@ -1,6 +1,15 @@
 # ingest/utils.py
+import os
 import re
-from typing import List
+from collections import deque
+from typing import Callable, Iterable, Iterator, List, Tuple
+
+# Chunks are measured with the embedding model's own tokenizer; MiniLM truncates at 128
+# tokens (CLS and SEP included), so anything past that never reaches the embedding.
+TOKENIZER_NAME = os.getenv("EMB_MODEL_NAME", "paraphrase-multilingual-MiniLM-L12-v2")
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", 128))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", 24))
+SPECIAL_TOKENS = 2  # [CLS] ... [SEP] / <s> ... </s>
 
 def clean_text(text: str) -> str:
     # Normalize whitespace, remove weird control chars
@@ -23,3 +32,131 @@ def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50) -> List[str]
         chunks.append(chunk)
         i = j - overlap
     return [clean_text(c) for c in chunks if len(c.strip()) > 0]
+
+_LAST_WORD = re.compile(r"\S+$")
+
+def chunk_stream(pieces: Iterable[str], chunk_size: int = 500, overlap: int = 50) -> Iterator[str]:
+    """
+    Streaming chunk_text: consumes text pieces (pages, CSV blocks, file blocks) and yields
+    the same chunks chunk_text would produce for their concatenation, holding at most
+    one piece plus one chunk of words in memory. A piece that does not end in whitespace
+    is assumed to have cut a word in half, which is glued onto the next piece.
+    """
+    words = []
+    carry = ""
+    step = chunk_size - overlap
+    for piece in pieces:
+        piece = carry + piece
+        carry = ""
+        if piece and not piece[-1].isspace():
+            m = _LAST_WORD.search(piece)
+            piece, carry = piece[:m.start()], m.group()
+        words.extend(clean_text(piece).split())
+        while len(words) >= chunk_size:
+            yield " ".join(words[:chunk_size])
+            words = words[step:]
+    words.extend(carry.split())
+    # Same tail behaviour as chunk_text: keep stepping until the window start passes the end
+    while words:
+        yield " ".join(words[:chunk_size])
+        if len(words) <= step:
+            break
+        words = words[step:]
+
+# ================== TOKEN-AWARE CHUNKING ==================
+# Sentence ends: ., !, ? followed by whitespace, or the Devanagari danda / double danda
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+|(?<=[\u0964\u0965])\s*")
+# Unfinished text longer than this many characters per token of budget is cut at a line break
+CARRY_CHARS_PER_TOKEN = 8
+
+def load_token_counter(model_name: str = None) -> Callable[[str], int]:
+    """Token count (without special tokens) under the embedder's tokenizer; only the tokenizer is loaded."""
+    from transformers import AutoTokenizer
+    name = model_name or TOKENIZER_NAME
+    if "/" not in name and not os.path.isdir(name):
+        name = f"sentence-transformers/{name}"
+    tokenizer = AutoTokenizer.from_pretrained(name)
+
+    def count(text: str) -> int:
+        return len(tokenizer(text, add_special_tokens=False)["input_ids"])
+    return count
+
+def _units(sentence: str, budget: int, count: Callable[[str], int]) -> Iterator[Tuple[str, int]]:
+    """
+    (text, tokens) pieces of one raw sentence, each within budget. Over-long sentences
+    (tables, CSV rows, PDFs without punctuation) fall back to lines, then to words.
+    """
+    text = clean_text(sentence)
+    if not text:
+        return
+    n = count(text)
+    if n <= budget:
+        yield text, n
+        return
+    lines = sentence.splitlines() if "\n" in sentence.strip() else [sentence]
+    for line in lines:
+        line = clean_text(line)
+        if not line:
+            continue
+        n = count(line) if len(lines) > 1 else None
+        if n is not None and n <= budget:
+            yield line, n
+            continue
+        words, used = [], 0
+        for word in line.split():
+            wn = count(word)
+            if words and used + wn > budget:
+                yield " ".join(words), used
+                words, used = [], 0
+            words.append(word)
+            used += wn
+        if words:
+            yield " ".join(words), used
+
+def chunk_sentences(pieces: Iterable[str], count_tokens: Callable[[str], int],
+                    max_tokens: int = CHUNK_MAX_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> Iterator[str]:
+    """
+    Single pass over text pieces that packs whole sentences into chunks of at most
+    `max_tokens` model tokens (special tokens included). Consecutive chunks share up to
+    `overlap_tokens` worth of trailing sentences. Every sentence is cleaned and tokenized
+    once; a sentence cut at a piece boundary is carried over to the next piece.
+    """
+    budget = max_tokens - SPECIAL_TOKENS
+    overlap_tokens = min(overlap_tokens, budget // 2)
+    carry_limit = budget * CARRY_CHARS_PER_TOKEN
+    window = deque()  # (text, tokens) in the chunk being built
+    used = 0
+
+    def units(sentences):
+        for sentence in sentences:
+            yield from _units(sentence, budget, count_tokens)
+
+    def sentences():
+        carry = ""
+        for piece in pieces:
+            parts = SENTENCE_END.split(carry + piece)
+            carry = parts.pop()  # may continue in the next piece
+            yield from parts
+            if len(carry) > carry_limit:
+                # no sentence end in sight (CSV rows, tables, unpunctuated pages): hand over
+                # everything up to the last line break, or the last space, so carry stays bounded
+                cut = carry.rfind("\n") + 1 or carry.rfind(" ") + 1
+                if cut:
+                    yield carry[:cut]
+                    carry = carry[cut:]
+        yield carry
+
+    for text, n in units(sentences()):
+        if window and used + n > budget:
+            yield " ".join(t for t, _ in window)
+            # keep the tail as overlap, as long as it leaves room for the new unit
+            kept, kept_tokens = deque(), 0
+            while window and kept_tokens + window[-1][1] <= overlap_tokens and kept_tokens + window[-1][1] + n <= budget:
+                t = window.pop()
+                kept.appendleft(t)
+                kept_tokens += t[1]
+            window, used = kept, kept_tokens
+        window.append((text, n))
+        used += n
+    if window:
+        yield " ".join(t for t, _ in window)
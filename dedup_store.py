@@ -0,0 +1,82 @@
+import logging
+import time
+
+from sqlite_utils import ThreadLocalConnection
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS seen_messages (
+    msg_id TEXT PRIMARY KEY,
+    state TEXT NOT NULL,             -- processing | done
+    first_seen REAL NOT NULL,
+    expires_at REAL NOT NULL,        -- processing lease, then the dedup window once done
+    duplicates INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_seen_expires ON seen_messages (expires_at);
+"""
+
+
+class MessageDedup:
+    """
+    WhatsApp message ids seen in the last `ttl` seconds, in SQLite so every gunicorn
+    worker on the host shares them. claim() is atomic: of several concurrent deliveries
+    of the same id exactly one gets True. An id that is still being processed after
+    `processing_ttl` (its worker died) can be claimed again.
+    """
+
+    def __init__(self, path, ttl=24 * 3600, processing_ttl=600, purge_every=1000):
+        self.path = path
+        self.ttl = ttl
+        self.processing_ttl = processing_ttl
+        self.purge_every = purge_every
+        self._claims = 0
+        self._conn = ThreadLocalConnection(path)
+        self._conn().executescript(SCHEMA)
+
+    def claim(self, msg_id, now=None):
+        """
+        Returns None when the caller should process the message, otherwise the state of
+        the earlier delivery ("processing" or "done") so the duplicate can be dropped.
+        """
+        now = now or time.time()
+        conn = self._conn()
+        cur = conn.execute(
+            "INSERT INTO seen_messages (msg_id, state, first_seen, expires_at) VALUES (?, 'processing', ?, ?)"
+            " ON CONFLICT (msg_id) DO UPDATE SET state = 'processing', first_seen = excluded.first_seen,"
+            " expires_at = excluded.expires_at, duplicates = 0"
+            " WHERE seen_messages.expires_at < excluded.first_seen",
+            (msg_id, now, now + self.processing_ttl),
+        )
+        self._claims += 1
+        if self._claims % self.purge_every == 0:
+            self.purge(now)
+        if cur.rowcount:
+            return None
+        conn.execute("UPDATE seen_messages SET duplicates = duplicates + 1 WHERE msg_id = ?", (msg_id,))
+        row = conn.execute("SELECT state FROM seen_messages WHERE msg_id = ?", (msg_id,)).fetchone()
+        return row[0] if row else "done"
+
+    def finish(self, msg_id, now=None):
+        """Processing is over; drop redeliveries for the rest of the dedup window."""
+        now = now or time.time()
+        self._conn().execute(
+            "UPDATE seen_messages SET state = 'done', expires_at = ? WHERE msg_id = ?", (now + self.ttl, msg_id)
+        )
+
+    def release(self, msg_id):
+        """Forget a claim that was never processed (e.g. the queue was full), so a redelivery is handled."""
+        self._conn().execute("DELETE FROM seen_messages WHERE msg_id = ? AND state = 'processing'", (msg_id,))
+
+    def purge(self, now=None):
+        now = now or time.time()
+        removed = self._conn().execute("DELETE FROM seen_messages WHERE expires_at < ?", (now,)).rowcount
+        if removed:
+            logger.info("Purged %d expired message ids", removed)
+        return removed
+
+    def stats(self):
+        row = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(duplicates), 0), COALESCE(SUM(duplicates > 0), 0) FROM seen_messages"
+        ).fetchone()
+        return {"tracked": row[0], "duplicates": row[1], "duplicated_messages": row[2]}
@@ -0,0 +1,84 @@
+"""
+Embedding model loader shared by the app and the ingest scripts.
+
+EMBEDDER_BACKEND selects how paraphrase-multilingual-MiniLM-L12-v2 runs on CPU:
+  torch      the original full-precision PyTorch model (reference)
+  onnx       ONNX Runtime export of the same weights
+  onnx-int8  dynamically int8-quantized ONNX model
+All three return a SentenceTransformer, so callers keep using .encode().
+EMBEDDER_THREADS caps the intra-op threads of whichever backend is used.
+The ONNX backends need the extra `pip install "sentence-transformers[onnx]"`.
+"""
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EMB_MODEL_NAME = os.getenv("EMB_MODEL_NAME", "paraphrase-multilingual-MiniLM-L12-v2")
+EMBEDDER_BACKEND = os.getenv("EMBEDDER_BACKEND", "torch")
+EMBEDDER_THREADS = int(os.getenv("EMBEDDER_THREADS", 0))  # 0 = library default
+EMBEDDER_CACHE_DIR = os.getenv("EMBEDDER_CACHE_DIR", str(Path(__file__).resolve().parent / "models"))
+QUANT_CONFIG = os.getenv("EMBEDDER_QUANT_CONFIG", "avx2")  # avx2 | avx512 | avx512_vnni | arm64
+BACKENDS = ("torch", "onnx", "onnx-int8")
+# Quantization may move vectors a little; anything below this vs torch fails check_tolerance()
+COSINE_TOLERANCE = float(os.getenv("EMBEDDER_COSINE_TOLERANCE", 0.98))
+
+
+def _onnx_session_options(threads):
+    import onnxruntime
+    opts = onnxruntime.SessionOptions()
+    if threads:
+        opts.intra_op_num_threads = threads
+        opts.inter_op_num_threads = 1
+    return opts
+
+
+def load_embedder(model_name=None, backend=None, threads=None):
+    from sentence_transformers import SentenceTransformer
+
+    model_name = model_name or EMB_MODEL_NAME
+    backend = backend or EMBEDDER_BACKEND
+    threads = EMBEDDER_THREADS if threads is None else threads
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown EMBEDDER_BACKEND {backend!r}, expected one of {BACKENDS}")
+
+    if backend == "torch":
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        return SentenceTransformer(model_name)
+
+    model_kwargs = {"session_options": _onnx_session_options(threads), "provider": "CPUExecutionProvider"}
+    if backend == "onnx":
+        return SentenceTransformer(model_name, backend="onnx", model_kwargs=model_kwargs)
+
+    # onnx-int8: quantize the ONNX export once and keep it under EMBEDDER_CACHE_DIR
+    quant_dir = Path(EMBEDDER_CACHE_DIR) / f"{model_name.replace('/', '__')}-onnx"
+    quant_file = f"onnx/model_qint8_{QUANT_CONFIG}.onnx"
+    if not (quant_dir / quant_file).exists():
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+        logger.info("Quantizing %s to int8 (%s) in %s", model_name, QUANT_CONFIG, quant_dir)
+        base = SentenceTransformer(model_name, backend="onnx")
+        base.save_pretrained(str(quant_dir))
+        export_dynamic_quantized_onnx_model(base, QUANT_CONFIG, str(quant_dir))
+    return SentenceTransformer(
+        str(quant_dir), backend="onnx", model_kwargs={**model_kwargs, "file_name": quant_file}
+    )
+
+
+def cosine_agreement(reference, candidate, texts, batch_size=32):
+    """Per-text cosine similarity between two embedders' vectors for the same inputs."""
+    a = np.asarray(reference.encode(texts, batch_size=batch_size, normalize_embeddings=True))
+    b = np.asarray(candidate.encode(texts, batch_size=batch_size, normalize_embeddings=True))
+    return np.sum(a * b, axis=1)
+
+
+def check_tolerance(reference, candidate, texts, tolerance=None):
+    """True when every vector of `candidate` is within `tolerance` cosine of the reference."""
+    tolerance = COSINE_TOLERANCE if tolerance is None else tolerance
+    sims = cosine_agreement(reference, candidate, texts)
+    logger.info("Cosine vs reference: min %.4f mean %.4f", sims.min(), sims.mean())
+    return bool(sims.min() >= tolerance), sims
@@ -0,0 +1,15 @@
+# gunicorn.conf.py - picked up automatically by `gunicorn app:app` from this directory
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+workers = int(os.getenv("GUNICORN_WORKERS", 2))
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+# GUNICORN_PRELOAD=1 imports the app once in the master; with PRELOAD_MODELS=1 the
+# embedding model is loaded there too and shared copy-on-write by the forked workers.
+preload_app = os.getenv("GUNICORN_PRELOAD") == "1"
+
+
+def post_worker_init(worker):
+    # Background threads must be started after the fork, in each worker
+    import app
+    app.start_background_services()
@@ -0,0 +1,80 @@
+"""
+In-process intent routing with the already-loaded sentence embedder. Each intent is the
+normalized mean (centroid) of its Dialogflow training phrases; a message goes to the
+nearest centroid when the similarity clears `threshold` and beats the runner-up by
+`margin`. Only intents the app fulfils itself are answered locally; anything else, and
+anything uncertain, still goes to Dialogflow.
+
+Training phrases come from a Dialogflow ES agent export (the zip, or its unpacked
+directory: intents/<Name>_usersays_<lang>.json) or from a JSON file {intent: [phrases]}.
+"""
+import json
+import logging
+import zipfile
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+USERSAYS_SUFFIX = "_usersays_{lang}.json"
+
+
+def _phrases_from_usersays(data):
+    return ["".join(part.get("text", "") for part in item.get("data", [])).strip() for item in data]
+
+
+def load_training_phrases(path, lang="en"):
+    """{intent display name: [training phrases]} from an agent export or a JSON file."""
+    path = Path(path)
+    suffix = USERSAYS_SUFFIX.format(lang=lang)
+    files = {}
+    if path.suffix == ".zip":
+        with zipfile.ZipFile(path) as zf:
+            for name in zf.namelist():
+                if name.endswith(suffix):
+                    files[Path(name).name[:-len(suffix)]] = json.loads(zf.read(name).decode("utf-8"))
+    elif path.is_dir():
+        folder = path / "intents" if (path / "intents").is_dir() else path
+        for p in folder.glob(f"*{suffix}"):
+            files[p.name[:-len(suffix)]] = json.loads(p.read_text(encoding="utf-8"))
+    else:
+        return {k: [p for p in v if p] for k, v in json.loads(path.read_text(encoding="utf-8")).items()}
+    return {intent: [p for p in _phrases_from_usersays(data) if p] for intent, data in files.items()}
+
+
+def _normalize(m):
+    m = np.asarray(m, dtype=np.float32)
+    norms = np.linalg.norm(m, axis=-1, keepdims=True)
+    return m / np.where(norms == 0, 1, norms)
+
+
+class IntentRouter:
+    def __init__(self, embedder, phrases, threshold=0.5, margin=0.1, local_intents=()):
+        self.embedder = embedder
+        self.threshold = threshold
+        self.margin = margin
+        self.local_intents = set(local_intents)
+        self.intents = sorted(i for i, p in phrases.items() if p)
+        if len(self.intents) < 2:
+            raise ValueError("IntentRouter needs training phrases for at least two intents")
+        centroids = []
+        for intent in self.intents:
+            vectors = _normalize(embedder.encode(phrases[intent], batch_size=64))
+            centroids.append(vectors.mean(axis=0))
+        self.centroids = _normalize(np.stack(centroids))
+        logger.info("Intent router built from %d phrases over %d intents",
+                    sum(len(phrases[i]) for i in self.intents), len(self.intents))
+
+    def predict(self, q_vec):
+        """(intent, similarity, margin over the runner-up) of the nearest centroid."""
+        scores = self.centroids @ _normalize(q_vec)
+        second, best = np.argsort(scores)[-2:]
+        return self.intents[best], float(scores[best]), float(scores[best] - scores[second])
+
+    def route(self, q_vec):
+        """The intent to fulfil locally, or None when Dialogflow should decide."""
+        intent, score, margin = self.predict(q_vec)
+        if intent in self.local_intents and score >= self.threshold and margin >= self.margin:
+            return intent
+        return None
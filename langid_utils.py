@@ -0,0 +1,150 @@
+"""
+Offline language identification for incoming messages.
+
+Native-script text is decided by Unicode block counts, plus a few marker words for
+Devanagari. Latin-script text is either English or romanized Hindi (Hinglish); a small
+character trigram model trained on the seed text below separates the two. Every result carries a confidence in [0, 1] so the
+caller can fall back to the Google API when the local guess is weak.
+"""
+import math
+import re
+from collections import Counter
+
+# Unicode block -> language code. Devanagari is shared with Marathi/Nepali, Bengali script
+# with Assamese and Arabic script with Kashmiri/Sindhi/Persian, so those blocks alone only
+# give a confidence below translate_utils.LOCAL_LANGID_THRESHOLD and Google decides.
+SCRIPT_RANGES = [
+    (0x0900, 0x097F, "hi"),  # Devanagari
+    (0x0980, 0x09FF, "bn"),  # Bengali / Assamese
+    (0x0A00, 0x0A7F, "pa"),  # Gurmukhi
+    (0x0A80, 0x0AFF, "gu"),  # Gujarati
+    (0x0B00, 0x0B7F, "or"),  # Odia
+    (0x0B80, 0x0BFF, "ta"),  # Tamil
+    (0x0C00, 0x0C7F, "te"),  # Telugu
+    (0x0C80, 0x0CFF, "kn"),  # Kannada
+    (0x0D00, 0x0D7F, "ml"),  # Malayalam
+    (0x0600, 0x06FF, "ur"),  # Arabic script
+]
+SHARED_SCRIPT_PENALTY = {"hi": 0.6, "bn": 0.6, "ur": 0.6}
+# Devanagari text with a common Hindi word and none of the Marathi/Nepali ones is Hindi
+# with full confidence, which keeps the bulk of Hindi messages local.
+HINDI_MARKERS = frozenset("है हैं था थे में मुझे मेरा मेरे मेरी क्या नहीं और रहा रही कैसे".split())
+OTHER_DEVANAGARI_MARKERS = frozenset("आहे आहेत मला माझे माझा नाही आणि छ छु छन् मलाई हुन्छ गर्न".split())
+_DEVANAGARI_WORD_RE = re.compile(r"[\u0900-\u0963\u0966-\u097F]+")
+
+# Seed text for the Latin-script model. Kept deliberately small: it only has to tell
+# English apart from Hindi written in Latin letters.
+SEED_TEXT = {
+    "en": """
+        what are the symptoms of dengue fever how can i prevent malaria please tell me about
+        typhoid vaccine when should i take my child for vaccination remind me tomorrow at five
+        i have a headache and a cough since yesterday is it safe to take medicine during
+        pregnancy where is the nearest vaccination centre what should i eat when i have a cold
+        my mother has high blood pressure and diabetes how much water should we drink every day
+        thank you for the information can you help me with this what is the treatment for
+        stomach pain the doctor said i need rest show my reminders set a reminder for polio drops
+        how does the virus spread wash your hands with soap keep the surroundings clean
+        there is an outbreak in our district which hospital should we visit for the fever
+        the baby is not feeling well and has been crying all night should i be worried about it
+        what is the right age for the measles vaccine does this need a prescription from a doctor
+    """,
+    "hi": """
+        mujhe bukhar ho raha hai kya karun mere sir mein dard hai aur khansi bhi hai
+        typhoid ke baare mein batao dengue ke lakshan kya hain malaria se kaise bachein
+        kal subah paanch baje yaad dila dena bachche ko teeka kab lagwana chahiye
+        mera pet dard kar raha hai kya dawai leni chahiye doctor ke paas kab jaana chahiye
+        hamare gaon mein bimari fail rahi hai paani ubal kar peena chahiye haath saabun se dhona
+        meri maa ko sugar aur bp ki bimari hai unko kya khana chahiye aapka bahut dhanyavaad
+        mujhe yaad dilana ki dawai time par leni hai mere reminder dikhao kya ye theek hai
+        aaj se zukaam hai gale mein kharash hai raat ko neend nahi aati kamzori lag rahi hai
+        sabse paas vaccine centre kahan hai polio ki dawa kab pilani hai bachcha ro raha hai
+        kitna paani peena chahiye khana khane ke baad ulti ho rahi hai dast lag gaye hain
+        haan ji nahi ji theek hai accha bataiye samjhaiye kaise hoga kyun ho raha hai
+    """,
+}
+
+_WORD_RE = re.compile(r"[a-z]+")
+_ALPHA = 0.5  # add-alpha smoothing for unseen trigrams
+
+
+def _trigrams(text):
+    for word in _WORD_RE.findall(text.lower()):
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            yield padded[i:i + 3]
+
+
+def _train(seed):
+    models = {}
+    vocab = set()
+    counts = {}
+    for lang, text in seed.items():
+        counts[lang] = Counter(_trigrams(text))
+        vocab.update(counts[lang])
+    v = len(vocab) + 1
+    for lang, c in counts.items():
+        total = sum(c.values())
+        models[lang] = (
+            {g: math.log((n + _ALPHA) / (total + _ALPHA * v)) for g, n in c.items()},
+            math.log(_ALPHA / (total + _ALPHA * v)),
+        )
+    return models
+
+
+_LATIN_MODELS = _train(SEED_TEXT)
+
+
+def _script_counts(text):
+    counts = Counter()
+    for ch in text:
+        cp = ord(ch)
+        if cp < 0x0600:
+            if ch.isalpha() and cp < 0x0250:
+                counts["latin"] += 1
+            continue
+        for lo, hi, lang in SCRIPT_RANGES:
+            if lo <= cp <= hi:
+                counts[lang] += 1
+                break
+    return counts
+
+
+def _score_latin(text):
+    """Return (lang, confidence) for Latin-script text using the trigram models."""
+    grams = list(_trigrams(text))
+    if not grams:
+        return "en", 0.0
+    scores = {}
+    for lang, (table, unseen) in _LATIN_MODELS.items():
+        scores[lang] = sum(table.get(g, unseen) for g in grams)
+    best = max(scores, key=scores.get)
+    other = min(scores, key=scores.get)
+    # Average per-trigram log-likelihood ratio, squashed to (0.5, 1); scaled by length so a
+    # two-letter "ok" never counts as a confident answer.
+    margin = (scores[best] - scores[other]) / len(grams)
+    confidence = 1 / (1 + math.exp(-4 * margin))
+    confidence *= min(1.0, len(grams) / 12)
+    return best, confidence
+
+
+def detect_local(text):
+    """
+    Identify the language of `text` without any network call.
+    Returns (lang_code, confidence); confidence 0.0 means "no idea".
+    """
+    if not text or not text.strip():
+        return "en", 0.0
+    counts = _script_counts(text)
+    letters = sum(counts.values())
+    if not letters:
+        return "en", 0.0
+    script, n = counts.most_common(1)[0]
+    share = n / letters
+    if script == "hi":
+        words = set(_DEVANAGARI_WORD_RE.findall(text))
+        if words & HINDI_MARKERS and not words & OTHER_DEVANAGARI_MARKERS:
+            return "hi", share
+    if script != "latin":
+        return script, share * SHARED_SCRIPT_PENALTY.get(script, 1.0)
+    lang, confidence = _score_latin(text)
+    return lang, confidence * share
@@ -0,0 +1,76 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+class Lazy:
+    """
+    Shared singleton built on first use. Attribute access is forwarded to the real
+    object, so `embedder.encode(...)` works whether or not the model is loaded yet;
+    the first caller pays the load, concurrent callers wait for it.
+    """
+
+    def __init__(self, name, factory):
+        self._name = name
+        self._factory = factory
+        self._value = None
+        self._lock = threading.Lock()
+        self._load_seconds = None
+        self._error = None
+        _registry[name] = self
+
+    def get(self):
+        if self._value is None:
+            with self._lock:
+                if self._value is None:
+                    started = time.perf_counter()
+                    try:
+                        self._value = self._factory()
+                        self._error = None
+                    except Exception as e:
+                        self._error = repr(e)
+                        raise
+                    self._load_seconds = time.perf_counter() - started
+                    logger.info("Loaded %s in %.2fs", self._name, self._load_seconds)
+        return self._value
+
+    def set(self, value):
+        """Install a ready-made object (e.g. a stand-in in benchmarks) instead of calling the factory."""
+        with self._lock:
+            self._value = value
+            self._error = None
+
+    @property
+    def ready(self):
+        return self._value is not None
+
+    def status(self):
+        return {"ready": self.ready, "load_seconds": self._load_seconds, "error": self._error}
+
+    def __getattr__(self, attr):
+        return getattr(self.get(), attr)
+
+
+def warm(names=None):
+    """Build the named singletons (all registered ones by default), logging failures."""
+    for name, lazy in list(_registry.items()):
+        if names is not None and name not in names:
+            continue
+        try:
+            lazy.get()
+        except Exception as e:
+            logger.exception("Warming %s failed: %s", name, e)
+
+
+def warm_async(names=None):
+    t = threading.Thread(target=warm, args=(names,), name="warmup", daemon=True)
+    t.start()
+    return t
+
+
+def status(names=None):
+    return {name: lazy.status() for name, lazy in _registry.items() if names is None or name in names}
@@ -0,0 +1,240 @@
+"""
+In-process metrics in the Prometheus text format, plus per-message trace ids.
+
+    with metrics.stage("gemini"):      # histogram + error counter per stage
+        ...
+    @metrics.timed("detect_intent")
+    def detect_intent_text(...): ...
+
+Counters, gauges and histograms are plain Python objects guarded by a lock, so an
+observation costs about a microsecond. Callback metrics are read only when /metrics is
+scraped (queue depth, cache sizes, ...). Values are per process: under gunicorn each
+worker reports its own series, labelled with its pid.
+METRICS_ENABLED=0 turns stage timing into a no-op.
+
+The trace id of the message being handled lives in a thread-local; install_log_filter()
+stamps it on every log record as %(trace_id)s.
+"""
+import bisect
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from functools import wraps
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+NAMESPACE = "arogya"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _fmt(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = f"{NAMESPACE}_{name}"
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, values, kw):
+        if kw:
+            values = tuple(kw[n] for n in self.labelnames)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return tuple(str(v) for v in values)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._values = {}
+
+    def inc(self, *labels, amount=1, **kw):
+        key = self._key(labels, kw)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, *labels, **kw):
+        key = self._key(labels, kw)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # labels -> [bucket counts..., +Inf count], sum
+
+    def observe(self, value, *labels, **kw):
+        key = self._key(labels, kw)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def render(self):
+        with self._lock:
+            items = sorted((k, (list(c), s)) for k, (c, s) in self._series.items())
+        lines = self.header()
+        for key, (counts, total) in items:
+            running = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                running += n
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', _fmt(bound))])} {running}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_fmt(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {running}")
+        return lines
+
+
+class Callback(_Metric):
+    """Values computed at scrape time: fn() returns {label values tuple: value} or a number."""
+
+    def __init__(self, name, help, kind, fn, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self.kind = kind
+        self.fn = fn
+
+    def render(self):
+        try:
+            values = self.fn()
+        except Exception as e:
+            logging.getLogger(__name__).warning("Metric %s failed: %s", self.name, e)
+            return []
+        if not isinstance(values, dict):
+            values = {(): values}
+        lines = self.header()
+        for key, value in sorted(values.items()):
+            if value is not None:
+                key = key if isinstance(key, tuple) else (key,)
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {_fmt(value)}")
+        return lines
+
+
+def render():
+    """All registered metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    pid = ("pid", str(os.getpid()))
+    return "\n".join(_add_label(line, pid) for line in lines) + "\n"
+
+
+def _add_label(line, pair):
+    if line.startswith("#"):
+        return line
+    name, _, value = line.rpartition(" ")
+    label = f'{pair[0]}="{pair[1]}"'
+    name = name[:-1] + "," + label + "}" if name.endswith("}") else name + "{" + label + "}"
+    return f"{name} {value}"
+
+
+# ================== STAGES ==================
+STAGE_SECONDS = Histogram("stage_seconds", "Time spent per processing stage", ["stage"])
+STAGE_ERRORS = Counter("stage_errors_total", "Exceptions raised per processing stage", ["stage"])
+
+
+@contextmanager
+def stage(name):
+    """Time the block under `name`; exceptions are counted and re-raised."""
+    if not METRICS_ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(name)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, name)
+
+
+def timed(name):
+    """Decorator form of stage()."""
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# ================== TRACE IDS ==================
+_trace = threading.local()
+
+
+def new_trace_id():
+    return uuid.uuid4().hex[:16]
+
+
+def current_trace_id():
+    return getattr(_trace, "id", None)
+
+
+@contextmanager
+def trace(trace_id):
+    """Make `trace_id` the current one on this thread for the duration of the block."""
+    previous = current_trace_id()
+    _trace.id = trace_id
+    try:
+        yield trace_id
+    finally:
+        _trace.id = previous
+
+
+class TraceIdFilter(logging.Filter):
+    def filter(self, record):
+        record.trace_id = current_trace_id() or "-"
+        return True
+
+
+def install_log_filter(logger=None):
+    """Add %(trace_id)s to records of every handler on `logger` (the root logger by default)."""
+    logger = logger or logging.getLogger()
+    for handler in logger.handlers:
+        if not any(isinstance(f, TraceIdFilter) for f in handler.filters):
+            handler.addFilter(TraceIdFilter())
@@ -0,0 +1,376 @@
+"""
+Outbound WhatsApp delivery for bulk traffic (outbreak broadcasts, due reminders).
+
+Messages are rows in SQLite, shared by every gunicorn worker on the host, and are sent
+by an OutboundDispatcher thread in each worker. Throughput is limited per WhatsApp
+phone-number ID by a token bucket kept in the same database, so all workers together stay
+under Meta's per-number limit:
+  - conversational replies still go out directly; they take a token first (take_interactive),
+    running the bucket into debt rather than waiting
+  - the dispatcher only claims messages while more than `reserve` tokens are left, so bulk
+    sends never use up the capacity that interactive replies need
+  - queued messages are claimed by priority (PRIORITY_INTERACTIVE < PRIORITY_REMINDER <
+    PRIORITY_BROADCAST), then by due time
+  - 429 / Meta throttling pauses the whole number for Retry-After and the message is retried
+    with exponential backoff, as are connection errors raised before the request was sent;
+    5xx, timeouts and other errors fail the message, since Meta may already have delivered it
+Rows are claimed with a lease, so a message whose worker died mid-send is sent again once the
+lease runs out: delivery is at-least-once (as in reminder_store) and such a message may arrive twice.
+"""
+import json
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import client_utils
+import metrics
+from sqlite_utils import ThreadLocalConnection
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_REMINDER = 1
+PRIORITY_BROADCAST = 2
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_REMINDER: "reminder", PRIORITY_BROADCAST: "broadcast"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbound (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    phone_number_id TEXT NOT NULL,   -- sender; the rate limit applies per sender
+    to_phone TEXT NOT NULL,
+    payload TEXT NOT NULL,           -- JSON body for POST /<phone_number_id>/messages
+    priority INTEGER NOT NULL,
+    broadcast_id INTEGER,
+    status TEXT NOT NULL DEFAULT 'pending',  -- pending | sending | sent | failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    lease_until REAL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    sent_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_outbound_claim ON outbound (status, phone_number_id, priority, next_attempt_at);
+CREATE INDEX IF NOT EXISTS idx_outbound_broadcast ON outbound (broadcast_id, status);
+
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    text TEXT NOT NULL,
+    topic TEXT,
+    recipients INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS subscribers (
+    phone TEXT PRIMARY KEY,
+    lang TEXT NOT NULL DEFAULT 'en',
+    chat_format TEXT NOT NULL DEFAULT 'text',
+    topic TEXT,                      -- e.g. a district; NULL receives every broadcast
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_subscribers_topic ON subscribers (topic);
+
+CREATE TABLE IF NOT EXISTS rate_buckets (
+    phone_number_id TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    paused_until REAL NOT NULL DEFAULT 0
+);
+"""
+
+SENT = metrics.Counter("outbound_messages_total", "Queued WhatsApp messages by priority and outcome", ["priority", "result"])
+
+
+class OutboundQueue:
+    def __init__(self, path, rate=50.0, burst=None, reserve=None):
+        """rate: messages per second per phone-number ID; burst: bucket size; reserve: tokens kept for replies."""
+        self.path = path
+        self.rate = rate
+        self.burst = burst or rate
+        self.reserve = self.burst * 0.2 if reserve is None else reserve
+        self._conn = ThreadLocalConnection(path)
+        self._conn().executescript(SCHEMA)
+
+    # ---------- token bucket ----------
+    def _bucket(self, conn, key, now):
+        """Refilled token count of `key` and its pause deadline (inside the caller's transaction)."""
+        row = conn.execute(
+            "SELECT tokens, updated_at, paused_until FROM rate_buckets WHERE phone_number_id = ?", (key,)
+        ).fetchone()
+        if row is None:
+            conn.execute(
+                "INSERT INTO rate_buckets (phone_number_id, tokens, updated_at) VALUES (?, ?, ?)", (key, self.burst, now)
+            )
+            return self.burst, 0.0
+        tokens, updated_at, paused_until = row
+        refill_from = max(updated_at, paused_until)
+        if now > refill_from:
+            tokens = min(self.burst, tokens + (now - refill_from) * self.rate)
+        return tokens, paused_until
+
+    def take_interactive(self, key, now=None):
+        """Charge one conversational reply to `key`'s bucket; never waits (the bucket may go negative)."""
+        now = now or time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            tokens, _ = self._bucket(conn, key, now)
+            conn.execute(
+                "UPDATE rate_buckets SET tokens = ?, updated_at = ? WHERE phone_number_id = ?",
+                (max(tokens - 1, -self.burst), now, key),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def pause(self, key, seconds, now=None):
+        """Meta throttled `key`: no bulk sends until the pause is over, and start refilling from empty."""
+        now = now or time.time()
+        self._conn().execute(
+            "UPDATE rate_buckets SET tokens = MIN(tokens, 0), updated_at = ?, paused_until = MAX(paused_until, ?)"
+            " WHERE phone_number_id = ?",
+            (now, now + seconds, key),
+        )
+
+    # ---------- queue ----------
+    def enqueue(self, phone_number_id, to_phone, payload, priority, broadcast_id=None, not_before=None):
+        return self.enqueue_many([(phone_number_id, to_phone, payload)], priority, broadcast_id, not_before)
+
+    def enqueue_many(self, messages, priority, broadcast_id=None, not_before=None):
+        """messages: iterable of (phone_number_id, to_phone, payload dict). Returns how many were queued."""
+        now = time.time()
+        due = not_before or now
+        rows = [
+            (pid, to, json.dumps(payload, ensure_ascii=False), priority, broadcast_id, due, now)
+            for pid, to, payload in messages
+        ]
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO outbound (phone_number_id, to_phone, payload, priority, broadcast_id, next_attempt_at,"
+                " created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(rows)
+
+    def senders_with_work(self, now=None):
+        now = now or time.time()
+        return [r[0] for r in self._conn().execute(
+            "SELECT DISTINCT phone_number_id FROM outbound WHERE (status = 'pending' AND next_attempt_at <= ?)"
+            " OR (status = 'sending' AND lease_until < ?)",
+            (now, now),
+        )]
+
+    def claim(self, key, limit=100, lease=120, now=None):
+        """
+        Take up to `limit` due messages of sender `key`, as many as its bucket allows above
+        the reserve, and charge them to the bucket. Returns (rows, seconds until a token frees up).
+        """
+        now = now or time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            tokens, paused_until = self._bucket(conn, key, now)
+            if now < paused_until:
+                conn.execute("COMMIT")
+                return [], paused_until - now
+            n = min(limit, math.floor(tokens - self.reserve))
+            rows = []
+            if n > 0:
+                rows = [dict(zip(("id", "to_phone", "payload", "priority", "attempts"), r)) for r in conn.execute(
+                    "SELECT id, to_phone, payload, priority, attempts FROM outbound"
+                    " WHERE phone_number_id = ? AND next_attempt_at <= ?"
+                    " AND (status = 'pending' OR (status = 'sending' AND lease_until < ?))"
+                    " ORDER BY priority, next_attempt_at LIMIT ?",
+                    (key, now, now, n),
+                )]
+            if rows:
+                conn.executemany(
+                    "UPDATE outbound SET status = 'sending', lease_until = ? WHERE id = ?",
+                    [(now + lease, r["id"]) for r in rows],
+                )
+                tokens -= len(rows)
+            conn.execute(
+                "UPDATE rate_buckets SET tokens = ?, updated_at = ? WHERE phone_number_id = ?", (tokens, now, key)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        wait = max(0.0, (self.reserve + 1 - tokens) / self.rate)
+        return rows, wait
+
+    def mark_sent(self, message_id):
+        self._conn().execute(
+            "UPDATE outbound SET status = 'sent', sent_at = ?, lease_until = NULL WHERE id = ?", (time.time(), message_id)
+        )
+
+    def mark_failed(self, message_id, attempts, error, retry_at=None):
+        """Schedule another attempt at `retry_at`, or give up when it is None."""
+        self._conn().execute(
+            "UPDATE outbound SET status = ?, attempts = ?, next_attempt_at = COALESCE(?, next_attempt_at),"
+            " lease_until = NULL, last_error = ? WHERE id = ?",
+            ("pending" if retry_at is not None else "failed", attempts, retry_at, str(error)[:500], message_id),
+        )
+
+    def next_due(self, exclude=()):
+        """Earliest next_attempt_at of pending messages, ignoring senders in `exclude`."""
+        exclude = list(exclude)
+        sql = "SELECT MIN(next_attempt_at) FROM outbound WHERE status = 'pending'"
+        if exclude:
+            sql += f" AND phone_number_id NOT IN ({','.join('?' * len(exclude))})"
+        return self._conn().execute(sql, exclude).fetchone()[0]
+
+    def pending_counts(self):
+        """{priority name: messages not yet delivered}"""
+        return {
+            PRIORITY_NAMES.get(p, str(p)): n for p, n in self._conn().execute(
+                "SELECT priority, COUNT(*) FROM outbound WHERE status IN ('pending', 'sending') GROUP BY priority"
+            )
+        }
+
+    # ---------- broadcasts and subscribers ----------
+    def subscribe(self, subscribers):
+        """Upsert dicts {"phone", "lang", "chat_format", "topic"}."""
+        now = time.time()
+        self._conn().executemany(
+            "INSERT INTO subscribers (phone, lang, chat_format, topic, created_at) VALUES (?, ?, ?, ?, ?)"
+            " ON CONFLICT (phone) DO UPDATE SET lang = excluded.lang, chat_format = excluded.chat_format,"
+            " topic = excluded.topic",
+            [(s["phone"], s.get("lang", "en"), s.get("chat_format", "text"), s.get("topic"), now) for s in subscribers],
+        )
+
+    def unsubscribe(self, phone):
+        self._conn().execute("DELETE FROM subscribers WHERE phone = ?", (phone,))
+
+    def subscribers(self, topic=None):
+        """(phone, lang, chat_format) of everyone subscribed to `topic` (or to everything)."""
+        if topic is None:
+            return self._conn().execute("SELECT phone, lang, chat_format FROM subscribers")
+        return self._conn().execute(
+            "SELECT phone, lang, chat_format FROM subscribers WHERE topic = ? OR topic IS NULL", (topic,)
+        )
+
+    def create_broadcast(self, text, topic):
+        cur = self._conn().execute(
+            "INSERT INTO broadcasts (text, topic, recipients, created_at) VALUES (?, ?, 0, ?)", (text, topic, time.time())
+        )
+        return cur.lastrowid
+
+    def set_recipients(self, broadcast_id, recipients):
+        self._conn().execute("UPDATE broadcasts SET recipients = ? WHERE id = ?", (recipients, broadcast_id))
+
+    def broadcast_status(self, broadcast_id):
+        row = self._conn().execute(
+            "SELECT text, topic, recipients, created_at FROM broadcasts WHERE id = ?", (broadcast_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        counts = dict(self._conn().execute(
+            "SELECT status, COUNT(*) FROM outbound WHERE broadcast_id = ? GROUP BY status", (broadcast_id,)
+        ).fetchall())
+        return {"id": broadcast_id, "text": row[0], "topic": row[1], "recipients": row[2], "created_at": row[3],
+                "status": counts}
+
+
+class OutboundDispatcher:
+    """
+    Background thread that claims queued messages as the rate limit allows and sends them
+    through `senders` threads. post(phone_number_id, payload) returns the HTTP response.
+    """
+
+    def __init__(self, queue, post, senders=8, batch_size=100, poll_interval=5, max_attempts=6, backoff=2.0):
+        self.queue = queue
+        self.post = post
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self._pool = ThreadPoolExecutor(max_workers=senders, thread_name_prefix="outbound-send")
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="outbound-dispatcher", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._pool.shutdown(wait=False)
+
+    def notify(self):
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                delay = self.dispatch_once()
+            except Exception as e:
+                logger.exception("Outbound dispatch failed: %s", e)
+                delay = self.poll_interval
+            if delay > 0:
+                self._wake.wait(delay)
+                self._wake.clear()
+
+    def dispatch_once(self):
+        """
+        Send one round of claimed messages; returns how long to sleep before the next round:
+        0 after a full batch, otherwise until a throttled sender gets a token back or the
+        next message of an unthrottled sender falls due.
+        """
+        delay = self.poll_interval
+        full = False
+        throttled = set()  # out of tokens or paused: their due messages must wait for `wait`
+        for key in self.queue.senders_with_work():
+            rows, wait = self.queue.claim(key, limit=self.batch_size)
+            if rows:
+                # wait for the round so a 429 can pause the number before the next claim
+                list(self._pool.map(lambda r: self._send(key, r), rows))
+                full = full or len(rows) == self.batch_size
+            if wait > 0:
+                throttled.add(key)
+                delay = min(delay, wait)
+        if full:
+            return 0.0
+        next_due = self.queue.next_due(exclude=throttled)
+        if next_due is not None:
+            delay = max(0.0, min(delay, next_due - time.time()))
+        return delay
+
+    def _send(self, key, row):
+        priority = PRIORITY_NAMES.get(row["priority"], str(row["priority"]))
+        attempts = row["attempts"] + 1
+        resp = None
+        try:
+            resp = self.post(key, json.loads(row["payload"]))
+            if resp.status_code < 400:
+                self.queue.mark_sent(row["id"])
+                SENT.inc(priority, "sent")
+                return
+            error = f"HTTP {resp.status_code}: {resp.text[:200]}"
+            throttled = retryable = resp.status_code == 429 or client_utils.meta_rate_limited(resp)
+        except requests.RequestException as e:
+            # retrying is only safe when the POST never left; after that Meta may have accepted it
+            error, throttled, retryable = str(e), False, client_utils.never_sent(e)
+        if throttled:
+            self.queue.pause(key, client_utils.retry_delay(resp, attempts - 1))
+        retry_at = None
+        if retryable and attempts < self.max_attempts:
+            retry_at = time.time() + self.backoff * (2 ** (attempts - 1))
+        logger.warning("Outbound message %s to %s attempt %d failed: %s", row["id"], row["to_phone"], attempts, error)
+        self.queue.mark_failed(row["id"], attempts, error, retry_at)
+        SENT.inc(priority, "retry" if retry_at else "failed")
@@ -0,0 +1,180 @@
+import logging
+import sqlite3
+import threading
+import time
+
+from sqlite_utils import ThreadLocalConnection
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reminders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    phone TEXT NOT NULL,
+    task TEXT NOT NULL,
+    due_at REAL NOT NULL,            -- epoch seconds
+    time_label TEXT NOT NULL,        -- what the user was told, for ShowReminders
+    lang TEXT NOT NULL DEFAULT 'en',
+    chat_format TEXT NOT NULL DEFAULT 'text',
+    status TEXT NOT NULL DEFAULT 'pending',  -- pending | sending | sent | failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,   -- due_at, pushed back on retry
+    lease_until REAL,                -- set while a dispatcher owns the row
+    created_at REAL NOT NULL,
+    sent_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_reminders_due ON reminders (status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS idx_reminders_phone ON reminders (phone, due_at);
+"""
+
+
+class ReminderStore:
+    """
+    SQLite-backed reminders shared by every gunicorn worker on the host.
+    Rows are claimed with a lease, so a reminder whose sender crashed is picked up
+    again once the lease runs out (at-least-once delivery).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = ThreadLocalConnection(path, row_factory=sqlite3.Row)
+        self._conn().executescript(SCHEMA)
+
+    def add(self, phone, task, due_at, time_label, lang="en", chat_format="text"):
+        now = time.time()
+        cur = self._conn().execute(
+            "INSERT INTO reminders (phone, task, due_at, time_label, lang, chat_format, next_attempt_at, created_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (phone, task, due_at, time_label, lang, chat_format, due_at, now),
+        )
+        return cur.lastrowid
+
+    def list_for_phone(self, phone):
+        """Reminders that have not been delivered yet, soonest first."""
+        return [dict(r) for r in self._conn().execute(
+            "SELECT * FROM reminders WHERE phone = ? AND status IN ('pending', 'sending') ORDER BY due_at",
+            (phone,),
+        )]
+
+    def claim_due(self, now=None, limit=100, lease=60):
+        """Atomically take up to `limit` due reminders; other workers will skip them until the lease expires."""
+        now = now or time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = [dict(r) for r in conn.execute(
+                "SELECT * FROM reminders WHERE status = 'pending' AND next_attempt_at <= ?"
+                " UNION ALL "
+                "SELECT * FROM reminders WHERE status = 'sending' AND next_attempt_at <= ? AND lease_until < ?"
+                " ORDER BY next_attempt_at LIMIT ?",
+                (now, now, now, limit),
+            )]
+            if rows:
+                conn.executemany(
+                    "UPDATE reminders SET status = 'sending', lease_until = ? WHERE id = ?",
+                    [(now + lease, r["id"]) for r in rows],
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return rows
+
+    def mark_sent(self, reminder_id):
+        self._conn().execute(
+            "UPDATE reminders SET status = 'sent', sent_at = ?, lease_until = NULL WHERE id = ?",
+            (time.time(), reminder_id),
+        )
+
+    def mark_failed(self, reminder_id, attempts, retry_at=None):
+        """Schedule another attempt at `retry_at`, or give up when it is None."""
+        if retry_at is None:
+            self._conn().execute(
+                "UPDATE reminders SET status = 'failed', attempts = ?, lease_until = NULL WHERE id = ?",
+                (attempts, reminder_id),
+            )
+        else:
+            self._conn().execute(
+                "UPDATE reminders SET status = 'pending', attempts = ?, next_attempt_at = ?, lease_until = NULL"
+                " WHERE id = ?",
+                (attempts, retry_at, reminder_id),
+            )
+
+    def next_due(self):
+        """Earliest next_attempt_at among pending rows (index-only lookup), or None."""
+        row = self._conn().execute(
+            "SELECT MIN(next_attempt_at) FROM reminders WHERE status = 'pending'"
+        ).fetchone()
+        return row[0]
+
+    def pending_count(self):
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM reminders WHERE status IN ('pending', 'sending')"
+        ).fetchone()[0]
+
+
+class ReminderDispatcher:
+    """
+    Background thread that sends due reminders in batches. It sleeps until the next
+    due time (capped by `poll_interval`, since other workers may add earlier ones) and
+    can be woken early with notify() when this process adds a reminder.
+    """
+
+    def __init__(self, store, send, batch_size=100, poll_interval=30, max_attempts=5, backoff=60):
+        self.store = store
+        self.send = send  # send(reminder_dict); raise to trigger a retry
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="reminder-dispatcher", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def notify(self):
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                sent = self.dispatch_once()
+            except Exception as e:
+                logger.exception("Reminder dispatch failed: %s", e)
+                sent = 0
+            if sent >= self.batch_size:
+                continue  # probably more due right now
+            delay = self.poll_interval
+            try:
+                next_due = self.store.next_due()
+            except Exception:
+                next_due = None
+            if next_due is not None:
+                delay = max(0.0, min(delay, next_due - time.time()))
+            self._wake.wait(delay)
+            self._wake.clear()
+
+    def dispatch_once(self):
+        batch = self.store.claim_due(limit=self.batch_size)
+        for r in batch:
+            try:
+                self.send(r)
+                self.store.mark_sent(r["id"])
+            except Exception as e:
+                attempts = r["attempts"] + 1
+                retry_at = None
+                if attempts < self.max_attempts:
+                    retry_at = time.time() + self.backoff * (2 ** (attempts - 1))
+                logger.warning("Reminder %s attempt %d failed: %s", r["id"], attempts, e)
+                self.store.mark_failed(r["id"], attempts, retry_at)
+        return len(batch)
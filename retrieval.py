@@ -0,0 +1,124 @@
+"""
+Hybrid retrieval for generate_prompt: dense Qdrant search and the local BM25 index are
+queried side by side, fused with reciprocal rank fusion, and optionally reranked by a
+cross-encoder (RERANK_MODEL). Payload filters (e.g. {"source": "cowin", "district_id": 395})
+apply to both sides.
+"""
+import logging
+import os
+import threading
+import time
+
+import metrics
+from bm25_index import INDEX_PATH, BM25Index, reciprocal_rank_fusion
+
+logger = logging.getLogger(__name__)
+
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "1") == "1"
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", 20))  # per retriever, before fusion
+RERANK_MODEL = os.getenv("RERANK_MODEL")  # e.g. cross-encoder/mmarco-mMiniLMv2-L12-H384-v1; unset = no rerank
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", 12))
+
+
+def qdrant_filter(filters):
+    if not filters:
+        return None
+    from qdrant_client.models import FieldCondition, Filter, MatchValue
+    return Filter(must=[FieldCondition(key=k, match=MatchValue(value=v)) for k, v in filters.items()])
+
+
+class HybridRetriever:
+    def __init__(self, client, collection_name, index_path=INDEX_PATH, rerank_model=RERANK_MODEL,
+                 hybrid=HYBRID_RETRIEVAL, reload_interval=30):
+        self.client = client
+        self.collection_name = collection_name
+        self.index_path = index_path
+        self.rerank_model = rerank_model
+        self.hybrid = hybrid
+        self.reload_interval = reload_interval
+        self._index = None
+        self._index_mtime = None
+        self._checked = 0.0
+        self._reranker = None
+        self._lock = threading.Lock()
+
+    def index(self):
+        """The BM25 index, reloaded when the ingest script has rewritten the file."""
+        now = time.time()
+        if now - self._checked < self.reload_interval:
+            return self._index
+        with self._lock:
+            self._checked = now
+            try:
+                mtime = os.path.getmtime(self.index_path)
+            except OSError:
+                return self._index
+            if mtime != self._index_mtime:
+                started = time.perf_counter()
+                self._index = BM25Index.load(self.index_path)
+                self._index_mtime = mtime
+                logger.info("Loaded BM25 index (%d chunks) in %.2fs", len(self._index), time.perf_counter() - started)
+        return self._index
+
+    def reranker(self):
+        if self._reranker is None and self.rerank_model:
+            with self._lock:
+                if self._reranker is None:
+                    from sentence_transformers import CrossEncoder
+                    self._reranker = CrossEncoder(self.rerank_model)
+        return self._reranker
+
+    def search(self, question, q_vec, top_k=4, filters=None, mode=None, with_vectors=False):
+        """
+        Returns up to top_k dicts {"id", "text", "source", "score", "payload"}, plus
+        "vector" when with_vectors (used by context_builder for MMR).
+        mode: "dense", "bm25" or "hybrid" (default: hybrid when HYBRID_RETRIEVAL, else dense).
+        """
+        mode = mode or ("hybrid" if self.hybrid else "dense")
+        reranker = self.reranker()
+        pool = max(top_k, RERANK_CANDIDATES) if reranker else top_k
+        vector = q_vec.tolist() if hasattr(q_vec, "tolist") else q_vec
+
+        payloads, vectors = {}, {}
+        rankings = []
+        if mode in ("dense", "hybrid"):
+            limit = RETRIEVAL_CANDIDATES if mode == "hybrid" else pool
+            with metrics.stage("vector_search"):
+                hits = self.client.search(
+                    collection_name=self.collection_name, query_vector=vector, limit=limit,
+                    query_filter=qdrant_filter(filters), with_vectors=with_vectors,
+                )
+            for h in hits:
+                payloads[str(h.id)] = h.payload
+                vectors[str(h.id)] = h.vector
+            rankings.append([str(h.id) for h in hits])
+        index = self.index() if mode in ("bm25", "hybrid") else None
+        if index is not None:
+            with metrics.stage("bm25_search"):
+                rankings.append([pid for pid, _ in index.search(question, RETRIEVAL_CANDIDATES, filters)])
+
+        fused = reciprocal_rank_fusion(rankings)[:pool]
+        missing = [pid for pid, _ in fused if pid not in payloads]
+        if missing:
+            with metrics.stage("vector_retrieve"):
+                points = self.client.retrieve(
+                    collection_name=self.collection_name, ids=missing, with_payload=True, with_vectors=with_vectors,
+                )
+            for p in points:
+                payloads[str(p.id)] = p.payload
+                vectors[str(p.id)] = p.vector
+        results = [
+            {"id": pid, "text": payloads[pid].get("text"), "source": payloads[pid].get("source"),
+             "score": score, "payload": payloads[pid]}
+            for pid, score in fused if pid in payloads
+        ]
+        if with_vectors:
+            for r in results:
+                r["vector"] = vectors.get(r["id"])
+        if reranker and results:
+            with metrics.stage("rerank"):
+                scores = reranker.predict([(question, r["text"] or "") for r in results])
+            for r, s in zip(results, scores):
+                r["score"] = float(s)
+            results.sort(key=lambda r: r["score"], reverse=True)
+        return results[:top_k]
@@ -0,0 +1,33 @@
+"""
+Shared SQLite setup for the small state stores (dedup, reminders, outbound queue,
+translation cache): WAL so gunicorn workers can share one file, autocommit with
+explicit BEGIN IMMEDIATE where a store needs a transaction, one connection per thread.
+"""
+import sqlite3
+import threading
+
+
+def connect(path, timeout=10, row_factory=None):
+    """A connection in autocommit mode with WAL and a busy timeout of `timeout` seconds."""
+    conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+    if row_factory is not None:
+        conn.row_factory = row_factory
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class ThreadLocalConnection:
+    """Callable returning this thread's connection to `path`, opened on first use."""
+
+    def __init__(self, path, timeout=10, row_factory=None):
+        self.path = path
+        self.timeout = timeout
+        self.row_factory = row_factory
+        self._local = threading.local()
+
+    def __call__(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = connect(self.path, self.timeout, self.row_factory)
+        return conn
@@ -0,0 +1,106 @@
+"""
+Incremental delivery of a streamed Gemini answer: split_stream() cuts the growing text
+into WhatsApp-sized segments at paragraph or sentence ends, and SegmentSender sends them
+in order from a background thread, so the next part keeps generating while the previous
+one is (synthesized and) sent.
+"""
+import logging
+import queue
+import re
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+WHATSAPP_TEXT_LIMIT = 4096
+SENTENCE_END = re.compile(r"(?:[.!?।॥:]|\n)(?=\s)")
+
+_STOP = object()
+
+
+def _boundary(buf, min_chars, max_chars):
+    """End of the segment to cut from buf, or None to wait for more text."""
+    window = buf[:max_chars]
+    para = window.rfind("\n\n")
+    if para >= min_chars:
+        return para + 2
+    ends = [m.end() for m in SENTENCE_END.finditer(window) if m.end() >= min_chars]
+    if ends:
+        return ends[-1] if len(buf) >= max_chars else ends[0]
+    if len(buf) >= max_chars:
+        space = window.rfind(" ", min_chars)
+        return space + 1 if space > 0 else max_chars
+    return None
+
+
+def split_stream(chunks, first_chars=160, segment_chars=700, max_chars=1500):
+    """
+    Segments of the text arriving in `chunks`. The first is cut at the first sentence end
+    after `first_chars` so it goes out quickly; later ones collect at least `segment_chars`
+    and prefer paragraph breaks. No segment exceeds `max_chars` (WhatsApp allows 4096).
+    """
+    max_chars = min(max_chars, WHATSAPP_TEXT_LIMIT)
+    target = first_chars
+    buf = ""
+    for chunk in chunks:
+        buf += chunk
+        while len(buf.strip()) >= target:
+            cut = _boundary(buf, min(target, max_chars), max_chars)
+            if cut is None:
+                break
+            segment, buf = buf[:cut].strip(), buf[cut:]
+            if segment:
+                yield segment
+                target = segment_chars
+    while buf.strip():  # the stream ended; flush what is left within max_chars
+        cut = len(buf) if len(buf) <= max_chars else _boundary(buf, max_chars // 2, max_chars)
+        segment, buf = buf[:cut].strip(), buf[cut:]
+        if segment:
+            yield segment
+
+
+class SegmentSender:
+    """
+    Calls send(segment) for every put() segment, in order, on one background thread, and
+    never faster than one segment per `min_interval` seconds. A failed send is logged and
+    the following segments are still attempted. The current trace id follows the segments.
+    """
+
+    def __init__(self, send, min_interval=1.0, name="segment-sender"):
+        self._send = send
+        self.min_interval = min_interval
+        self.sent = 0
+        self.failed = 0
+        self._trace_id = metrics.current_trace_id()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def put(self, segment):
+        self._queue.put(segment)
+
+    def close(self, timeout=None):
+        """Wait until every segment put so far has been sent (or `timeout` passes)."""
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _run(self):
+        last = None
+        with metrics.trace(self._trace_id):
+            while True:
+                segment = self._queue.get()
+                if segment is _STOP:
+                    return
+                if last is not None:
+                    wait = last + self.min_interval - time.monotonic()
+                    if wait > 0:
+                        time.sleep(wait)
+                try:
+                    self._send(segment)
+                    self.sent += 1
+                except Exception as e:
+                    self.failed += 1
+                    logger.warning("Sending answer segment %d failed: %s", self.sent + self.failed, e)
+                last = time.monotonic()
@@ -0,0 +1,77 @@
+import sys
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from outbound_queue import PRIORITY_BROADCAST, OutboundDispatcher, OutboundQueue
+
+SENDER = "1234"
+
+
+def ok(key, payload):
+    return SimpleNamespace(status_code=200, text="", headers={})
+
+
+def make_queue(tmp_path, messages, rate=5.0, burst=5.0, reserve=1.0):
+    queue = OutboundQueue(str(tmp_path / "outbound.db"), rate=rate, burst=burst, reserve=reserve)
+    queue.enqueue_many([(SENDER, f"91{i:08d}", {"text": {"body": "alert"}}) for i in range(messages)], PRIORITY_BROADCAST)
+    return queue
+
+
+def test_dispatcher_sleeps_while_bucket_is_empty(tmp_path):
+    queue = make_queue(tmp_path, 30)
+    claims = []
+    claim = queue.claim
+    queue.claim = lambda *a, **kw: claims.append(1) or claim(*a, **kw)
+    dispatcher = OutboundDispatcher(queue, ok, senders=2, batch_size=10)
+    dispatcher.start()
+    time.sleep(3)
+    dispatcher.stop()
+
+    sent = queue.pending_counts().get("broadcast", 0)
+    assert 30 - sent >= 15  # burst above the reserve, then ~rate per second
+    assert len(claims) < 100  # one claim per freed token or so, not a busy loop
+
+
+def test_paused_sender_is_not_polled(tmp_path):
+    queue = make_queue(tmp_path, 5)
+    queue.take_interactive(SENDER)  # creates the sender's bucket
+    queue.pause(SENDER, 2)
+    dispatcher = OutboundDispatcher(queue, ok, poll_interval=5)
+    assert dispatcher.dispatch_once() > 1.5
+
+
+def test_server_error_is_not_retried(tmp_path):
+    queue = make_queue(tmp_path, 1)
+    dispatcher = OutboundDispatcher(queue, lambda key, payload: SimpleNamespace(status_code=502, text="bad gateway", headers={}))
+    dispatcher.dispatch_once()
+    row = queue._conn().execute("SELECT status, attempts FROM outbound").fetchone()
+    assert row == ("failed", 1)
+
+
+def test_read_timeout_is_not_retried_but_refused_connection_is(tmp_path):
+    queue = make_queue(tmp_path, 2)
+
+    def post(key, payload):
+        raise errors.pop(0)
+
+    errors = [requests.ReadTimeout("read timed out"), requests.ConnectTimeout("connect timed out")]
+    dispatcher = OutboundDispatcher(queue, post, senders=1)
+    dispatcher.dispatch_once()
+    statuses = sorted(r[0] for r in queue._conn().execute("SELECT status FROM outbound"))
+    assert statuses == ["failed", "pending"]
+
+
+def test_throttled_send_is_retried_and_pauses_sender(tmp_path):
+    queue = make_queue(tmp_path, 1)
+    throttled = SimpleNamespace(status_code=429, text="", headers={"Retry-After": "30"}, json=lambda: {})
+    dispatcher = OutboundDispatcher(queue, lambda key, payload: throttled)
+    dispatcher.dispatch_once()
+    assert queue._conn().execute("SELECT status FROM outbound").fetchone()[0] == "pending"
+    rows, wait = queue.claim(SENDER)
+    assert rows == [] and wait > 25
@@ -1,32 +1,252 @@
-from google.cloud import translate
-from google.cloud import translate_v2 as translate_v2
-from google.cloud import translate as translate_v3
 import os
+import html
+import string
+import time
+import threading
+import logging
+from collections import OrderedDict
 from dotenv import load_dotenv
-from google.oauth2 import service_account
-
-# We'll use translate_v2 client for simplicity
-from google.cloud import translate_v2 as translate_client
+from langid_utils import detect_local
+from lazy_utils import Lazy
+from sqlite_utils import ThreadLocalConnection
+import metrics
 
 load_dotenv()
+logger = logging.getLogger(__name__)
+
+def _load_client():
+    from google.oauth2 import service_account
+    # We'll use translate_v2 client for simplicity
+    from google.cloud import translate_v2 as translate_client
+    translate_credentials = service_account.Credentials.from_service_account_file(
+        os.getenv("GOOGLE_APPLICATION_CREDENTIALS_TRANSLATE")
+    )
+    return translate_client.Client(credentials=translate_credentials)
+
+# Built on first use so importing this module costs nothing
+client = Lazy("translate", _load_client)
+
+# ================== CACHE ==================
+TRANSLATE_CACHE_SIZE = int(os.getenv("TRANSLATE_CACHE_SIZE", 5000))
+TRANSLATE_CACHE_TTL = float(os.getenv("TRANSLATE_CACHE_TTL", 7 * 24 * 3600))
+TRANSLATE_CACHE_DB = os.getenv("TRANSLATE_CACHE_DB")  # optional sqlite path shared by all workers
+# Local language ID: answers above this confidence skip the Google detect call
+LOCAL_LANGID = os.getenv("LOCAL_LANGID", "1") == "1"
+LOCAL_LANGID_THRESHOLD = float(os.getenv("LOCAL_LANGID_THRESHOLD", 0.75))
+PREWARM_LANGS = [l for l in os.getenv("TRANSLATE_PREWARM_LANGS", "hi,bn,ta").split(",") if l]
+
+
+class LRUCache:
+    """Thread-safe in-process LRU with a per-entry TTL."""
+
+    def __init__(self, max_items=5000, ttl=3600):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            ts, value = item
+            if time.time() - ts > self.ttl:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.time(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
 
-translate_credentials = service_account.Credentials.from_service_account_file(
-    os.getenv("GOOGLE_APPLICATION_CREDENTIALS_TRANSLATE")
+    def __len__(self):
+        return len(self._data)
+
+
+class SqliteCache:
+    """Persistent key/value tier; one connection per thread, WAL so workers can share the file."""
+
+    def __init__(self, path, ttl=3600):
+        self.path = path
+        self.ttl = ttl
+        self._conn = ThreadLocalConnection(path, timeout=5)
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS translations (key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+        )
+
+    def get(self, key):
+        row = self._conn().execute(
+            "SELECT value, created FROM translations WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        return row[0]
+
+    def set(self, key, value):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO translations (key, value, created) VALUES (?, ?, ?)",
+            (key, value, time.time()),
+        )
+
+
+_memory_cache = LRUCache(TRANSLATE_CACHE_SIZE, TRANSLATE_CACHE_TTL)
+_disk_cache = None
+if TRANSLATE_CACHE_DB:
+    try:
+        _disk_cache = SqliteCache(TRANSLATE_CACHE_DB, TRANSLATE_CACHE_TTL)
+    except Exception as e:
+        logger.warning("Translation disk cache disabled (%s): %s", TRANSLATE_CACHE_DB, e)
+
+_stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+_stats_lock = threading.Lock()
+LANGUAGE_DETECTIONS = metrics.Counter("language_detections_total", "Language detections by who answered", ["source"])
+metrics.Callback(
+    "translate_cache_lookups_total", "Translation cache lookups by result", "counter",
+    lambda: {(k,): v for k, v in cache_stats().items() if k in _stats}, ["result"],
 )
-client = translate_client.Client(credentials=translate_credentials)
+metrics.Callback("translate_cache_items", "Entries in the in-memory translation cache", "gauge", lambda: len(_memory_cache))
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def _cache_get(key):
+    value = _memory_cache.get(key)
+    if value is not None:
+        _count("memory_hits")
+        return value
+    if _disk_cache is not None:
+        try:
+            value = _disk_cache.get(key)
+        except Exception as e:
+            logger.warning("Translation disk cache read failed: %s", e)
+            value = None
+        if value is not None:
+            _count("disk_hits")
+            _memory_cache.set(key, value)
+            return value
+    _count("misses")
+    return None
+
+
+def _cache_set(key, value):
+    _memory_cache.set(key, value)
+    if _disk_cache is not None:
+        try:
+            _disk_cache.set(key, value)
+        except Exception as e:
+            logger.warning("Translation disk cache write failed: %s", e)
 
+
+def cache_stats():
+    """Hit/miss counters plus current in-memory size."""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+    stats["hit_rate"] = (lookups - stats["misses"]) / lookups if lookups else 0.0
+    stats["memory_size"] = len(_memory_cache)
+    return stats
+
+# ================== API ==================
 def detect_language(text):
+    return detect_language_with_confidence(text)[0]
+
+@metrics.timed("detect_language")
+def detect_language_with_confidence(text):
+    """
+    Returns (lang, confidence, source) where source is "local", "cache" or "remote".
+    The local detector answers confident cases; only the rest pay for a Google call.
+    """
+    result = _detect_language(text)
+    LANGUAGE_DETECTIONS.inc(result[2])
+    return result
+
+def _detect_language(text):
+    if LOCAL_LANGID:
+        lang, confidence = detect_local(text)
+        if confidence >= LOCAL_LANGID_THRESHOLD:
+            return lang, confidence, "local"
+    key = "detect\x00" + (text or "")
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached, 1.0, "cache"
     try:
         res = client.detect_language(text)
         lang = res.get("language")
-        return lang
+        _cache_set(key, lang)
+        return lang, res.get("confidence", 1.0), "remote"
     except Exception as e:
         # fallback to english
-        return "en"
+        return "en", 0.0, "remote"
 
+@metrics.timed("translate_text")
 def translate_text(text, target="en"):
     if text is None:
         return ""
+    key = f"translate\x00{target}\x00{text}"
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
     # if target is already 'en' and text language is en, this will still return the same text
     result = client.translate(text, target_language=target)
-    return result.get("translatedText")
+    translated = result.get("translatedText")
+    _cache_set(key, translated)
+    return translated
+
+@metrics.timed("translate_template")
+def translate_template(template, target="en", **values):
+    """
+    Translate a str.format template once per language and fill in the values afterwards,
+    so messages like the reminder confirmation hit the cache instead of being translated
+    whole every time. Placeholders are shielded from translation with notranslate spans.
+    """
+    key = f"template\x00{target}\x00{template}"
+    translated = _cache_get(key)
+    if translated is None:
+        if target == "en":
+            translated = template
+        else:
+            shielded = template
+            for name in values:
+                shielded = shielded.replace("{" + name + "}", f'<span translate="no">{{{name}}}</span>')
+            result = client.translate(shielded, target_language=target, format_="html")
+            translated = html.unescape(result.get("translatedText"))
+            for name in values:
+                translated = translated.replace(f'<span translate="no">{{{name}}}</span>', "{" + name + "}")
+        _cache_set(key, translated)
+    try:
+        return translated.format(**values)
+    except (KeyError, IndexError, ValueError):
+        # The translation mangled a placeholder; fall back to the English template
+        return template.format(**values)
+
+def prewarm(strings, langs=None, templates=()):
+    """Translate the fixed bot strings (and translate_template templates) for every supported language up front."""
+    langs = langs or PREWARM_LANGS
+    started = time.time()
+    for lang in langs:
+        for s in strings:
+            try:
+                translate_text(s, target=lang)
+            except Exception as e:
+                logger.warning("Prewarm failed for %s/%r: %s", lang, s, e)
+        for t in templates:
+            names = {field: "" for _, field, _, _ in string.Formatter().parse(t) if field}
+            try:
+                translate_template(t, target=lang, **names)
+            except Exception as e:
+                logger.warning("Prewarm failed for %s/%r: %s", lang, t, e)
+    logger.info("Prewarmed %d strings x %d languages in %.2fs", len(strings) + len(templates), len(langs), time.time() - started)
+
+def prewarm_async(strings, langs=None, templates=()):
+    """Run prewarm() on a daemon thread so startup is not blocked on the network."""
+    t = threading.Thread(target=prewarm, args=(strings, langs, templates), name="translate-prewarm", daemon=True)
+    t.start()
+    return t
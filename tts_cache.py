@@ -0,0 +1,115 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TTSCache:
+    """
+    Content-addressed store for synthesized audio. The file name is a hash of the text
+    and every voice parameter, so identical replies reuse one file. Writes go to a temp
+    file and are renamed into place, so a reader (or another worker) never sees a partial
+    mp3. Hits bump the file mtime; eviction removes files past max_age, then the least
+    recently used ones until the directory is under max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes=500 << 20, max_age=30 * 24 * 3600, evict_every=50):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.evict_every = evict_every
+        os.makedirs(directory, exist_ok=True)
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evicted": 0}
+        self._writes = 0
+
+    @staticmethod
+    def key(text, **voice):
+        raw = json.dumps({"text": text, **voice}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def path_for(self, key, ext="mp3"):
+        return os.path.join(self.directory, f"{key}.{ext}")
+
+    def _key_lock(self, key):
+        with self._locks_lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def get_or_create(self, key, synthesize, ext="mp3"):
+        """Path of the cached audio for `key`, calling synthesize() -> bytes only on a miss."""
+        path = self.path_for(key, ext)
+        if self._touch(path):
+            self._stats["hits"] += 1
+            return path
+        # Only one thread in this process synthesizes a given phrase at a time
+        lock = self._key_lock(key)
+        with lock:
+            if self._touch(path):
+                self._stats["hits"] += 1
+                return path
+            self._stats["misses"] += 1
+            self._write_atomic(path, synthesize())
+        with self._locks_lock:
+            self._locks.pop(key, None)
+        self._writes += 1
+        if self._writes % self.evict_every == 0:
+            threading.Thread(target=self.evict, name="tts-evict", daemon=True).start()
+        return path
+
+    @staticmethod
+    def _touch(path):
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _write_atomic(self, path, data):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except Exception:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+    def evict(self):
+        now = time.time()
+        files = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file() or entry.name.endswith(".tmp"):
+                continue
+            st = entry.stat()
+            files.append((st.st_mtime, st.st_size, entry.path))
+        files.sort()  # oldest first
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for mtime, size, path in files:
+            if now - mtime <= self.max_age and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except OSError:
+                pass
+        self._stats["evicted"] += removed
+        if removed:
+            logger.info("Evicted %d cached audio files, %d bytes left", removed, total)
+        return removed
+
+    def stats(self):
+        stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,405 @@
+"""
+Vector store backends behind the subset of the QdrantClient interface that the app and
+database/ingest/ingest_all.py use (get_collections, create_collection, upsert, delete,
+search, retrieve, scroll, close).
+
+VECTOR_BACKEND=qdrant (default) talks to the Qdrant server at QDRANT_URL.
+VECTOR_BACKEND=local keeps each collection under LOCAL_VECTOR_DIR/<name>/ in-process:
+  vectors.f16    memory-mapped float16 matrix, one row per point
+  payloads.jsonl append-only log of {"row", "id", "payload"} / {"del": id} records
+  meta.json      dim, distance, capacity and a generation bumped by compaction
+Search is a blocked float32 matrix-vector product with argpartition top-k. With
+LOCAL_VECTOR_IVF_LISTS > 0, collections of at least LOCAL_VECTOR_IVF_MIN_ROWS points are
+k-means partitioned and only the LOCAL_VECTOR_IVF_PROBES nearest lists are scanned.
+One process writes (the ingest script); readers pick up its changes by tailing the log.
+"""
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant")  # qdrant | local
+QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+LOCAL_VECTOR_DIR = os.getenv("LOCAL_VECTOR_DIR", str(Path(__file__).resolve().parent / "database" / "vector_store"))
+IVF_LISTS = int(os.getenv("LOCAL_VECTOR_IVF_LISTS", 0))  # 0 = exact search only
+IVF_PROBES = int(os.getenv("LOCAL_VECTOR_IVF_PROBES", 8))
+IVF_MIN_ROWS = int(os.getenv("LOCAL_VECTOR_IVF_MIN_ROWS", 50000))
+SEARCH_BLOCK_ROWS = 32768  # float16 rows widened to float32 at a time
+RELOAD_INTERVAL = 5  # seconds between checks for another process's writes
+
+
+def open_vector_store(backend=None, url=None, path=None):
+    backend = backend or VECTOR_BACKEND
+    if backend == "qdrant":
+        from qdrant_client import QdrantClient
+        return QdrantClient(url=url or QDRANT_URL)
+    if backend == "local":
+        return LocalVectorStore(path or LOCAL_VECTOR_DIR)
+    raise ValueError(f"Unknown VECTOR_BACKEND {backend!r}, expected 'qdrant' or 'local'")
+
+
+def _filter_conditions(query_filter):
+    """{key: value} from a dict or a qdrant Filter(must=[FieldCondition(key, match=MatchValue)])."""
+    if not query_filter:
+        return {}
+    if isinstance(query_filter, dict):
+        return query_filter
+    conditions = {}
+    for cond in query_filter.must or []:
+        conditions[cond.key] = cond.match.value
+    if getattr(query_filter, "should", None) or getattr(query_filter, "must_not", None):
+        raise ValueError("LocalVectorStore only supports `must` equality filters")
+    return conditions
+
+
+def _point_fields(point):
+    if isinstance(point, dict):
+        return str(point["id"]), point["vector"], point.get("payload") or {}
+    return str(point.id), point.vector, point.payload or {}
+
+
+class _Collection:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.meta_path = self.path / "meta.json"
+        self.vectors_path = self.path / "vectors.f16"
+        self.log_path = self.path / "payloads.jsonl"
+        self.lock = threading.RLock()
+        self._checked = 0.0
+        self._load()
+
+    # ---------- persistence ----------
+    @classmethod
+    def create(cls, path, dim, distance):
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        meta = {"dim": dim, "distance": distance, "capacity": 0, "generation": 0}
+        (path / "vectors.f16").write_bytes(b"")
+        (path / "payloads.jsonl").write_bytes(b"")
+        _write_json(path / "meta.json", meta)
+        return cls(path)
+
+    def _load(self):
+        self.meta = json.loads(self.meta_path.read_text())
+        self.dim = self.meta["dim"]
+        self.normalise = self.meta["distance"] == "Cosine"
+        self.ids = []  # row -> point id (None once deleted)
+        self.payloads = []
+        self.rows = {}  # point id -> row
+        self.alive = np.zeros(0, dtype=bool)
+        self.log_offset = 0
+        self.ivf = None
+        self._map()
+        self._tail_log()
+
+    def _map(self):
+        capacity = self.meta["capacity"]
+        self.vectors = (
+            np.memmap(self.vectors_path, dtype=np.float16, mode="r+", shape=(capacity, self.dim))
+            if capacity else np.zeros((0, self.dim), dtype=np.float16)
+        )
+
+    def _tail_log(self):
+        with open(self.log_path, "rb") as f:
+            f.seek(self.log_offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1  # ignore a half-written last line
+        for line in data[:end].splitlines():
+            self._apply(json.loads(line))
+        self.log_offset += end
+
+    def _apply(self, rec):
+        if "del" in rec:
+            row = self.rows.pop(rec["del"], None)
+            if row is not None:
+                self.ids[row] = None
+                self.payloads[row] = None
+                self.alive[row] = False
+            return
+        row = rec["row"]
+        if row >= self.vectors.shape[0]:
+            self.meta = json.loads(self.meta_path.read_text())
+            self._map()
+        while len(self.ids) <= row:
+            self.ids.append(None)
+            self.payloads.append(None)
+        if row >= len(self.alive):  # grow geometrically; rows past len(self.ids) stay False
+            grown = np.zeros(max(row + 1, 2 * len(self.alive), 1024), dtype=bool)
+            grown[:len(self.alive)] = self.alive
+            self.alive = grown
+        old = self.rows.get(rec["id"])
+        if old is not None and old != row:
+            self.ids[old] = None
+            self.payloads[old] = None
+            self.alive[old] = False
+        self.rows[rec["id"]] = row
+        self.ids[row] = rec["id"]
+        self.payloads[row] = rec["payload"]
+        self.alive[row] = True
+        if self.ivf is not None:
+            self.ivf["stale"] = True
+
+    def refresh(self):
+        """Pick up points written by another process since the last check."""
+        now = time.time()
+        if now - self._checked < RELOAD_INTERVAL:
+            return
+        with self.lock:
+            self._checked = now
+            meta = json.loads(self.meta_path.read_text())
+            if meta["generation"] != self.meta["generation"]:
+                self._load()  # compacted: rows were renumbered
+            elif os.path.getsize(self.log_path) > self.log_offset:
+                self._tail_log()
+
+    def _append_log(self, records):
+        if not records:
+            return
+        with open(self.log_path, "ab") as f:
+            f.write(b"".join(json.dumps(r, ensure_ascii=False).encode("utf-8") + b"\n" for r in records))
+            self.log_offset = f.tell()
+
+    def _grow(self, needed):
+        capacity = self.meta["capacity"]
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2, 1024)
+        if isinstance(self.vectors, np.memmap):
+            self.vectors.flush()
+        with open(self.vectors_path, "r+b") as f:
+            f.truncate(new_capacity * self.dim * 2)
+        self.meta["capacity"] = new_capacity
+        _write_json(self.meta_path, self.meta)
+        self._map()
+
+    # ---------- writes ----------
+    def upsert(self, points):
+        with self.lock:
+            fields = [_point_fields(p) for p in points]
+            if not fields:
+                return
+            matrix = np.asarray([v for _, v, _ in fields], dtype=np.float32)
+            if matrix.shape[1] != self.dim:
+                raise ValueError(f"Vector size {matrix.shape[1]} does not match collection size {self.dim}")
+            if self.normalise:
+                norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                matrix /= np.where(norms == 0, 1, norms)
+            next_row = len(self.ids)
+            rows = []
+            for pid, _, _ in fields:
+                row = self.rows.get(pid)
+                if row is None:
+                    row, next_row = next_row, next_row + 1
+                rows.append(row)
+            self._grow(next_row)
+            self.vectors[rows] = matrix.astype(np.float16)
+            self.vectors.flush()  # vectors must be on disk before the log points at them
+            records = [{"row": row, "id": pid, "payload": payload} for row, (pid, _, payload) in zip(rows, fields)]
+            self._append_log(records)
+            for rec in records:
+                self._apply(rec)
+
+    def delete(self, ids):
+        with self.lock:
+            records = [{"del": str(pid)} for pid in ids if str(pid) in self.rows]
+            self._append_log(records)
+            for rec in records:
+                self._apply(rec)
+            if len(self.ids) > 1024 and len(self.rows) < len(self.ids) // 2:
+                self.compact()
+
+    def compact(self):
+        """Rewrite the files without deleted rows; readers reload on the new generation."""
+        with self.lock:
+            live = [row for row, pid in enumerate(self.ids) if pid is not None]
+            tmp_vectors = self.vectors_path.with_suffix(".tmp")
+            capacity = max(len(live), 1024)
+            out = np.memmap(tmp_vectors, dtype=np.float16, mode="w+", shape=(capacity, self.dim))
+            if live:
+                out[:len(live)] = self.vectors[live]
+            out.flush()
+            del out
+            tmp_log = self.log_path.with_suffix(".tmp")
+            with open(tmp_log, "wb") as f:
+                for new_row, row in enumerate(live):
+                    rec = {"row": new_row, "id": self.ids[row], "payload": self.payloads[row]}
+                    f.write(json.dumps(rec, ensure_ascii=False).encode("utf-8") + b"\n")
+            os.replace(tmp_vectors, self.vectors_path)
+            os.replace(tmp_log, self.log_path)
+            self.meta.update(capacity=capacity, generation=self.meta["generation"] + 1)
+            _write_json(self.meta_path, self.meta)
+            self._load()
+
+    # ---------- reads ----------
+    def _ensure_ivf(self, lists):
+        n_live = len(self.rows)
+        if not lists or n_live < max(IVF_MIN_ROWS, lists * 4):
+            return None
+        ivf = self.ivf
+        if ivf is None or ivf["lists"] != lists or n_live > 2 * ivf["trained_on"]:
+            ivf = self.ivf = {"lists": lists, "trained_on": n_live, "centroids": self._kmeans(lists), "stale": True}
+        if ivf["stale"]:
+            n = len(self.ids)
+            assign = np.empty(n, dtype=np.int32)
+            for start in range(0, n, SEARCH_BLOCK_ROWS):
+                block = self.vectors[start:min(start + SEARCH_BLOCK_ROWS, n)].astype(np.float32)
+                assign[start:start + len(block)] = np.argmax(block @ ivf["centroids"].T, axis=1)
+            live = np.flatnonzero(self.alive[:n])
+            order = live[np.argsort(assign[live], kind="stable")]
+            bounds = np.searchsorted(assign[order], np.arange(lists + 1))
+            ivf["members"] = [order[bounds[i]:bounds[i + 1]] for i in range(lists)]
+            ivf["stale"] = False
+        return ivf
+
+    def _kmeans(self, lists, iterations=10, sample=100000):
+        """Spherical k-means on a sample of live rows."""
+        rng = np.random.default_rng(0)
+        live = np.flatnonzero(self.alive[:len(self.ids)])
+        pick = np.sort(rng.choice(live, size=min(sample, len(live)), replace=False))
+        data = self.vectors[pick].astype(np.float32)
+        data /= np.maximum(np.linalg.norm(data, axis=1, keepdims=True), 1e-12)
+        centroids = data[rng.choice(len(data), size=lists, replace=False)]
+        for _ in range(iterations):
+            assign = np.argmax(data @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, data)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            centroids = np.where(empty[:, None], centroids, sums / np.where(norms == 0, 1, norms))
+        return centroids
+
+    def _candidate_mask(self, rows, conditions):
+        if not conditions:
+            return self.alive[rows]
+        payloads = self.payloads
+        return np.fromiter(
+            (payloads[r] is not None and all(payloads[r].get(k) == v for k, v in conditions.items()) for r in rows),
+            dtype=bool, count=len(rows),
+        )
+
+    def search(self, query_vector, limit, conditions, ivf_lists=IVF_LISTS, probes=IVF_PROBES):
+        q = np.array(query_vector, dtype=np.float32).ravel()
+        if self.normalise:
+            q /= max(float(np.linalg.norm(q)), 1e-12)
+        with self.lock:
+            n = len(self.ids)
+            ivf = self._ensure_ivf(ivf_lists)
+            if ivf is not None:
+                nearest = np.argsort(-(ivf["centroids"] @ q))[:probes]
+                blocks = [np.sort(np.concatenate([ivf["members"][i] for i in nearest]))]
+            else:
+                blocks = [np.arange(s, min(s + SEARCH_BLOCK_ROWS, n)) for s in range(0, n, SEARCH_BLOCK_ROWS)]
+            best_rows, best_scores = [], []
+            for rows in blocks:
+                if not len(rows):
+                    continue
+                rows = rows[self._candidate_mask(rows, conditions)]
+                if not len(rows):
+                    continue
+                contiguous = rows[-1] - rows[0] + 1 == len(rows)
+                block = self.vectors[rows[0]:rows[-1] + 1] if contiguous else self.vectors[rows]
+                scores = block.astype(np.float32) @ q
+                if len(scores) > limit:
+                    top = np.argpartition(-scores, limit - 1)[:limit]
+                    rows, scores = rows[top], scores[top]
+                best_rows.append(rows)
+                best_scores.append(scores)
+            if not best_rows:
+                return []
+            rows = np.concatenate(best_rows)
+            scores = np.concatenate(best_scores)
+            order = np.argsort(-scores)[:limit]
+            return [(int(rows[i]), float(scores[i])) for i in order]
+
+    def point(self, row, score=None, with_payload=True, with_vectors=False):
+        vector = self.vectors[row].astype(np.float32).tolist() if with_vectors else None
+        return SimpleNamespace(
+            id=self.ids[row], score=score, version=0,
+            payload=self.payloads[row] if with_payload else None, vector=vector,
+        )
+
+
+def _write_json(path, data):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+class LocalVectorStore:
+    """In-process stand-in for QdrantClient; see the module docstring for the on-disk layout."""
+
+    def __init__(self, path=LOCAL_VECTOR_DIR, ivf_lists=IVF_LISTS, ivf_probes=IVF_PROBES):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.ivf_lists = ivf_lists
+        self.ivf_probes = ivf_probes
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def _collection(self, name):
+        with self._lock:
+            coll = self._collections.get(name)
+            if coll is None:
+                if not (self.path / name / "meta.json").exists():
+                    raise ValueError(f"Collection {name!r} does not exist in {self.path}")
+                coll = self._collections[name] = _Collection(self.path / name)
+        coll.refresh()
+        return coll
+
+    def get_collections(self):
+        names = sorted(p.name for p in self.path.iterdir() if (p / "meta.json").exists())
+        return SimpleNamespace(collections=[SimpleNamespace(name=n) for n in names])
+
+    def create_collection(self, collection_name, vectors_config, **_):
+        distance = getattr(vectors_config.distance, "value", vectors_config.distance)
+        if distance not in ("Cosine", "Dot"):
+            raise ValueError(f"LocalVectorStore supports Cosine and Dot distance, not {distance}")
+        with self._lock:
+            self._collections[collection_name] = _Collection.create(
+                self.path / collection_name, vectors_config.size, distance
+            )
+        return True
+
+    def upsert(self, collection_name, points, **_):
+        self._collection(collection_name).upsert(points)
+
+    def delete(self, collection_name, points_selector, **_):
+        ids = getattr(points_selector, "points", points_selector)
+        self._collection(collection_name).delete(ids)
+
+    def search(self, collection_name, query_vector, limit=10, query_filter=None, with_payload=True,
+               with_vectors=False, **_):
+        coll = self._collection(collection_name)
+        hits = coll.search(query_vector, limit, _filter_conditions(query_filter), self.ivf_lists, self.ivf_probes)
+        return [coll.point(row, score, with_payload, with_vectors) for row, score in hits]
+
+    def retrieve(self, collection_name, ids, with_payload=True, with_vectors=False, **_):
+        coll = self._collection(collection_name)
+        rows = [coll.rows.get(str(pid)) for pid in ids]
+        return [coll.point(row, None, with_payload, with_vectors) for row in rows if row is not None]
+
+    def scroll(self, collection_name, limit=10, offset=None, with_payload=True, with_vectors=False, **_):
+        """Pages in row order; the offset is the row to resume from, None when done."""
+        coll = self._collection(collection_name)
+        points = []
+        row = offset or 0
+        while row < len(coll.ids) and len(points) < limit:
+            if coll.ids[row] is not None:
+                points.append(coll.point(row, None, with_payload, with_vectors))
+            row += 1
+        return points, (row if row < len(coll.ids) else None)
+
+    def count(self, collection_name, **_):
+        return SimpleNamespace(count=len(self._collection(collection_name).rows))
+
+    def close(self):
+        with self._lock:
+            for coll in self._collections.values():
+                if isinstance(coll.vectors, np.memmap):
+                    coll.vectors.flush()
+            self._collections.clear()
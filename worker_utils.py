@@ -0,0 +1,80 @@
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()  # sentinel that tells a worker thread to exit
+
+
+class WorkerPool:
+    """
+    Bounded queue drained by a fixed number of daemon threads.
+    submit() never blocks longer than `put_timeout`, so callers (the webhook)
+    can turn a full queue into backpressure instead of hanging.
+    """
+
+    def __init__(self, handler, workers=4, max_queue=100, name="worker"):
+        self.handler = handler
+        self.workers = max(1, int(workers))
+        self.name = name
+        self._queue = queue.Queue(maxsize=max(1, int(max_queue)))
+        self._threads = []
+        self._lock = threading.Lock()
+        self._accepting = False
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            self._accepting = True
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+        logger.info("Started %d %s threads (queue size %d)", self.workers, self.name, self._queue.maxsize)
+
+    def submit(self, item, put_timeout=0.05) -> bool:
+        """Enqueue an item. Returns False when the pool is stopped or the queue stays full."""
+        if not self._accepting:
+            return False
+        try:
+            self._queue.put(item, timeout=put_timeout)
+            return True
+        except queue.Full:
+            logger.warning("%s queue full (%d items), rejecting work", self.name, self._queue.qsize())
+            return False
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                self.handler(item)
+            except Exception as e:
+                logger.exception("%s handler error: %s", self.name, e)
+            finally:
+                self._queue.task_done()
+
+    def shutdown(self, timeout=30):
+        """Stop accepting work, let queued items finish, then stop the threads."""
+        with self._lock:
+            if not self._accepting:
+                return
+            self._accepting = False
+            threads, self._threads = self._threads, []
+        logger.info("Draining %s queue (%d pending)", self.name, self._queue.qsize())
+        for _ in threads:
+            # Sentinels queue up behind real work, so everything already accepted is processed first
+            self._queue.put(_STOP)
+        deadline = time.monotonic() + timeout
+        for t in threads:
+            t.join(max(0, deadline - time.monotonic()))
+        alive = [t.name for t in threads if t.is_alive()]
+        if alive:
+            logger.warning("%s threads still busy after %ss: %s", self.name, timeout, alive)